@@ -0,0 +1 @@
+# Este archivo indica que "benchmarks" es un paquete Python (benchmarks de rendimiento).
@@ -0,0 +1,180 @@
+"""
+Generador determinista de mensajes HL7 sintéticos (ADT, ORU, SIU) para benchmarks.
+
+La misma semilla produce siempre el mismo corpus, de modo que dos ejecuciones
+de los benchmarks son comparables.
+
+Uso:
+    python -m benchmarks.corpus salida/ --count 1000 --kind ORU --obx 200
+"""
+import os
+import random
+import string
+import argparse
+
+MESSAGE_KINDS = ('ADT', 'ORU', 'SIU')
+
+_ALPHABET = string.ascii_uppercase + string.digits
+
+
+class CorpusSpec:
+    """
+    Parámetros de tamaño de los mensajes generados.
+
+    - obx_count: número de OBX por mensaje ORU (fan-out de resultados).
+    - nte_every: un NTE después de cada N OBX (0 para ninguno).
+    - field_width: (mín, máx) de caracteres por campo de texto.
+    - extra_segments: segmentos Z adicionales por mensaje.
+    """
+    def __init__(self, obx_count=20, nte_every=5, field_width=(4, 16), extra_segments=0):
+        self.obx_count = obx_count
+        self.nte_every = nte_every
+        self.field_width = field_width
+        self.extra_segments = extra_segments
+
+
+def _text(rng, spec):
+    lo, hi = spec.field_width
+    return ''.join(rng.choice(_ALPHABET) for _ in range(rng.randint(lo, hi)))
+
+
+def _msh(rng, msg_type, control_id):
+    return ['MSH', '^~\\&', 'SENDAPP', f"FAC{rng.randint(1, 20):02d}", 'RECVAPP', 'RECVFAC',
+            f"2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}00",
+            '', msg_type, control_id, 'P', '2.5']
+
+
+def _pid(rng, spec):
+    return ['PID', '1', '', f"{rng.randint(100000, 999999)}^^^MRN~{rng.randint(1000, 9999)}^^^SSN", '',
+            f"{_text(rng, spec)}^{_text(rng, spec)}^{rng.choice(string.ascii_uppercase)}",
+            '', f"19{rng.randint(30, 99)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}",
+            rng.choice('MFU'), '', '', f"{rng.randint(1, 9999)} {_text(rng, spec)} ST^^CITY^ST^{rng.randint(10000, 99999)}"]
+
+
+def _pv1(rng, spec):
+    return ['PV1', '1', rng.choice('IOE'), f"{_text(rng, spec)}^{rng.randint(100, 999)}^{rng.randint(1, 4)}",
+            '', '', '', f"{rng.randint(1000, 9999)}^{_text(rng, spec)}^{_text(rng, spec)}"]
+
+
+def _extra(rng, spec, lines):
+    for i in range(spec.extra_segments):
+        lines.append(['ZEX', str(i + 1), _text(rng, spec), _text(rng, spec)])
+
+
+def generate_adt(rng, spec, control_id):
+    lines = [
+        _msh(rng, 'ADT^A01', control_id),
+        ['EVN', 'A01', '20240101120000'],
+        _pid(rng, spec),
+        ['NK1', '1', f"{_text(rng, spec)}^{_text(rng, spec)}", 'SPO'],
+        _pv1(rng, spec),
+        ['AL1', '1', 'DA', f"{rng.randint(100, 999)}^{_text(rng, spec)}"],
+        ['IN1', '1', f"PLAN{rng.randint(1, 99)}", str(rng.randint(1000, 9999)), _text(rng, spec)],
+    ]
+    _extra(rng, spec, lines)
+    return lines
+
+
+def generate_oru(rng, spec, control_id):
+    lines = [
+        _msh(rng, 'ORU^R01', control_id),
+        _pid(rng, spec),
+        _pv1(rng, spec),
+        ['ORC', 'RE', str(rng.randint(10000, 99999))],
+        ['OBR', '1', str(rng.randint(10000, 99999)), '', f"{rng.randint(1000, 9999)}^{_text(rng, spec)}^L"],
+    ]
+    for i in range(spec.obx_count):
+        lines.append(['OBX', str(i + 1), rng.choice(('NM', 'ST', 'TX')),
+                      f"{rng.randint(1000, 9999)}-{rng.randint(0, 9)}^{_text(rng, spec)}^LN", '',
+                      _text(rng, spec), rng.choice(('mg/dL', 'mmol/L', '%')), '1-10', rng.choice(('N', 'H', 'L')),
+                      '', '', 'F'])
+        if spec.nte_every and (i + 1) % spec.nte_every == 0:
+            lines.append(['NTE', str(i + 1), 'L', _text(rng, spec)])
+    _extra(rng, spec, lines)
+    return lines
+
+
+def generate_siu(rng, spec, control_id):
+    lines = [
+        _msh(rng, 'SIU^S12', control_id),
+        ['SCH', str(rng.randint(10000, 99999)), '', '', '', '', _text(rng, spec), '', '', '30', 'MIN'],
+        _pid(rng, spec),
+        _pv1(rng, spec),
+        ['RGS', '1', 'A'],
+        ['AIS', '1', 'A', f"{rng.randint(100, 999)}^{_text(rng, spec)}"],
+        ['AIG', '1', 'A', f"{rng.randint(100, 999)}^{_text(rng, spec)}"],
+        ['AIL', '1', 'A', f"{_text(rng, spec)}^{rng.randint(100, 999)}", '', '', '20240101120000'],
+        ['AIP', '1', 'A', f"{rng.randint(1000, 9999)}^{_text(rng, spec)}^{_text(rng, spec)}"],
+    ]
+    _extra(rng, spec, lines)
+    return lines
+
+
+_GENERATORS = {'ADT': generate_adt, 'ORU': generate_oru, 'SIU': generate_siu}
+
+
+def generate_messages(count, kinds=MESSAGE_KINDS, spec=None, seed=0):
+    """
+    Genera count mensajes (listas de segmentos) alternando los tipos indicados.
+    Determinista para una misma semilla.
+    """
+    spec = spec or CorpusSpec()
+    rng = random.Random(seed)
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        yield _GENERATORS[kind](rng, spec, f"CTRL{seed:04d}{i:08d}")
+
+
+def message_text(segments, terminator='\n'):
+    """Serializa un mensaje generado."""
+    return ''.join('|'.join(seg) + terminator for seg in segments)
+
+
+def write_corpus(directory, count, kinds=MESSAGE_KINDS, spec=None, seed=0):
+    """Escribe un archivo .hl7 por mensaje en directory. Devuelve la lista de rutas."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, segments in enumerate(generate_messages(count, kinds, spec, seed)):
+        path = os.path.join(directory, f"msg_{i:08d}.hl7")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(message_text(segments))
+        paths.append(path)
+    return paths
+
+
+def write_batch_file(path, count, kinds=MESSAGE_KINDS, spec=None, seed=0):
+    """Escribe un único archivo de lote (FHS/BHS ... BTS/FTS) con count mensajes."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('FHS|^~\\&|SENDAPP|FAC01\nBHS|^~\\&|SENDAPP|FAC01\n')
+        for segments in generate_messages(count, kinds, spec, seed):
+            f.write(message_text(segments))
+        f.write(f"BTS|{count}\nFTS|1\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un corpus HL7 sintético y determinista")
+    parser.add_argument("directory", help="Carpeta de salida")
+    parser.add_argument("--count", type=int, default=1000, help="Número de mensajes")
+    parser.add_argument("--kind", action="append", choices=MESSAGE_KINDS, help="Tipos de mensaje (repetible)")
+    parser.add_argument("--obx", type=int, default=20, help="OBX por mensaje ORU")
+    parser.add_argument("--min-width", type=int, default=4, help="Ancho mínimo de los campos de texto")
+    parser.add_argument("--max-width", type=int, default=16, help="Ancho máximo de los campos de texto")
+    parser.add_argument("--extra", type=int, default=0, help="Segmentos Z adicionales por mensaje")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla")
+    parser.add_argument("--batch", action="store_true", help="Un único archivo de lote en lugar de un archivo por mensaje")
+    args = parser.parse_args()
+
+    spec = CorpusSpec(obx_count=args.obx, field_width=(args.min_width, args.max_width), extra_segments=args.extra)
+    kinds = tuple(args.kind or MESSAGE_KINDS)
+    if args.batch:
+        os.makedirs(args.directory, exist_ok=True)
+        path = write_batch_file(os.path.join(args.directory, "batch.hl7"), args.count, kinds, spec, args.seed)
+        print(f"Lote generado: {path}")
+    else:
+        paths = write_corpus(args.directory, args.count, kinds, spec, args.seed)
+        print(f"{len(paths)} mensajes generados en {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmarks de lectura, reglas, configuraciones completas y escritura.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.run --output resultados.json
+    python -m benchmarks.run --compare base.json --threshold 0.15   # falla si hay regresión
+"""
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+
+from benchmarks.corpus import CorpusSpec, generate_messages, message_text, write_batch_file
+from core import hl7_parser
+from core.hl7_message import HL7Message
+from core.hl7_stream import iter_hl7_messages, transform_file
+from core.rule_compiler import compile_configuration
+
+# Una regla representativa por tipo de acción de _apply_single_rule
+RULES_BY_ACTION = {
+    'delete_segment': {'action': 'delete_segment', 'segment': 'NTE'},
+    'add_segment':    {'action': 'add_segment', 'new_segment': 'ZBM', 'position': 2, 'values': ['1', 'BENCH']},
+    'modify_field':   {'action': 'modify_field', 'segment': 'PID', 'field_index': 3, 'new_value': 'X'},
+    'reorder_fields': {'action': 'reorder_fields', 'segment': 'PV1', 'new_order': [0, 2, 1, 3, 5, 4, 6]},
+    'copy_value':     {'action': 'copy_value', 'source_segment': 'MSH', 'source_field': 9,
+                       'dest_segment': 'PID', 'dest_field': 2},
+    'agregar_campos': {'action': 'agregar_campos', 'segment': 'PV1', 'start_index': 2, 'values': ['A', 'B']},
+    'conditional':    {'condition': {'segment': 'PV1', 'field_index': 2, 'value': 'I'},
+                       'actions': [{'action': 'modify_field', 'segment': 'PV1', 'field_index': 3, 'new_value': 'W'}]},
+}
+
+
+def measure(func, setup=None, repeat=5, number=1):
+    """
+    Ejecuta func `number` veces por repetición y devuelve los segundos por
+    ejecución (mínimo y mediana). setup() prepara el argumento de cada llamada
+    fuera del tiempo medido.
+    """
+    samples = []
+    for _ in range(repeat):
+        args = [setup() for _ in range(number)] if setup else [None] * number
+        t0 = time.perf_counter()
+        for arg in args:
+            func(arg)
+        samples.append((time.perf_counter() - t0) / number)
+    return {'min': min(samples), 'median': statistics.median(samples)}
+
+
+class BenchmarkContext:
+    """Corpus y archivos temporales compartidos por los benchmarks."""
+    def __init__(self, workdir, messages, obx):
+        self.workdir = workdir
+        spec = CorpusSpec(obx_count=obx)
+        self.messages = list(generate_messages(messages, spec=spec, seed=42))
+        self.single_path = os.path.join(workdir, 'single.hl7')
+        big = max(self.messages, key=len)
+        with open(self.single_path, 'w', encoding='utf-8') as f:
+            f.write(message_text(big))
+        self.big_segments = big
+        self.batch_path = write_batch_file(os.path.join(workdir, 'batch.hl7'), messages, spec=spec, seed=42)
+        self.output_path = os.path.join(workdir, 'out.hl7')
+
+
+def run_benchmarks(ctx, repeat, only=None):
+    results = {}
+
+    def bench(name, func, setup=None, number=1, items=1):
+        if only and not any(part in name for part in only):
+            return
+        r = measure(func, setup, repeat=repeat, number=number)
+        r['items_per_sec'] = items / r['min'] if r['min'] else 0.0
+        results[name] = r
+        print(f"  {name:<40} min {r['min'] * 1e3:9.3f} ms   mediana {r['median'] * 1e3:9.3f} ms")
+
+    n_msgs = len(ctx.messages)
+
+    # Lectura
+    bench('parse.file_eager', lambda _: hl7_parser.parse_hl7_file(ctx.single_path), number=20)
+    bench('parse.message_lazy', lambda _: hl7_parser.parse_hl7_message(ctx.single_path), number=20)
+    bench('parse.batch_stream', lambda _: sum(1 for _ in iter_hl7_messages(ctx.batch_path)), items=n_msgs)
+
+    # Reglas individuales: intérprete (_apply_single_rule) y plan compilado
+    for action, rule in RULES_BY_ACTION.items():
+        if 'condition' not in rule:
+            bench(f'rule.interpreted.{action}',
+                  lambda segs, rule=rule: hl7_parser._apply_single_rule(segs, rule),
+                  setup=lambda: copy.deepcopy(ctx.big_segments), number=50)
+        plan = compile_configuration([rule])
+        bench(f'rule.compiled.{action}', plan.apply,
+              setup=lambda: HL7Message.from_lines(['|'.join(s) for s in ctx.big_segments]), number=50)
+
+    # Configuraciones completas de configurations.json
+    configs = {}
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configurations.json')
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    for name, rules in configs.items():
+        if not isinstance(rules, list):
+            continue
+        bench(f'config.interpreted.{name}',
+              lambda msgs, rules=rules: [hl7_parser.apply_transformations(m, rules) for m in msgs],
+              setup=lambda: copy.deepcopy(ctx.messages), items=n_msgs)
+        plan = compile_configuration(rules)
+        bench(f'config.compiled.{name}',
+              lambda msgs, plan=plan: [plan.apply(m) for m in msgs],
+              setup=lambda: [HL7Message.from_lines(['|'.join(s) for s in m]) for m in ctx.messages], items=n_msgs)
+        bench(f'pipeline.batch.{name}',
+              lambda _, plan=plan: transform_file(ctx.batch_path, ctx.output_path, plan), items=n_msgs)
+
+    # Escritura
+    bench('write.segments', lambda _: hl7_parser.write_hl7_file(ctx.big_segments, ctx.output_path), number=20)
+    bench('write.message_passthrough',
+          lambda msg: hl7_parser.write_hl7_file(msg, ctx.output_path),
+          setup=lambda: HL7Message.from_lines(['|'.join(s) for s in ctx.big_segments]), number=20)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Devuelve la lista de benchmarks cuyo tiempo mínimo empeoró más que threshold."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('min'):
+            continue
+        ratio = current['min'] / base['min']
+        marker = ''
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+            marker = '  <-- REGRESIÓN'
+        print(f"  {name:<40} {ratio:6.2f}x{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de rendimiento de HL7 Interface Manager")
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regresión tolerada (0.10 = 10 %%)")
+    parser.add_argument("--messages", type=int, default=500, help="Mensajes en el corpus")
+    parser.add_argument("--obx", type=int, default=50, help="OBX por mensaje ORU")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por benchmark")
+    parser.add_argument("--only", action="append", help="Ejecutar sólo benchmarks cuyo nombre contenga este texto")
+    args = parser.parse_args()
+
+    # Los logs por regla no forman parte de lo que se mide aquí
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        ctx = BenchmarkContext(workdir, args.messages, args.obx)
+        print(f"Corpus: {args.messages} mensajes, {args.obx} OBX por ORU")
+        results = run_benchmarks(ctx, args.repeat, args.only)
+
+    data = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'messages': args.messages,
+            'obx': args.obx,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        print(f"Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+        print(f"Comparación con {args.compare} (tolerancia {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks con regresión.")
+            sys.exit(1)
+        print("Sin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark de arranque de la CLI.
+
+Mide, en procesos nuevos, el tiempo de `import main` y de un `process-file`
+completo sobre un mensaje pequeño (el caso de las llamadas desde cron y desde
+otros motores), y comprueba que la CLI no carga módulos pesados que sólo
+necesitan otros subcomandos.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.startup --repeat 10 --max-ms 250
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+from benchmarks.corpus import generate_messages, message_text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que no deben cargarse al importar main (GUI, watchdog, servidor MLLP)
+FORBIDDEN_MODULES = ('PyQt5', 'gui.main_window', 'watchdog', 'asyncio', 'core.mllp')
+
+
+def time_command(args, repeat):
+    """Ejecuta args repeat veces en un proceso nuevo y devuelve los segundos (mínimo y mediana)."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - t0)
+    return {'min': min(samples), 'median': statistics.median(samples)}
+
+
+def loaded_forbidden_modules():
+    code = ("import sys, json, main; "
+            f"print(json.dumps([m for m in {FORBIDDEN_MODULES!r} if m in sys.modules]))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de la CLI")
+    parser.add_argument("--repeat", type=int, default=10, help="Ejecuciones por medida")
+    parser.add_argument("--max-ms", type=float, help="Fallar si process-file supera este tiempo mínimo (ms)")
+    parser.add_argument("--output", help="Guardar resultados en este JSON")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        input_path = os.path.join(workdir, 'entrada.hl7')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            f.write(message_text(next(generate_messages(1))))
+        out_dir = os.path.join(workdir, 'salida')
+        os.makedirs(out_dir)
+
+        commands = {
+            'python': [sys.executable, '-c', 'pass'],
+            'import_main': [sys.executable, '-c', 'import main'],
+            'process_file': [sys.executable, 'main.py', '--log-dir', os.path.join(workdir, 'logs'),
+                             'process-file', input_path, '--output-dir', out_dir],
+        }
+        for name, command in commands.items():
+            results[name] = time_command(command, args.repeat)
+            r = results[name]
+            print(f"  {name:<15} min {r['min'] * 1e3:8.1f} ms   mediana {r['median'] * 1e3:8.1f} ms")
+
+    failed = False
+    forbidden = loaded_forbidden_modules()
+    if forbidden:
+        print(f"`import main` carga módulos que la CLI no necesita: {', '.join(forbidden)}")
+        failed = True
+    if args.max_ms and results['process_file']['min'] * 1e3 > args.max_ms:
+        print(f"process-file supera {args.max_ms:.0f} ms")
+        failed = True
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'results': results, 'forbidden_modules': forbidden}, f, indent=4)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,15 @@ import logging
 
 CONFIG_FILE = "configurations.json"
 
+# Claves de configurations.json que no son configuraciones de reglas
+ROUTES_KEY = "__routes__"
+RESERVED_KEYS = (ROUTES_KEY,)
+
+
+def config_names(configs):
+    """Nombres de las configuraciones de reglas (sin las claves reservadas)."""
+    return [name for name in configs if name not in RESERVED_KEYS]
+
 def load_configurations():
     """
     Carga las configuraciones desde el archivo JSON.
@@ -21,8 +30,11 @@ def save_configurations(configs):
     Args:
         configs (dict): Diccionario de configuraciones a guardar.
     """
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+    # Escritura atómica: un monitor que recarga el archivo nunca lo lee a medias
+    tmp = CONFIG_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
         json.dump(configs, f, indent=4)
+    os.replace(tmp, CONFIG_FILE)
     logging.info("Configuraciones guardadas.")
 
 def export_configurations(export_path, configs):
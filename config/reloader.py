@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from config.manager import CONFIG_FILE, config_names
+from core.rule_compiler import compile_configuration
+from core.routing import RoutingTable
+
+
+class ConfigSnapshot:
+    """
+    Versión inmutable de las configuraciones cargadas. Cada archivo o mensaje
+    toma una sola instantánea al empezar, así que nunca ve reglas a medio cambiar.
+    """
+    __slots__ = ('configs', 'version', 'digest')
+
+    def __init__(self, configs, version=0, digest=None):
+        self.configs = configs
+        self.version = version
+        self.digest = digest
+
+
+def validate_configurations(configs, required=()):
+    """
+    Comprueba que todas las configuraciones compilan, que la tabla de enrutado
+    es válida y que existen las requeridas (por ejemplo la que usa el monitor).
+
+    Raises:
+        ValueError: con el motivo del rechazo (RuleValidationError es subclase).
+    """
+    if not isinstance(configs, dict):
+        raise ValueError("El archivo de configuraciones debe contener un objeto JSON.")
+    for name in required:
+        if name not in configs:
+            raise ValueError(f"Falta la configuración '{name}'.")
+    for name in config_names(configs):
+        try:
+            compile_configuration(configs[name], name)
+        except ValueError as e:
+            raise ValueError(f"Configuración '{name}': {e}") from e
+    RoutingTable.from_configurations(configs)
+
+
+class ConfigReloader:
+    """
+    Vigila el archivo de configuraciones y lo recarga en segundo plano.
+
+    - Cada interval segundos compara mtime y tamaño; si cambian, compara el hash
+      del contenido para ignorar escrituras que no modifican nada.
+    - El contenido nuevo se valida compilando todas las reglas antes de
+      publicarse; la instantánea activa se sustituye de una sola vez.
+    - Si la edición es inválida (JSON roto, regla incorrecta, falta una
+      configuración requerida) se registra el error y sigue la última válida.
+    """
+    def __init__(self, path=CONFIG_FILE, interval=2.0, initial=None, required=(), on_reload=None):
+        self.path = path
+        self.interval = interval
+        self.required = tuple(required)
+        self.on_reload = on_reload
+        self.rejected = 0
+        self._snapshot = ConfigSnapshot(initial if initial is not None else {})
+        self._stat_key = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """Instantánea activa (lectura sin bloqueo: la sustitución es una asignación)."""
+        return self._snapshot
+
+    def check(self):
+        """
+        Recarga el archivo si cambió. Devuelve True si se publicó una versión nueva.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._stat_key:
+            return False
+        self._stat_key = stat_key
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == self._snapshot.digest:
+            return False
+        try:
+            configs = json.loads(data.decode('utf-8'))
+            validate_configurations(configs, self.required)
+        except ValueError as e:
+            self.rejected += 1
+            logging.error(f"[CONFIG] Cambios en {self.path} rechazados, se mantiene la versión "
+                          f"{self._snapshot.version}: {e}")
+            return False
+
+        snapshot = ConfigSnapshot(configs, self._snapshot.version + 1, digest)
+        self._snapshot = snapshot
+        logging.info(f"[CONFIG] {self.path} cargado (versión {snapshot.version}, {len(config_names(configs))} configuraciones)")
+        if self.on_reload:
+            self.on_reload(snapshot)
+        return True
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.check()
+            except OSError as e:
+                logging.error(f"[CONFIG] No se pudo leer {self.path}: {e}")
+
+    def start(self):
+        """Carga el archivo inmediatamente y arranca el hilo de vigilancia."""
+        self.check()
+        if self.interval and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="config-reloader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,391 @@
+import io
+import os
+import re
+import time
+import queue
+import shutil
+import logging
+import tarfile
+import threading
+
+# Los originales se agregan a archivos tar comprimidos que rotan cada
+# rotate_seconds (una hora por defecto) o al alcanzar max_mb, en lugar de dejar
+# un archivo por mensaje en la carpeta de backups:
+#
+#   backups/
+#     index.sqlite                      nombre / control ID -> archivo y posición
+#     .pending/                         originales aún no archivados
+#     archive/20240101/backup_2024010113_<pid>_001.tar.gz
+#
+# El hilo de procesamiento sólo mueve el original a .pending (un renombrado) y
+# lo encola; un hilo en segundo plano lo comprime, lo indexa y lo elimina.
+CODECS = ('gz', 'zst')
+BACKUP_MODES = ('archive', 'files')
+
+PENDING_DIR = '.pending'
+ARCHIVE_DIR = 'archive'
+INDEX_FILE = 'index.sqlite'
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, name TEXT NOT NULL, archive TEXT NOT NULL, "
+    "offset INTEGER NOT NULL, size INTEGER NOT NULL, archived REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS control_ids (control_id TEXT NOT NULL, entry INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entries_name ON entries (name)",
+    "CREATE INDEX IF NOT EXISTS entries_archive ON entries (archive)",
+    "CREATE INDEX IF NOT EXISTS control_ids_id ON control_ids (control_id)",
+)
+
+_MSH_LINE = re.compile(rb'(?:^|[\r\n])MSH\|([^\r\n]*)')
+_STOP = object()
+
+
+def control_ids(data):
+    """MSH-10 de cada mensaje de un archivo HL7 (bytes)."""
+    ids = []
+    for m in _MSH_LINE.finditer(data):
+        fields = m.group(1).split(b'|')
+        # fields[0] es MSH-2: MSH-10 está en la posición 8
+        if len(fields) > 8 and fields[8]:
+            ids.append(fields[8].decode('utf-8', 'replace'))
+    return ids
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("La compresión zst requiere zstandard (pip install zstandard)") from e
+    return zstandard
+
+
+def _open_index(backup_dir):
+    import sqlite3   # sólo al archivar: no retrasa el arranque de la CLI
+    db = sqlite3.connect(os.path.join(backup_dir, INDEX_FILE), timeout=30, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    for statement in _SCHEMA:
+        db.execute(statement)
+    db.commit()
+    return db
+
+
+class BackupSettings:
+    """
+    Parámetros del archivado de originales. Es un objeto simple para que pueda
+    enviarse a los workers en modo proceso; cada proceso crea su BackupArchiver
+    (ver get_archiver) y escribe sus propios archivos tar sobre el mismo índice.
+    """
+    __slots__ = ('backup_dir', 'codec', 'rotate_seconds', 'max_mb', 'retention_days')
+
+    def __init__(self, backup_dir, codec='gz', rotate_seconds=3600, max_mb=256, retention_days=0):
+        if codec not in CODECS:
+            raise ValueError(f"Compresión no soportada: {codec}")
+        if codec == 'zst':
+            _zstandard()
+        self.backup_dir = backup_dir
+        self.codec = codec
+        self.rotate_seconds = rotate_seconds
+        self.max_mb = max_mb
+        self.retention_days = retention_days
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def cache_key(self):
+        return self.__getstate__()
+
+
+class _Archive:
+    """Archivo tar comprimido abierto para agregar miembros."""
+    def __init__(self, path, codec):
+        self.path = path
+        self.opened = time.time()
+        self._raw = open(path, 'xb')
+        if codec == 'zst':
+            zstandard = _zstandard()
+            self._flush_mode = zstandard.FLUSH_BLOCK
+            self._stream = zstandard.ZstdCompressor(level=10).stream_writer(self._raw, closefd=False)
+        else:
+            import gzip
+            self._flush_mode = None
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=6)
+        self._tar = tarfile.open(fileobj=self._stream, mode='w', format=tarfile.PAX_FORMAT)
+
+    @property
+    def size(self):
+        return self._raw.tell()
+
+    def add(self, name, data, mtime):
+        """Agrega un miembro y devuelve su posición (sin comprimir) en el tar."""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = mtime
+        offset = self._tar.offset
+        self._tar.addfile(info, io.BytesIO(data))
+        return offset
+
+    def flush(self):
+        """Vuelca el bloque comprimido en curso: lo escrito hasta aquí se puede leer aunque el proceso falle."""
+        if self._flush_mode is None:
+            self._stream.flush()
+        else:
+            self._stream.flush(self._flush_mode)
+        self._raw.flush()
+
+    def close(self):
+        self._tar.close()
+        self._stream.close()
+        self._raw.close()
+
+
+class BackupArchiver:
+    """
+    Archiva originales en tar comprimidos desde un hilo en segundo plano.
+
+    archive(path) mueve el original a <backup_dir>/.pending y lo encola; el hilo
+    lo agrega al archivo tar en curso, registra nombre y control IDs en el
+    índice y lo elimina de .pending cuando el archivo y el índice están
+    volcados. Si el proceso se detiene antes, recover() vuelve a encolar lo
+    pendiente. Los tar con más de retention_days días se eliminan (0 = nunca).
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        self.backup_dir = settings.backup_dir
+        self.pending_dir = os.path.join(self.backup_dir, PENDING_DIR)
+        self.archived = 0
+        self.errors = 0
+        os.makedirs(self.pending_dir, exist_ok=True)
+        self._queue = queue.Queue()
+        self._archive = None
+        self._seq = 0
+        self._last_prune = 0.0
+        self._db = _open_index(self.backup_dir)
+        self._thread = threading.Thread(target=self._run, name="backup-archiver", daemon=True)
+        self._thread.start()
+
+    # Lado del procesamiento
+
+    def archive(self, path):
+        """Retira el original de la carpeta de entrada y lo encola para archivarlo."""
+        staged = os.path.join(self.pending_dir, f"{time.time_ns():020d}_{os.path.basename(path)}")
+        try:
+            os.replace(path, staged)
+        except OSError:
+            # Carpeta de backups en otro sistema de archivos
+            shutil.move(path, staged)
+        self._queue.put(staged)
+        return staged
+
+    def recover(self):
+        """Encola los originales que quedaron en .pending (llamar antes de arrancar workers)."""
+        names = sorted(os.listdir(self.pending_dir))
+        for name in names:
+            self._queue.put(os.path.join(self.pending_dir, name))
+        if names:
+            logging.info(f"[BACKUP] {len(names)} originales pendientes de archivar recuperados")
+        return len(names)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    # Hilo de archivado
+
+    def _current_archive(self, now):
+        s = self.settings
+        archive = self._archive
+        if archive is not None:
+            same_period = int(archive.opened // s.rotate_seconds) == int(now // s.rotate_seconds)
+            if same_period and archive.size < s.max_mb * 1024 * 1024:
+                return archive
+            archive.close()
+            logging.info(f"[BACKUP] Archivo cerrado: {archive.path}")
+        day = time.strftime('%Y%m%d', time.localtime(now))
+        directory = os.path.join(self.backup_dir, ARCHIVE_DIR, day)
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d%H%M', time.localtime(now))
+        while True:
+            self._seq += 1
+            path = os.path.join(directory, f"backup_{stamp}_{os.getpid()}_{self._seq:03d}.tar.{s.codec}")
+            if not os.path.exists(path):
+                break
+        self._archive = _Archive(path, s.codec)
+        return self._archive
+
+    def _close_expired(self):
+        """Cierra el tar en curso si su periodo terminó sin más originales."""
+        archive = self._archive
+        period = self.settings.rotate_seconds
+        if archive is not None and int(archive.opened // period) != int(time.time() // period):
+            archive.close()
+            self._archive = None
+            logging.info(f"[BACKUP] Archivo cerrado: {archive.path}")
+
+    def _add(self, staged, done):
+        name = os.path.basename(staged).partition('_')[2]
+        with open(staged, 'rb') as f:
+            data = f.read()
+        now = time.time()
+        archive = self._current_archive(now)
+        offset = archive.add(name, data, os.path.getmtime(staged))
+        rel = os.path.relpath(archive.path, self.backup_dir)
+        cur = self._db.execute("INSERT INTO entries (name, archive, offset, size, archived) VALUES (?, ?, ?, ?, ?)",
+                               (name, rel, offset, len(data), now))
+        self._db.executemany("INSERT INTO control_ids (control_id, entry) VALUES (?, ?)",
+                             [(cid, cur.lastrowid) for cid in control_ids(data)])
+        done.append(staged)
+
+    def _commit(self, done):
+        """Vuelca archivo e índice y sólo entonces elimina los originales de .pending."""
+        if self._archive is not None:
+            self._archive.flush()
+        self._db.commit()
+        for staged in done:
+            os.remove(staged)
+        self.archived += len(done)
+        done.clear()
+
+    def _run(self):
+        done = []
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0 if not done else 0.05)
+            except queue.Empty:
+                item = None
+            try:
+                if item is _STOP:
+                    self._commit(done)
+                    if self._archive is not None:
+                        self._archive.close()
+                        self._archive = None
+                    return
+                if item is not None:
+                    self._add(item, done)
+                # Volcar al vaciarse la cola: un bloque comprimido por ráfaga, no por archivo
+                if done and (item is None or self._queue.empty() or len(done) >= 256):
+                    self._commit(done)
+                if item is None and not done:
+                    self._close_expired()
+                if time.time() - self._last_prune >= 3600:
+                    self.prune()
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"[BACKUP] Error archivando {item}: {e}")
+
+    def prune(self):
+        """Elimina los archivos tar (y sus entradas del índice) más antiguos que retention_days."""
+        self._last_prune = time.time()
+        days = self.settings.retention_days
+        if not days:
+            return 0
+        limit = time.time() - days * 86400
+        root = os.path.join(self.backup_dir, ARCHIVE_DIR)
+        removed = 0
+        for directory, _, files in os.walk(root):
+            for fname in files:
+                path = os.path.join(directory, fname)
+                if self._archive is not None and path == self._archive.path:
+                    continue
+                if os.path.getmtime(path) < limit:
+                    rel = os.path.relpath(path, self.backup_dir)
+                    self._db.execute("DELETE FROM control_ids WHERE entry IN (SELECT id FROM entries WHERE archive = ?)", (rel,))
+                    self._db.execute("DELETE FROM entries WHERE archive = ?", (rel,))
+                    self._db.commit()
+                    os.remove(path)
+                    removed += 1
+        if removed:
+            logging.info(f"[BACKUP] {removed} archivos de backup eliminados por antigüedad (> {days} días)")
+        return removed
+
+    def close(self):
+        """Archiva lo encolado y cierra el archivo tar en curso."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._db.close()
+        logging.info(f"[BACKUP] {self.archived} originales archivados, {self.errors} errores")
+
+
+def backup_file(path, backup_dir, settings=None):
+    """
+    Retira un original procesado hacia backup_dir: lo encola en el archivado
+    comprimido si se indican settings o lo mueve como archivo suelto si no.
+    """
+    if settings is not None:
+        return get_archiver(settings).archive(path)
+    os.makedirs(backup_dir, exist_ok=True)
+    target = os.path.join(backup_dir, os.path.basename(path))
+    try:
+        os.replace(path, target)
+    except OSError:
+        shutil.move(path, target)
+    return target
+
+
+def find_backups(backup_dir, name=None, control_id=None):
+    """Entradas del índice (nombre, archivo, posición, tamaño, fecha) por nombre o control ID."""
+    if not os.path.exists(os.path.join(backup_dir, INDEX_FILE)):
+        return []
+    db = _open_index(backup_dir)
+    try:
+        if control_id is not None:
+            rows = db.execute("SELECT e.name, e.archive, e.offset, e.size, e.archived FROM entries e "
+                              "JOIN control_ids c ON c.entry = e.id WHERE c.control_id = ? ORDER BY e.id",
+                              (control_id,)).fetchall()
+        else:
+            rows = db.execute("SELECT name, archive, offset, size, archived FROM entries WHERE name = ? ORDER BY id",
+                              (name,)).fetchall()
+    finally:
+        db.close()
+    return rows
+
+
+def read_backup(backup_dir, archive, offset):
+    """Contenido del miembro de un archivo tar que empieza en offset."""
+    path = os.path.join(backup_dir, archive)
+    with open(path, 'rb') as raw:
+        if path.endswith('.zst'):
+            stream = _zstandard().ZstdDecompressor().stream_reader(raw)
+            mode = 'r|'
+        else:
+            stream = raw
+            mode = 'r|gz'
+        try:
+            with tarfile.open(fileobj=stream, mode=mode) as tar:
+                for member in tar:
+                    if member.offset == offset:
+                        return tar.extractfile(member).read()
+        except (EOFError, tarfile.ReadError):
+            pass   # archivo en curso: sin marcas de fin
+    raise FileNotFoundError(f"No se encontró la posición {offset} en {archive}")
+
+
+# Un archivador por configuración y proceso (los workers en modo proceso crean el suyo)
+_archivers = {}
+_archivers_lock = threading.Lock()
+
+
+def get_archiver(settings):
+    """Devuelve el BackupArchiver compartido para unos BackupSettings."""
+    key = settings.cache_key()
+    with _archivers_lock:
+        archiver = _archivers.get(key)
+        if archiver is None:
+            if not _archivers:
+                # También al terminar un worker de ProcessPoolExecutor (no ejecuta atexit)
+                from multiprocessing import util
+                util.Finalize(None, close_archivers, exitpriority=10)
+            archiver = BackupArchiver(settings)
+            _archivers[key] = archiver
+        return archiver
+
+
+def close_archivers():
+    """Archiva lo pendiente y cierra los archivadores de este proceso."""
+    with _archivers_lock:
+        for archiver in _archivers.values():
+            archiver.close()
+        _archivers.clear()
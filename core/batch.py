@@ -0,0 +1,150 @@
+import os
+import time
+import fnmatch
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core.hl7_stream import transform_file
+from core.routing import resolve_plan
+from core.log_setup import worker_logging_args
+from core.writer import get_writer
+
+STAGES = ('parse', 'transform', 'write')
+
+
+def iter_input_files(input_dir, include=('*.hl7',), exclude=(), recursive=True):
+    """
+    Recorre input_dir (y subcarpetas si recursive) devolviendo las rutas cuyo
+    nombre coincide con algún patrón de include y con ninguno de exclude.
+    Los patrones no distinguen mayúsculas/minúsculas.
+    """
+    include = [p.lower() for p in include]
+    exclude = [p.lower() for p in exclude]
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            lower = fname.lower()
+            if any(fnmatch.fnmatch(lower, p) for p in include) and not any(fnmatch.fnmatch(lower, p) for p in exclude):
+                yield os.path.join(root, fname)
+        if not recursive:
+            break
+
+
+def _process_chunk(pairs, config_name, configs, output=None):
+    """
+    Procesa un bloque de (entrada, salida) en un worker. Cada salida se publica
+    de forma atómica (core.writer), de modo que una salida existente siempre
+    está completa (necesario para reanudar).
+    """
+    stats = {'files': 0, 'messages': 0, 'bytes': 0, 'errors': []}
+    plan = resolve_plan(config_name, configs)
+    writer = get_writer(output)
+    for src, dst in pairs:
+        try:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            stats['messages'] += transform_file(src, dst, plan, stats, output=writer)
+            stats['files'] += 1
+            stats['bytes'] += os.path.getsize(src)
+        except Exception as e:
+            stats['errors'].append((src, str(e)))
+    return stats
+
+
+class BatchReport:
+    """Totales de un procesamiento masivo y cálculo de throughput."""
+    def __init__(self):
+        self.files = 0
+        self.messages = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.errors = []
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, stats):
+        self.files += stats['files']
+        self.messages += stats['messages']
+        self.bytes += stats['bytes']
+        self.errors.extend(stats['errors'])
+        for stage in STAGES:
+            self.stages[stage] += stats.get(stage, 0.0)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self):
+        elapsed = self.elapsed or 1e-9
+        stage_total = sum(self.stages.values()) or 1e-9
+        lines = [
+            f"Archivos procesados: {self.files} (omitidos: {self.skipped}, errores: {len(self.errors)})",
+            f"Mensajes: {self.messages}  |  Datos: {self.bytes / 1e6:.1f} MB  |  Tiempo: {elapsed:.2f} s",
+            f"Throughput: {self.files / elapsed:.1f} archivos/s, {self.messages / elapsed:.1f} mensajes/s, "
+            f"{self.bytes / 1e6 / elapsed:.2f} MB/s",
+            "Tiempo por etapa (suma de todos los workers):",
+        ]
+        for stage in STAGES:
+            secs = self.stages[stage]
+            lines.append(f"  {stage:<10} {secs:8.2f} s  ({100 * secs / stage_total:5.1f} %)")
+        return '\n'.join(lines)
+
+
+def process_directory(input_dir, output_dir, config_name, configs, include=('*.hl7',), exclude=(),
+                      workers=None, pool_mode='process', resume=False, chunk_size=64, progress=None,
+                      output=None):
+    """
+    Procesa todos los archivos de un árbol de directorios con una configuración,
+    en paralelo y en un único proceso principal (sin coste de arranque por archivo).
+
+    La salida reproduce la estructura de carpetas de input_dir dentro de
+    output_dir. Los originales no se mueven. Con resume=True se omiten los
+    archivos cuya salida ya existe. output (core.writer.OutputSettings) fija el
+    terminador de segmento y la política de fsync; los lotes no se admiten aquí.
+
+    Returns:
+        BatchReport: totales y tiempos del procesamiento.
+    """
+    if output is not None and output.batch_messages:
+        raise ValueError("process-dir reproduce la estructura de carpetas y no admite salida en lotes")
+    workers = workers or os.cpu_count() or 1
+    if pool_mode == 'process':
+        initializer, initargs = worker_logging_args()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    report = BatchReport()
+
+    def chunks():
+        chunk = []
+        for src in iter_input_files(input_dir, include, exclude):
+            dst = os.path.join(output_dir, os.path.relpath(src, input_dir))
+            if resume and os.path.exists(dst):
+                report.skipped += 1
+                continue
+            chunk.append((src, dst))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    with executor:
+        # Ventana acotada de tareas en vuelo para no cargar todo el árbol en memoria
+        in_flight = set()
+        for chunk in chunks():
+            in_flight.add(executor.submit(_process_chunk, chunk, config_name, configs, output))
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    report.add(fut.result())
+                if progress:
+                    progress(report)
+        for fut in in_flight:
+            report.add(fut.result())
+
+    report.finish()
+    for src, error in report.errors:
+        logging.error(f"[BATCH] Error procesando {src}: {error}")
+    logging.info(f"[BATCH] {input_dir} -> {output_dir}: {report.files} archivos, "
+                 f"{report.skipped} omitidos, {len(report.errors)} errores en {report.elapsed:.2f} s")
+    return report
@@ -0,0 +1,186 @@
+import re
+
+from core.field_path import parse_path, FieldPathError
+from core.log_setup import trace_logger
+
+# Operadores de condición. 'equals' sin más opciones conserva la semántica
+# original (primer segmento que tiene el campo).
+OPERATORS = ('equals', 'not_equals', 'in', 'regex', 'startswith', 'exists', 'gt', 'gte', 'lt', 'lte')
+MATCH_MODES = ('first', 'any', 'all')
+
+_NUMERIC = {
+    'gt':  lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt':  lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+
+class ConditionError(ValueError):
+    """Condición con parámetros inválidos."""
+
+
+def is_legacy_condition(cond):
+    """True si la condición es la igualdad original segment/field_index/value."""
+    return ('segment' in cond and 'path' not in cond and 'match' not in cond
+            and cond.get('operator', 'equals') == 'equals')
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _value_test(cond):
+    """Compila el operador a una función valor -> bool (regex, conjuntos... se preparan aquí)."""
+    op = cond.get('operator', 'equals')
+    if op not in OPERATORS:
+        raise ConditionError(f"Operador no soportado: {op!r} (válidos: {', '.join(OPERATORS)})")
+    if op == 'exists':
+        return bool
+    if 'value' not in cond:
+        raise ConditionError(f"Condición sin 'value': {cond}")
+    value = cond['value']
+
+    if op == 'in':
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ConditionError(f"'in' requiere una lista de textos (valor: {value!r})")
+        options = frozenset(value)
+        return options.__contains__
+    if op in _NUMERIC:
+        number = _to_number(value)
+        if number is None or isinstance(value, bool):
+            raise ConditionError(f"'{op}' requiere un valor numérico (valor: {value!r})")
+        compare = _NUMERIC[op]
+
+        def numeric(v):
+            n = _to_number(v)
+            return n is not None and compare(n, number)
+        return numeric
+    if op == 'startswith':
+        if isinstance(value, list) and value and all(isinstance(v, str) for v in value):
+            prefixes = tuple(value)
+        elif isinstance(value, str):
+            prefixes = value
+        else:
+            raise ConditionError(f"'startswith' requiere texto o lista de textos (valor: {value!r})")
+        return lambda v: v.startswith(prefixes)
+    if not isinstance(value, str):
+        raise ConditionError(f"'{op}' requiere un valor de texto (valor: {value!r})")
+    if op == 'regex':
+        try:
+            pattern = re.compile(value)
+        except re.error as e:
+            raise ConditionError(f"Expresión regular inválida {value!r}: {e}") from e
+        return lambda v: pattern.search(v) is not None
+    if op == 'not_equals':
+        return value.__ne__
+    return value.__eq__
+
+
+def _value_getter(cond):
+    """(segmento, función segmento -> valor o None si el segmento no tiene ese campo)."""
+    if 'path' in cond:
+        try:
+            path = parse_path(cond['path'])
+        except FieldPathError as e:
+            raise ConditionError(str(e)) from e
+        return path.segment, lambda seg: path.read(seg.fields, seg.components_cache)
+
+    segment, idx = cond.get('segment'), cond.get('field_index')
+    if not isinstance(segment, str):
+        raise ConditionError(f"Condición sin 'segment' ni 'path': {cond}")
+    if not isinstance(idx, int) or isinstance(idx, bool):
+        raise ConditionError(f"'field_index' debe ser entero (valor: {idx!r})")
+
+    def get(seg):
+        fields = seg.fields
+        return fields[idx] if 0 <= idx < len(fields) else None
+    return segment, get
+
+
+def _compile_leaf(cond):
+    segment, get = _value_getter(cond)
+    test = _value_test(cond)
+    mode = cond.get('match', 'first')
+    if mode not in MATCH_MODES:
+        raise ConditionError(f"'match' debe ser uno de {', '.join(MATCH_MODES)} (valor: {mode!r})")
+
+    if mode == 'first':
+        def predicate(message):
+            for seg in message.find_all(segment):
+                value = get(seg)
+                if value is not None:
+                    return test(value)
+            return False
+    elif mode == 'any':
+        def predicate(message):
+            for seg in message.find_all(segment):
+                value = get(seg)
+                if value is not None and test(value):
+                    return True
+            return False
+    else:
+        def predicate(message):
+            segments = message.find_all(segment)
+            if not segments:
+                return False
+            for seg in segments:
+                value = get(seg)
+                if value is None or not test(value):
+                    return False
+            return True
+    return predicate
+
+
+def _compile_node(cond):
+    if not isinstance(cond, dict):
+        raise ConditionError(f"La condición debe ser un objeto JSON (valor: {cond!r})")
+    for key in ('all', 'any'):
+        if key in cond:
+            children = cond[key]
+            if not isinstance(children, list) or not children:
+                raise ConditionError(f"'{key}' requiere una lista no vacía de condiciones")
+            predicates = tuple(_compile_node(child) for child in children)
+            if key == 'all':
+                return lambda message: all(p(message) for p in predicates)
+            return lambda message: any(p(message) for p in predicates)
+    if 'not' in cond:
+        inner = _compile_node(cond['not'])
+        return lambda message: not inner(message)
+    if is_legacy_condition(cond):
+        if 'value' not in cond:
+            raise ConditionError(f"Condición sin 'value': {cond}")
+        _value_getter(cond)
+        return lambda message: message.evaluate_condition(cond)
+    return _compile_leaf(cond)
+
+
+def compile_condition(cond):
+    """
+    Compila una condición a una función message -> bool.
+
+    Formas admitidas:
+      - {"segment", "field_index" | "path", "operator", "value", "match"}: operator
+        es uno de OPERATORS ('in' usa un frozenset, 'regex' se compila aquí una
+        sola vez, gt/gte/lt/lte comparan como números); match indica si decide
+        el primer segmento con el campo ('first'), alguno ('any') o todos ('all').
+      - {"all": [...]}, {"any": [...]}: grupos AND/OR que se evalúan en orden y
+        se detienen en cuanto el resultado está decidido.
+      - {"not": {...}}.
+
+    Raises:
+        ConditionError: si algún parámetro es inválido.
+    """
+    predicate = _compile_node(cond)
+    if is_legacy_condition(cond):
+        # evaluate_condition ya registra su propia traza
+        return predicate
+
+    def traced(message):
+        res = predicate(message)
+        trace_logger.debug("[COND] %s -> %s", cond, res)
+        return res
+    return traced
@@ -0,0 +1,313 @@
+import os
+import csv
+import time
+import logging
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from core.extract import CHUNK_BYTES, file_tasks, iter_sources
+from core.hl7_message import HL7Message
+from core.hl7_stream import BATCH_SEGMENTS
+from core.rule_compiler import compile_configuration
+from core.log_setup import worker_logging_args
+
+# Comparación de dos versiones de una configuración sobre un corpus de mensajes.
+# Sólo se leen los archivos del corpus: no se escriben salidas, no se mueven
+# originales ni se toca ningún backup. Cada worker aplica las dos versiones a
+# cada mensaje y devuelve las diferencias campo a campo, los mensajes que
+# modifica cada paso de cada plan y la latencia de cada transformación.
+
+VERSIONS = ('old', 'new')
+
+# Tareas por envío al pool: los archivos pequeños se agrupan hasta este tamaño
+GROUP_BYTES = 4 * 1024 * 1024
+GROUP_TASKS = 256
+
+DIFF_COLUMNS = ('file', 'message', 'control_id', 'field', 'old', 'new')
+
+
+def _range_messages(task):
+    """Mensajes (listas de líneas) de un rango (ruta, inicio, fin) de un archivo, sin envoltura de lote."""
+    path, start, end = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    lines = None
+    for line in HL7Message.from_text(text).lines():
+        name = line.partition('|')[0]
+        if name == 'MSH':
+            if lines:
+                yield lines
+            lines = [line]
+        elif name in BATCH_SEGMENTS:
+            continue
+        elif lines is not None:
+            lines.append(line)
+    if lines:
+        yield lines
+
+
+def _segment_fields(lines):
+    """{(segmento, repetición): campos} y el orden de los segmentos de una salida."""
+    fields = {}
+    order = []
+    seen = {}
+    for line in lines:
+        values = line.split('|')
+        name = values[0]
+        n = seen[name] = seen.get(name, 0) + 1
+        fields[(name, n)] = values
+        order.append(name)
+    return fields, order
+
+
+def field_diff(old_lines, new_lines):
+    """
+    Diferencias campo a campo entre dos salidas de un mismo mensaje.
+
+    Los segmentos se emparejan por tipo y repetición (PID, OBX[2]...) y los
+    campos se numeran como en HL7 (MSH-9, PID-5). Un segmento que sólo existe
+    en una versión aparece completo con el campo igual a su nombre; un cambio
+    sólo de orden aparece como el campo '(orden)'.
+
+    Returns:
+        list: tuplas (campo, valor anterior, valor nuevo).
+    """
+    if old_lines == new_lines:
+        return []
+    old, old_order = _segment_fields(old_lines)
+    new, new_order = _segment_fields(new_lines)
+    diffs = []
+    for key in list(old) + [key for key in new if key not in old]:
+        name, n = key
+        label = name if n == 1 else f"{name}[{n}]"
+        a = old.get(key)
+        b = new.get(key)
+        if a is None or b is None:
+            diffs.append((label, '|'.join(a) if a else '', '|'.join(b) if b else ''))
+            continue
+        if a == b:
+            continue
+        offset = 1 if name == 'MSH' else 0
+        for i in range(1, max(len(a), len(b))):
+            va = a[i] if i < len(a) else ''
+            vb = b[i] if i < len(b) else ''
+            if va != vb:
+                diffs.append((f"{label}-{i + offset}", va, vb))
+    if not diffs and old_order != new_order:
+        diffs.append(('(orden)', ' '.join(old_order), ' '.join(new_order)))
+    return diffs
+
+
+def _run_plan(plan, lines, step_counts):
+    """
+    Aplica plan a un mensaje: devuelve (salida, segundos). Después repite la
+    transformación paso a paso sobre otra copia para contar en step_counts los
+    pasos que modifican el mensaje (fuera del tiempo medido).
+    """
+    message = HL7Message.from_lines(lines)
+    t0 = time.perf_counter()
+    plan.apply(message)
+    elapsed = time.perf_counter() - t0
+    output = list(message.lines())
+
+    message = HL7Message.from_lines(lines)
+    before = lines
+    for i, step in enumerate(plan.steps):
+        step(message)
+        after = list(message.lines())
+        if after != before:
+            step_counts[i] += 1
+        before = after
+    return output, elapsed
+
+
+def _compare_tasks(tasks, old_rules, new_rules):
+    """Compara las dos versiones en los mensajes de un grupo de rangos (en un worker)."""
+    plans = {'old': compile_configuration(old_rules, 'old'), 'new': compile_configuration(new_rules, 'new')}
+    stats = {
+        'messages': 0, 'identical': 0, 'bytes': 0, 'counts': [],
+        'times': {v: array('d') for v in VERSIONS},
+        'steps': {v: [0] * len(plans[v].steps) for v in VERSIONS},
+        'errors': dict.fromkeys(VERSIONS, 0),
+        'fields': {},
+        'diffs': [],
+    }
+    for t, task in enumerate(tasks):
+        count = 0
+        stats['bytes'] += task[2] - task[1]
+        for lines in _range_messages(task):
+            count += 1
+            outputs = {}
+            for version in VERSIONS:
+                try:
+                    output, elapsed = _run_plan(plans[version], lines, stats['steps'][version])
+                except Exception as e:
+                    stats['errors'][version] += 1
+                    output = [f"(error) {e}"]
+                else:
+                    stats['times'][version].append(elapsed)
+                outputs[version] = output
+            diffs = field_diff(outputs['old'], outputs['new'])
+            if not diffs:
+                stats['identical'] += 1
+                continue
+            fields = lines[0].split('|')
+            control_id = fields[9] if len(fields) > 9 else ''
+            for field, a, b in diffs:
+                stats['diffs'].append((t, count, control_id, field, a, b))
+            for field in {field for field, _, _ in diffs}:
+                stats['fields'][field] = stats['fields'].get(field, 0) + 1
+        stats['messages'] += count
+        stats['counts'].append(count)
+    return stats
+
+
+def _task_groups(sources, include, exclude, chunk_bytes):
+    """Agrupa los rangos de lectura en envíos de hasta GROUP_BYTES o GROUP_TASKS."""
+    group = []
+    size = 0
+    for source in iter_sources(sources, include, exclude):
+        for task in file_tasks(source, chunk_bytes):
+            group.append(task)
+            size += task[2] - task[1]
+            if size >= GROUP_BYTES or len(group) >= GROUP_TASKS:
+                yield group
+                group = []
+                size = 0
+    if group:
+        yield group
+
+
+class ConfigDiffReport:
+    """Totales de la comparación de dos versiones de una configuración."""
+    def __init__(self, old_label, new_label, old_plan, new_plan):
+        self.labels = {'old': old_label, 'new': new_label}
+        self.step_labels = {'old': old_plan.labels, 'new': new_plan.labels}
+        self.messages = 0
+        self.identical = 0
+        self.bytes = 0
+        self.files = set()
+        self.times = {v: array('d') for v in VERSIONS}
+        self.steps = {v: [0] * len(self.step_labels[v]) for v in VERSIONS}
+        self.errors = dict.fromkeys(VERSIONS, 0)
+        self.fields = {}
+        self.examples = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.workers = 1
+
+    def add(self, stats, tasks, ordinals, diff_writer=None, examples=0):
+        self.messages += stats['messages']
+        self.identical += stats['identical']
+        self.bytes += stats['bytes']
+        for version in VERSIONS:
+            self.times[version].extend(stats['times'][version])
+            self.errors[version] += stats['errors'][version]
+            for i, count in enumerate(stats['steps'][version]):
+                self.steps[version][i] += count
+        for field, count in stats['fields'].items():
+            self.fields[field] = self.fields.get(field, 0) + count
+        # Número de mensaje dentro de su archivo (los rangos de un archivo llegan en orden)
+        bases = []
+        for (path, _, _), count in zip(tasks, stats['counts']):
+            self.files.add(path)
+            bases.append(ordinals.get(path, 0))
+            ordinals[path] = bases[-1] + count
+        for t, n, control_id, field, a, b in stats['diffs']:
+            row = (tasks[t][0], bases[t] + n, control_id, field, a, b)
+            if diff_writer is not None:
+                diff_writer.writerow(row)
+            if len(self.examples) < examples or (self.examples and self.examples[-1][:2] == row[:2]):
+                self.examples.append(row)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @staticmethod
+    def _percentile(values, p):
+        return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+    def summary(self):
+        differing = self.messages - self.identical
+        total = self.messages or 1
+        lines = [
+            f"Corpus: {self.messages} mensajes en {len(self.files)} archivos ({self.bytes / 1e6:.1f} MB), "
+            f"{self.elapsed:.2f} s con {self.workers} procesos ({self.messages / (self.elapsed or 1e-9):,.0f} mensajes/s)",
+            f"Versiones: antigua = {self.labels['old']}  |  nueva = {self.labels['new']}",
+            f"Salidas idénticas: {self.identical} ({100 * self.identical / total:.1f} %)  |  "
+            f"distintas: {differing} ({100 * differing / total:.1f} %)  |  "
+            f"errores: antigua {self.errors['old']}, nueva {self.errors['new']}",
+        ]
+        if self.fields:
+            lines.append("Campos con diferencias (mensajes afectados):")
+            for field, count in sorted(self.fields.items(), key=lambda item: (-item[1], item[0]))[:20]:
+                lines.append(f"  {field:<16} {count:>8}  ({100 * count / total:5.1f} %)")
+        for version, title in zip(VERSIONS, ('antigua', 'nueva')):
+            lines.append(f"Pasos del plan {title} (mensajes que modifica cada uno):")
+            for i, (label, count) in enumerate(zip(self.step_labels[version], self.steps[version]), 1):
+                lines.append(f"  {i:>3}  {label:<16} {count:>8}  ({100 * count / total:5.1f} %)")
+        lines.append("Transformación por mensaje:      mensajes/s/núcleo     p50 µs     p95 µs     p99 µs     máx µs")
+        for version, title in zip(VERSIONS, ('antigua', 'nueva')):
+            times = sorted(self.times[version])
+            rate = len(times) / (sum(times) or 1e-9)
+            pct = [self._percentile(times, p) * 1e6 for p in (0.5, 0.95, 0.99)]
+            peak = times[-1] * 1e6 if times else 0.0
+            lines.append(f"  {title:<30} {rate:>17,.0f} {pct[0]:>10.1f} {pct[1]:>10.1f} {pct[2]:>10.1f} {peak:>10.1f}")
+        if self.examples:
+            lines.append("Primeros mensajes con diferencias:")
+            for path, n, control_id, field, a, b in self.examples:
+                lines.append(f"  {os.path.basename(path)} #{n} ({control_id}) {field}: {a!r} -> {b!r}")
+        return '\n'.join(lines)
+
+
+def compare_configurations(sources, old_rules, new_rules, old_label='old', new_label='new', workers=None,
+                           include=('*.hl7',), exclude=(), diff_output=None, examples=10, chunk_bytes=CHUNK_BYTES):
+    """
+    Aplica dos versiones de una configuración (listas de reglas) a todos los
+    mensajes de sources (archivos, lotes o carpetas) en paralelo y las compara.
+
+    Los archivos del corpus sólo se leen. Con diff_output se escribe un CSV con
+    una fila por campo distinto (archivo, número de mensaje en el archivo,
+    control ID, campo, valor antiguo y nuevo).
+
+    Raises:
+        RuleValidationError: si alguna de las versiones no es válida.
+
+    Returns:
+        ConfigDiffReport: diferencias, pasos y latencias de cada versión.
+    """
+    # Validar antes de repartir el trabajo
+    report = ConfigDiffReport(old_label, new_label, compile_configuration(old_rules, 'old'),
+                              compile_configuration(new_rules, 'new'))
+    workers = report.workers = workers or os.cpu_count() or 1
+    ordinals = {}
+    diff_file = open(diff_output, 'w', encoding='utf-8', newline='') if diff_output else None
+    try:
+        diff_writer = None
+        if diff_file is not None:
+            diff_writer = csv.writer(diff_file)
+            diff_writer.writerow(DIFF_COLUMNS)
+        groups = _task_groups(sources, include, exclude, chunk_bytes)
+        if workers == 1:
+            for group in groups:
+                report.add(_compare_tasks(group, old_rules, new_rules), group, ordinals, diff_writer, examples)
+        else:
+            initializer, initargs = worker_logging_args()
+            with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+                # Ventana acotada de tareas en vuelo; los resultados se suman en orden
+                pending = []
+                for group in groups:
+                    pending.append((group, executor.submit(_compare_tasks, group, old_rules, new_rules)))
+                    if len(pending) >= workers * 2:
+                        group, fut = pending.pop(0)
+                        report.add(fut.result(), group, ordinals, diff_writer, examples)
+                for group, fut in pending:
+                    report.add(fut.result(), group, ordinals, diff_writer, examples)
+    finally:
+        if diff_file is not None:
+            diff_file.close()
+    report.finish()
+    logging.info(f"[TEST-CONFIG] {old_label} vs {new_label}: {report.messages} mensajes, "
+                 f"{report.messages - report.identical} distintos en {report.elapsed:.2f} s")
+    return report
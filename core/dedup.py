@@ -0,0 +1,237 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from core.log_setup import log_message
+from core.metrics import METRICS
+
+# Huella de cada mensaje:
+#   control-id: MSH-4 (centro emisor) + MSH-10 (id de control); si MSH-10 está
+#               vacío se usa el contenido.
+#   content:    hash del texto original del mensaje (antes de transformarlo).
+KEY_MODES = ('control-id', 'content')
+ACTIONS = ('skip', 'divert')
+
+DEFAULT_CAPACITY = 100000
+DEFAULT_TTL = 24 * 3600
+PRUNE_EVERY = 10000
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, ts REAL NOT NULL)"
+# Inserta la huella o renueva una caducada; rowcount == 0 => duplicado vigente.
+# Es atómico, así que dos procesos que ven el mismo mensaje a la vez no lo dejan pasar dos veces.
+_UPSERT = ("INSERT INTO seen (key, ts) VALUES (?, ?) "
+           "ON CONFLICT(key) DO UPDATE SET ts = excluded.ts WHERE seen.ts < ?")
+
+
+def content_key(message):
+    """Hash del texto del mensaje (los segmentos sin separar se leen tal cual)."""
+    return 'sha:' + hashlib.blake2b('\r'.join(message.lines()).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def control_id_key(message):
+    """'MSH-4|MSH-10' del mensaje, o su hash de contenido si no tiene id de control."""
+    msh = message.find('MSH')
+    if msh is not None:
+        fields = msh.fields
+        control_id = fields[9] if len(fields) > 9 else ''
+        if control_id:
+            return f"{fields[3] if len(fields) > 3 else ''}|{control_id}"
+    return content_key(message)
+
+
+_KEY_FUNCTIONS = {'control-id': control_id_key, 'content': content_key}
+
+
+class DedupSettings:
+    """
+    Parámetros de la supresión de duplicados. Es un objeto simple para que pueda
+    enviarse a los workers en modo proceso; cada proceso abre su propia caché
+    (ver get_dedup) sobre el mismo almacén.
+    """
+    __slots__ = ('db_path', 'key', 'ttl', 'capacity', 'action', 'divert_dir')
+
+    def __init__(self, db_path=None, key='control-id', ttl=DEFAULT_TTL, capacity=DEFAULT_CAPACITY,
+                 action='skip', divert_dir=None):
+        if key not in KEY_MODES:
+            raise ValueError(f"Huella no soportada: {key}")
+        if action not in ACTIONS:
+            raise ValueError(f"Acción no soportada: {action}")
+        if action == 'divert' and not divert_dir:
+            raise ValueError("La acción 'divert' requiere una carpeta de desvío")
+        self.db_path = db_path
+        self.key = key
+        self.ttl = ttl
+        self.capacity = capacity
+        self.action = action
+        self.divert_dir = divert_dir
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def cache_key(self):
+        return self.__getstate__()
+
+
+class DedupCache:
+    """
+    Registro de huellas vistas en los últimos ttl segundos.
+
+    Las más recientes se guardan en un LRU en memoria de capacity entradas; el
+    resto se consulta en una base SQLite (db_path) que sobrevive a los reinicios
+    y que comparten los procesos que usan el mismo archivo. Las huellas
+    caducadas se eliminan cada PRUNE_EVERY altas. Sin db_path sólo se usa la
+    memoria.
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        self.ttl = settings.ttl
+        self.capacity = settings.capacity
+        self.key_function = _KEY_FUNCTIONS[settings.key]
+        self.checked = 0
+        self.suppressed = 0
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._db = None
+        if settings.db_path:
+            import sqlite3   # sólo con almacén persistente: no retrasa el arranque de la CLI
+            db_dir = os.path.dirname(settings.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._db = sqlite3.connect(settings.db_path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(_SCHEMA)
+            self._db.commit()
+            self.prune()
+
+    def _remember(self, key, ts):
+        recent = self._recent
+        recent[key] = ts
+        recent.move_to_end(key)
+        if len(recent) > self.capacity:
+            recent.popitem(last=False)
+
+    def seen(self, key):
+        """True si key se vio dentro del TTL; si no, la registra y devuelve False."""
+        now = time.time()
+        with self._lock:
+            self.checked += 1
+            ts = self._recent.get(key)
+            if ts is not None and now - ts < self.ttl:
+                self._recent.move_to_end(key)
+                self.suppressed += 1
+                return True
+            if self._db is None:
+                self._remember(key, now)
+                return False
+            cur = self._db.execute(_UPSERT, (key, now, now - self.ttl))
+            self._db.commit()
+            if cur.rowcount == 0:
+                # Registrada por otro proceso o antes de un reinicio
+                row = self._db.execute("SELECT ts FROM seen WHERE key = ?", (key,)).fetchone()
+                self._remember(key, row[0] if row else now)
+                self.suppressed += 1
+                return True
+            self._remember(key, now)
+            self._inserts += 1
+            if self._inserts % PRUNE_EVERY == 0:
+                self._prune(now)
+            return False
+
+    def forget_file(self, path, since):
+        """
+        Olvida las huellas de los mensajes de path registradas desde since (un
+        intento de procesamiento interrumpido), para que al reprocesarlo no se
+        tomen por duplicados. Las registradas antes se conservan.
+        """
+        from core.hl7_stream import iter_hl7_messages, is_batch_envelope
+        keys = [self.key_function(m) for m in iter_hl7_messages(path) if not is_batch_envelope(m)]
+        with self._lock:
+            for key in keys:
+                ts = self._recent.get(key)
+                if ts is not None and ts >= since:
+                    del self._recent[key]
+            if self._db is not None:
+                self._db.executemany("DELETE FROM seen WHERE key = ? AND ts >= ?", [(key, since) for key in keys])
+                self._db.commit()
+
+    def _prune(self, now):
+        self._db.execute("DELETE FROM seen WHERE ts < ?", (now - self.ttl,))
+        self._db.commit()
+
+    def prune(self):
+        """Elimina del almacén las huellas caducadas."""
+        if self._db is not None:
+            with self._lock:
+                self._prune(time.time())
+
+    def is_duplicate(self, message, source):
+        """
+        Comprueba un mensaje (antes de transformarlo). Si es un duplicado lo
+        registra en el resumen ([MSG] ... status=duplicate) y, con la acción
+        'divert', lo agrega al archivo <divert_dir>/<source>.
+        """
+        if not self.seen(self.key_function(message)):
+            return False
+        log_message(message, source, None, 0.0, 'duplicate')
+        if METRICS.enabled:
+            METRICS.inc('hl7_messages_total', ('-', 'duplicate'))
+        if self.settings.action == 'divert':
+            self._divert(message, source)
+        return True
+
+    def _divert(self, message, source):
+        divert_dir = self.settings.divert_dir
+        name = source if os.path.splitext(source)[1] else source + '.hl7'
+        os.makedirs(divert_dir, exist_ok=True)
+        with self._lock:
+            with open(os.path.join(divert_dir, name), 'a', encoding='utf-8') as f:
+                f.write(message.to_text())
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        logging.info(f"[DEDUP] {self.checked} mensajes revisados, {self.suppressed} duplicados suprimidos")
+
+
+# Una caché por configuración y proceso (los workers en modo proceso crean la suya)
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_dedup(settings):
+    """Devuelve la DedupCache compartida para unos DedupSettings (None si no hay)."""
+    if settings is None:
+        return None
+    key = settings.cache_key()
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = DedupCache(settings)
+            _caches[key] = cache
+        return cache
+
+
+def dedup_totals():
+    """(revisados, suprimidos) sumados de las cachés de este proceso."""
+    with _caches_lock:
+        return (sum(c.checked for c in _caches.values()),
+                sum(c.suppressed for c in _caches.values()))
+
+
+def close_dedup():
+    """Cierra las cachés de este proceso."""
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
@@ -0,0 +1,206 @@
+import os
+import re
+import csv
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from core.batch import iter_input_files
+from core.field_path import parse_path
+from core.hl7_stream import BATCH_SEGMENTS
+from core.log_setup import worker_logging_args
+
+# Tamaño de cada tarea: los archivos grandes se reparten en rangos de bytes
+# alineados al inicio de un MSH para que varios procesos lean el mismo lote.
+CHUNK_BYTES = 16 * 1024 * 1024
+
+MULTI_MODES = ('first', 'join')
+
+_LINE_SPLIT = re.compile(r'\r\n|\r|\n')
+_MESSAGE_START = re.compile(rb'[\r\n]MSH\|')
+
+
+def _aligned_offset(f, offset, size):
+    """Primera posición >= offset en la que empieza una línea MSH."""
+    if offset <= 0:
+        return 0
+    f.seek(offset - 1)
+    base = offset - 1
+    tail = b''
+    while True:
+        block = f.read(1 << 20)
+        if not block:
+            return size
+        data = tail + block
+        m = _MESSAGE_START.search(data)
+        if m:
+            return base - len(tail) + m.start() + 1
+        tail = data[-4:]
+        base += len(block)
+
+
+def file_tasks(path, chunk_bytes):
+    """Divide un archivo en rangos (inicio, fin) que empiezan en un MSH."""
+    size = os.path.getsize(path)
+    if size <= chunk_bytes:
+        return [(path, 0, size)]
+    with open(path, 'rb') as f:
+        bounds = sorted({_aligned_offset(f, offset, size) for offset in range(0, size, chunk_bytes)} | {size})
+    return [(path, start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _extract_range(task, paths, multi='first', join_sep='~', with_source=False):
+    """
+    Extrae las columnas de los mensajes de un rango de un archivo.
+
+    Sólo se separan en campos los segmentos que aparecen en alguna ruta; el
+    resto de líneas se descartan por su identificador sin dividirlas.
+    """
+    path, start, end = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    parsed = [parse_path(p) for p in paths]
+    by_segment = {}
+    for col, fp in enumerate(parsed):
+        by_segment.setdefault(fp.segment, []).append((col, fp))
+    ncols = len(parsed)
+    columns = [[] for _ in range(ncols)]
+    first_only = multi == 'first'
+
+    row = None
+    for line in _LINE_SPLIT.split(text):
+        name = line[:3]
+        if name == 'MSH':
+            if row is not None:
+                for col in range(ncols):
+                    columns[col].append(row[col] if first_only else join_sep.join(row[col]))
+            row = [None] * ncols if first_only else [[] for _ in range(ncols)]
+        elif row is None or name in BATCH_SEGMENTS:
+            continue
+        targets = by_segment.get(name)
+        if targets is None or (len(line) > 3 and line[3] != '|'):
+            continue
+        fields = line.split('|')
+        for col, fp in targets:
+            if first_only:
+                if row[col] is None:
+                    row[col] = fp.read(fields)
+            else:
+                row[col].append(fp.read(fields))
+    if row is not None:
+        for col in range(ncols):
+            columns[col].append(row[col] if first_only else join_sep.join(row[col]))
+    if first_only:
+        for values in columns:
+            values[:] = ['' if v is None else v for v in values]
+
+    result = {fp.text: values for fp, values in zip(parsed, columns)}
+    if with_source:
+        count = len(columns[0]) if columns else 0
+        result['source'] = [path] * count
+    return result
+
+
+def iter_sources(sources, include=('*.hl7',), exclude=()):
+    """Archivos a leer: los indicados y los de los directorios indicados."""
+    for source in sources:
+        if os.path.isdir(source):
+            yield from iter_input_files(source, include, exclude)
+        else:
+            yield source
+
+
+def extract_columns(sources, paths, workers=None, multi='first', join_sep='~', with_source=False,
+                    include=('*.hl7',), exclude=(), chunk_bytes=CHUNK_BYTES):
+    """
+    Extrae las rutas indicadas (ej. 'MSH.10', 'PID.3.1', 'OBX.5') de todos los
+    mensajes de sources (archivos, lotes o directorios) en paralelo.
+
+    Genera bloques columnares {ruta: [valores]} (una fila por mensaje) en el
+    orden de los archivos. multi='first' toma el primer segmento de cada tipo;
+    multi='join' une los valores de todos los segmentos repetidos (OBX...) con
+    join_sep.
+    """
+    if multi not in MULTI_MODES:
+        raise ValueError(f"Modo no soportado: {multi}")
+    for p in paths:
+        parse_path(p)   # validar antes de repartir el trabajo
+    tasks = (task for source in iter_sources(sources, include, exclude)
+             for task in file_tasks(source, chunk_bytes))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            yield _extract_range(task, paths, multi, join_sep, with_source)
+        return
+
+    initializer, initargs = worker_logging_args()
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        # Ventana acotada de tareas en vuelo; los resultados salen en orden
+        pending = []
+        for task in tasks:
+            pending.append(executor.submit(_extract_range, task, paths, multi, join_sep, with_source))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+
+def to_numpy(chunk):
+    """Convierte un bloque de extract_columns en arrays de NumPy (dtype str)."""
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError("to_numpy requiere numpy (pip install numpy)") from e
+    return {name: np.array(values, dtype=str) for name, values in chunk.items()}
+
+
+def _write_csv(chunks, output_path, columns):
+    rows = 0
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(zip(*(chunk[c] for c in columns)))
+            rows += len(chunk[columns[0]])
+    return rows
+
+
+def _write_parquet(chunks, output_path, columns):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("La salida Parquet requiere pyarrow (pip install pyarrow)") from e
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    rows = 0
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.table({c: chunk[c] for c in columns}, schema=schema))
+            rows += len(chunk[columns[0]])
+    return rows
+
+
+OUTPUT_FORMATS = {'csv': _write_csv, 'parquet': _write_parquet}
+
+
+def extract_to_file(sources, paths, output_path, fmt='csv', **kwargs):
+    """
+    Extrae las rutas de todos los mensajes y las escribe en output_path (CSV o
+    Parquet) bloque a bloque, sin cargar el resultado completo en memoria.
+
+    Returns:
+        (int, float): filas escritas y segundos empleados.
+    """
+    writer = OUTPUT_FORMATS.get(fmt)
+    if writer is None:
+        raise ValueError(f"Formato no soportado: {fmt}")
+    columns = [parse_path(p).text for p in paths]
+    if kwargs.get('with_source'):
+        columns.append('source')
+    t0 = time.perf_counter()
+    rows = writer(extract_columns(sources, paths, **kwargs), output_path, columns)
+    elapsed = time.perf_counter() - t0
+    logging.info(f"[EXTRACT] {rows} mensajes -> {output_path} en {elapsed:.2f} s")
+    return rows, elapsed
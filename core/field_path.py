@@ -0,0 +1,186 @@
+import re
+
+# Separadores estándar (MSH-1 y MSH-2: |^~\&)
+FIELD_SEPARATOR = '|'
+COMPONENT_SEPARATOR = '^'
+REPETITION_SEPARATOR = '~'
+ESCAPE_CHARACTER = '\\'
+SUBCOMPONENT_SEPARATOR = '&'
+
+# Segmentos cuyo primer campo es el propio separador: MSH-n = fields[n-1]
+_HEADER_SEGMENTS = frozenset(('MSH', 'FHS', 'BHS'))
+
+_ESCAPE_SEQUENCES = {'F': '|', 'S': '^', 'T': '&', 'R': '~', 'E': '\\'}
+_ESCAPE_PATTERN = re.compile(r'\\([FSTRE])\\')
+
+# Escapado según el nivel que se escribe: un campo o una repetición se escriben
+# tal cual (pueden contener componentes), sólo se protegen los separadores de
+# nivel superior; un componente o subcomponente es texto y se escapa completo.
+_ESCAPE_FIELD = str.maketrans({'|': '\\F\\'})
+_ESCAPE_REPETITION = str.maketrans({'|': '\\F\\', '~': '\\R\\'})
+_ESCAPE_TEXT = str.maketrans({'\\': '\\E\\', '|': '\\F\\', '^': '\\S\\', '&': '\\T\\', '~': '\\R\\'})
+
+# SEG.campo[repetición].componente.subcomponente (numeración HL7, desde 1)
+_PATH_PATTERN = re.compile(r'^([A-Za-z0-9]{3})\.(\d+)(?:\[(\d+)\])?(?:\.(\d+)(?:\.(\d+))?)?$')
+
+FIELD, REPETITION, COMPONENT, SUBCOMPONENT = 'field', 'repetition', 'component', 'subcomponent'
+
+
+class FieldPathError(ValueError):
+    """Ruta de campo con sintaxis inválida."""
+
+
+def unescape(value):
+    """Sustituye las secuencias de escape \\F\\ \\S\\ \\T\\ \\R\\ \\E\\ por su carácter."""
+    if ESCAPE_CHARACTER not in value:
+        return value
+    return _ESCAPE_PATTERN.sub(lambda m: _ESCAPE_SEQUENCES[m.group(1)], value)
+
+
+def escape(value):
+    """Escapa separadores y el carácter de escape de un texto."""
+    return value.translate(_ESCAPE_TEXT)
+
+
+def _split_field(raw):
+    return [[component.split(SUBCOMPONENT_SEPARATOR) for component in rep.split(COMPONENT_SEPARATOR)]
+            for rep in raw.split(REPETITION_SEPARATOR)]
+
+
+def _join_field(repetitions):
+    return REPETITION_SEPARATOR.join(
+        COMPONENT_SEPARATOR.join(SUBCOMPONENT_SEPARATOR.join(subs) for subs in rep) for rep in repetitions)
+
+
+def _parsed_field(fields, index, cache):
+    """
+    Repeticiones/componentes/subcomponentes de fields[index], separados una sola
+    vez por mensaje: la caché guarda el texto del que salieron y se descarta en
+    cuanto el campo cambia por cualquier otra vía.
+    """
+    raw = fields[index]
+    if cache is not None:
+        entry = cache.get(index)
+        if entry is not None and entry[0] is raw:
+            return entry[1]
+    parsed = _split_field(raw)
+    if cache is not None:
+        cache[index] = (raw, parsed)
+    return parsed
+
+
+class FieldPath:
+    """
+    Ruta a un valor dentro de un segmento: 'PID.5', 'PID.5.1', 'PID.3[2].1',
+    'PID.3[2].1.2'. Campo, repetición, componente y subcomponente se numeran
+    desde 1 como en HL7; en MSH/FHS/BHS el campo n es MSH-n (MSH.9 = tipo de
+    mensaje). Sin [n] se usa la primera repetición.
+
+    Los valores de componente y subcomponente se leen sin escapes (\\S\\ -> ^) y
+    se escapan al escribir; un campo o una repetición completos se leen y
+    escriben como texto HL7 (con sus separadores de componente).
+    """
+    __slots__ = ('text', 'segment', 'field', 'repetition', 'component', 'subcomponent', 'level')
+
+    def __init__(self, text):
+        m = _PATH_PATTERN.match(text.strip()) if isinstance(text, str) else None
+        if not m:
+            raise FieldPathError(f"Ruta de campo inválida: {text!r} (ej.: PID.5.1, PID.3[2].1)")
+        segment, field, rep, comp, sub = m.groups()
+        field = int(field)
+        if segment in _HEADER_SEGMENTS:
+            if field < 2:
+                raise FieldPathError(f"{segment}.1 es el separador de campos y no se puede direccionar")
+            if field == 2 and (rep or comp):
+                raise FieldPathError(f"{segment}.2 contiene los caracteres de codificación y no tiene componentes")
+            field -= 1
+        elif field < 1:
+            raise FieldPathError(f"Los campos se numeran desde 1: {text!r}")
+        numbers = [int(n) for n in (rep, comp, sub) if n is not None]
+        if any(n < 1 for n in numbers):
+            raise FieldPathError(f"Repeticiones, componentes y subcomponentes se numeran desde 1: {text!r}")
+
+        self.text = text.strip()
+        self.segment = segment
+        self.field = field
+        self.repetition = int(rep) - 1 if rep else 0
+        self.component = int(comp) - 1 if comp else None
+        self.subcomponent = int(sub) - 1 if sub else None
+        if sub:
+            self.level = SUBCOMPONENT
+        elif comp:
+            self.level = COMPONENT
+        elif rep:
+            self.level = REPETITION
+        else:
+            self.level = FIELD
+
+    def read(self, fields, cache=None):
+        """Valor en una lista de campos; '' si la posición no existe."""
+        index = self.field
+        if index >= len(fields):
+            return ''
+        if self.level == FIELD:
+            return fields[index]
+        repetitions = _parsed_field(fields, index, cache)
+        if self.repetition >= len(repetitions):
+            return ''
+        components = repetitions[self.repetition]
+        if self.level == REPETITION:
+            return COMPONENT_SEPARATOR.join(SUBCOMPONENT_SEPARATOR.join(subs) for subs in components)
+        if self.component >= len(components):
+            return ''
+        subs = components[self.component]
+        if self.level == COMPONENT:
+            return unescape(SUBCOMPONENT_SEPARATOR.join(subs))
+        if self.subcomponent >= len(subs):
+            return ''
+        return unescape(subs[self.subcomponent])
+
+    def write(self, fields, value, cache=None):
+        """
+        Escribe value en la posición, agregando los campos, repeticiones,
+        componentes o subcomponentes vacíos que falten.
+        """
+        index = self.field
+        if len(fields) <= index:
+            fields.extend([''] * (index - len(fields) + 1))
+        if self.level == FIELD:
+            fields[index] = value.translate(_ESCAPE_FIELD)
+            return
+        repetitions = _parsed_field(fields, index, cache)
+        while len(repetitions) <= self.repetition:
+            repetitions.append([['']])
+        if self.level == REPETITION:
+            repetitions[self.repetition] = [c.split(SUBCOMPONENT_SEPARATOR) for c in
+                                            value.translate(_ESCAPE_REPETITION).split(COMPONENT_SEPARATOR)]
+        else:
+            components = repetitions[self.repetition]
+            while len(components) <= self.component:
+                components.append([''])
+            if self.level == COMPONENT:
+                components[self.component] = [escape(value)]
+            else:
+                subs = components[self.component]
+                while len(subs) <= self.subcomponent:
+                    subs.append('')
+                subs[self.subcomponent] = escape(value)
+        raw = _join_field(repetitions)
+        fields[index] = raw
+        if cache is not None:
+            cache[index] = (raw, repetitions)
+
+    def __repr__(self):
+        return f"FieldPath({self.text!r})"
+
+
+_path_cache = {}
+
+
+def parse_path(text):
+    """FieldPath para un texto de ruta, reutilizando las ya analizadas."""
+    path = _path_cache.get(text)
+    if path is None:
+        path = FieldPath(text)
+        _path_cache[text] = path
+    return path
@@ -0,0 +1,310 @@
+import re
+from bisect import insort
+
+from core.log_setup import trace_logger
+
+# Mismos separadores de segmento que la lectura de archivos en modo texto
+_SEGMENT_SPLIT = re.compile(r'\r\n|\r|\n')
+
+
+class HL7Segment:
+    """
+    Segmento HL7: lista de campos donde fields[0] es el identificador (MSH, PID, ...).
+
+    Puede crearse a partir del texto original (raw) sin separarlo en campos: la
+    separación por '|' se hace sólo la primera vez que una regla accede a fields.
+    Un segmento que nunca se separa se vuelve a escribir tal cual, sin el ciclo
+    split/join. Usa __slots__ para que los mensajes grandes ocupen poca memoria.
+
+    Los campos que leen o escriben rutas de componentes (core.field_path) se
+    separan en componentes sólo cuando se usan y se guardan en components_cache.
+    """
+    __slots__ = ('_name', '_raw', '_fields', '_components')
+
+    def __init__(self, fields=None, raw=None):
+        if fields is not None:
+            self._fields = fields
+            self._raw = None
+            self._name = None
+        else:
+            self._fields = None
+            self._raw = raw
+            self._name = raw.partition('|')[0]
+        self._components = None
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = self._raw.split('|')
+            self._raw = None
+        return self._fields
+
+    @fields.setter
+    def fields(self, value):
+        self._fields = value
+        self._raw = None
+
+    @property
+    def name(self):
+        fields = self._fields
+        return fields[0] if fields is not None else self._name
+
+    @property
+    def components_cache(self):
+        """Caché {índice de campo: (texto, componentes)} usada por FieldPath."""
+        if self._components is None:
+            self._components = {}
+        return self._components
+
+    @property
+    def is_split(self):
+        """True si el segmento ya fue separado en campos."""
+        return self._fields is not None
+
+    def to_line(self):
+        """Segmento serializado; el texto original si nunca se separó."""
+        if self._fields is None:
+            return self._raw
+        return '|'.join(self._fields)
+
+    def __repr__(self):
+        return f"HL7Segment({self.to_line()!r})"
+
+
+class HL7Message:
+    """
+    Mensaje HL7 con un índice identificador de segmento -> posiciones.
+
+    El índice se construye en la primera búsqueda y se mantiene al agregar,
+    eliminar o renombrar segmentos (los cambios estructurales lo invalidan y se
+    reconstruye una sola vez en la siguiente búsqueda), de modo que las
+    transformaciones localizan su segmento objetivo sin recorrer el mensaje.
+    Las transformaciones reproducen exactamente la semántica de las funciones
+    equivalentes de core.hl7_parser, que trabajan sobre listas de campos.
+
+    Si se modifica directamente el identificador de un segmento (seg.fields[0]),
+    debe llamarse a reindex() para que el índice no quede desactualizado.
+    """
+    __slots__ = ('segments', '_index')
+
+    def __init__(self, segments=None):
+        self.segments = segments if segments is not None else []
+        self._index = None
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Crea un mensaje a partir de segmentos en texto (sin terminador), sin
+        separarlos en campos hasta que una regla los necesite.
+        """
+        return cls([HL7Segment(raw=line) for line in lines])
+
+    @classmethod
+    def from_text(cls, text):
+        """Crea un mensaje a partir de su texto completo (segmentos separados por CR/LF)."""
+        return cls.from_lines([line for line in (raw.strip() for raw in _SEGMENT_SPLIT.split(text)) if line])
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Crea un mensaje a partir de una lista de segmentos (listas de campos)."""
+        return cls([HL7Segment(fields) for fields in segments])
+
+    def to_segments(self):
+        """Devuelve el mensaje como lista de segmentos (listas de campos)."""
+        return [seg.fields for seg in self.segments]
+
+    def lines(self):
+        """Genera cada segmento serializado, sin terminador."""
+        for seg in self.segments:
+            yield seg.to_line()
+
+    def to_text(self, terminator='\r'):
+        """Mensaje serializado con el terminador de segmento indicado (CR por defecto)."""
+        return ''.join(line + terminator for line in self.lines())
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    # Índice
+
+    def reindex(self):
+        """Invalida el índice; se reconstruye en la siguiente búsqueda."""
+        self._index = None
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = {}
+            for pos, seg in enumerate(self.segments):
+                fields = seg._fields
+                name = seg._name if fields is None else fields[0]
+                positions = index.get(name)
+                if positions is None:
+                    index[name] = [pos]
+                else:
+                    positions.append(pos)
+            self._index = index
+        return index
+
+    def positions(self, name):
+        """Posiciones (ordenadas) de los segmentos con ese identificador."""
+        return self._get_index().get(name, ())
+
+    def find(self, name):
+        """Primer segmento con ese identificador, o None."""
+        positions = self._get_index().get(name)
+        return self.segments[positions[0]] if positions else None
+
+    def find_all(self, name):
+        """Todos los segmentos con ese identificador, en orden."""
+        segments = self.segments
+        return [segments[pos] for pos in self._get_index().get(name, ())]
+
+    def _check_rename(self, pos, old_name):
+        new_name = self.segments[pos].name
+        if new_name == old_name:
+            return
+        positions = self._index[old_name]
+        positions.remove(pos)
+        if not positions:
+            del self._index[old_name]
+        insort(self._index.setdefault(new_name, []), pos)
+
+    # Transformaciones atómicas
+
+    def add_segment(self, new_segment, position, values=None):
+        segment_fields = [new_segment] + (values if values else [])
+        if position < 0 or position > len(self.segments):
+            position = len(self.segments)
+        self.segments.insert(position, HL7Segment(segment_fields))
+        if self._index is not None and position == len(self.segments) - 1:
+            self._index.setdefault(new_segment, []).append(position)
+        else:
+            self._index = None
+        trace_logger.debug("[RULE] add_segment %s at %s values=%s", new_segment, position, values)
+
+    def delete_segments(self, names):
+        """Elimina en una sola pasada todos los segmentos cuyos identificadores estén en names."""
+        index = self._get_index()
+        names = set(names)
+        if any(name in index for name in names):
+            # Filtrar y reconstruir el índice en la misma pasada
+            segments = []
+            index = {}
+            for seg in self.segments:
+                fields = seg._fields
+                name = seg._name if fields is None else fields[0]
+                if name in names:
+                    continue
+                positions = index.get(name)
+                if positions is None:
+                    index[name] = [len(segments)]
+                else:
+                    positions.append(len(segments))
+                segments.append(seg)
+            self.segments = segments
+            self._index = index
+        for name in names:
+            trace_logger.debug("[RULE] delete_segment %s", name)
+
+    def delete_segment(self, name):
+        self.delete_segments((name,))
+
+    def modify_field(self, segment_name, field_index, new_value):
+        positions = self._get_index().get(segment_name)
+        if positions:
+            pos = positions[0]
+            seg = self.segments[pos].fields
+            if 0 <= field_index < len(seg):
+                old = seg[field_index]
+                seg[field_index] = new_value
+                trace_logger.debug("[RULE] modify_field %s.%s '%s' -> '%s'", segment_name, field_index, old, new_value)
+                if field_index == 0:
+                    self._check_rename(pos, segment_name)
+
+    def reorder_fields(self, segment_name, new_order):
+        positions = self._get_index().get(segment_name)
+        if positions:
+            pos = positions[0]
+            seg = self.segments[pos].fields
+            max_idx = max(new_order)
+            if len(seg) <= max_idx:
+                seg.extend([''] * (max_idx - len(seg) + 1))
+            seg[:] = [seg[i] for i in new_order]
+            trace_logger.debug("[RULE] reorder_fields %s order=%s", segment_name, new_order)
+            self._check_rename(pos, segment_name)
+
+    def copy_value(self, source_segment, source_field, dest_segment, dest_field):
+        source_val = None
+        for pos in self._get_index().get(source_segment, ()):
+            seg = self.segments[pos].fields
+            if 0 <= source_field < len(seg):
+                source_val = seg[source_field]
+                break
+        if source_val is not None:
+            positions = self._get_index().get(dest_segment)
+            if positions:
+                pos = positions[0]
+                seg = self.segments[pos].fields
+                while len(seg) <= dest_field:
+                    seg.append('')
+                seg[dest_field] = source_val
+                trace_logger.debug("[RULE] copy_value %s.%s -> %s.%s '%s'",
+                                   source_segment, source_field, dest_segment, dest_field, source_val)
+                self._check_rename(pos, dest_segment)
+
+    def agregar_campos(self, segment_name, new_fields, start_index=None):
+        positions = self._get_index().get(segment_name)
+        if positions:
+            pos = positions[0]
+            seg = self.segments[pos].fields
+            if start_index is None or start_index >= len(seg):
+                seg.extend(new_fields)
+                trace_logger.debug("[RULE] agregar_campos %s append %s", segment_name, new_fields)
+            else:
+                for i, f in enumerate(new_fields):
+                    seg.insert(start_index + i, f)
+                trace_logger.debug("[RULE] agregar_campos %s at %s %s", segment_name, start_index, new_fields)
+                self._check_rename(pos, segment_name)
+
+    def evaluate_condition(self, cond):
+        idx = cond['field_index']
+        for pos in self._get_index().get(cond['segment'], ()):
+            seg = self.segments[pos].fields
+            if 0 <= idx < len(seg):
+                res = seg[idx] == cond['value']
+                trace_logger.debug("[COND] %s.%s == '%s' -> %s", cond['segment'], idx, cond['value'], res)
+                return res
+        return False
+
+    # Rutas de campo (core.field_path)
+
+    def _first_segment(self, name):
+        positions = self._get_index().get(name)
+        return self.segments[positions[0]] if positions else None
+
+    def get_path(self, path):
+        """Valor de una FieldPath en el primer segmento de su tipo (None si no hay segmento)."""
+        seg = self._first_segment(path.segment)
+        if seg is None:
+            return None
+        return path.read(seg.fields, seg.components_cache)
+
+    def set_path(self, path, value):
+        seg = self._first_segment(path.segment)
+        if seg is not None:
+            fields = seg.fields
+            old = path.read(fields, seg.components_cache)
+            path.write(fields, value, seg.components_cache)
+            trace_logger.debug("[RULE] modify_field %s '%s' -> '%s'", path.text, old, value)
+
+    def copy_path(self, source, dest):
+        value = self.get_path(source)
+        if value is not None:
+            seg = self._first_segment(dest.segment)
+            if seg is not None:
+                dest.write(seg.fields, value, seg.components_cache)
+                trace_logger.debug("[RULE] copy_value %s -> %s '%s'", source.text, dest.text, value)
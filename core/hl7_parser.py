@@ -1,26 +1,54 @@
+import time
 import logging
 
+from core.hl7_message import HL7Message
+from core.field_path import parse_path
+from core.conditions import compile_condition, is_legacy_condition
+from core.log_setup import trace_logger
+from core.writer import get_writer
+from core.metrics import METRICS, stage_start, stage_end
+
+
 def parse_hl7_file(file_path):
     """
     Lee un archivo HL7 y lo separa en segmentos y campos.
     Returns: list de segmentos (listas de campos).
     """
+    t0 = stage_start()
     segments = []
     with open(file_path, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
             if line:
                 segments.append(line.split('|'))
+    stage_end(t0, 'parse')
     return segments
 
 
+def parse_hl7_message(file_path, lazy=True):
+    """
+    Lee un archivo HL7 como HL7Message (segmentos indexados por identificador).
+
+    En modo lazy cada segmento se conserva como texto y sólo se separa en campos
+    si una regla lo lee o lo modifica; los segmentos intactos se escriben tal cual.
+    """
+    if not lazy:
+        return HL7Message.from_segments(parse_hl7_file(file_path))
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return HL7Message.from_lines([line for line in (raw.strip() for raw in f) if line])
+
+
 def write_hl7_file(segments, output_path):
     """
-    Escribe segmentos de vuelta a un archivo HL7.
+    Escribe segmentos (lista de campos o HL7Message) de vuelta a un archivo HL7,
+    de forma atómica y con el terminador de segmento de core.writer.
     """
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for seg in segments:
-            f.write('|'.join(seg) + '\n')
+    t0 = stage_start()
+    if not isinstance(segments, HL7Message):
+        segments = HL7Message.from_segments(segments)
+    with get_writer().open_file(output_path) as writer:
+        writer.write(segments)
+    stage_end(t0, 'write')
     logging.info(f"Archivo HL7 escrito en: {output_path}")
 
 # Transformaciones atómicas
@@ -30,7 +58,7 @@ def add_segment(segments, new_segment, position, values=None):
     if position < 0 or position > len(segments):
         position = len(segments)
     segments.insert(position, segment_fields)
-    logging.info(f"[RULE] add_segment {new_segment} at {position} values={values}")
+    trace_logger.debug("[RULE] add_segment %s at %s values=%s", new_segment, position, values)
     return segments
 
 
@@ -40,7 +68,7 @@ def modify_field(segments, segment_name, field_index, new_value):
             if 0 <= field_index < len(seg):
                 old = seg[field_index]
                 seg[field_index] = new_value
-                logging.info(f"[RULE] modify_field {segment_name}.{field_index} '{old}' -> '{new_value}'")
+                trace_logger.debug("[RULE] modify_field %s.%s '%s' -> '%s'", segment_name, field_index, old, new_value)
             break
     return segments
 
@@ -52,7 +80,7 @@ def reorder_fields(segments, segment_name, new_order):
             if len(seg) <= max_idx:
                 seg.extend([''] * (max_idx - len(seg) + 1))
             seg[:] = [seg[i] for i in new_order]
-            logging.info(f"[RULE] reorder_fields {segment_name} order={new_order}")
+            trace_logger.debug("[RULE] reorder_fields %s order=%s", segment_name, new_order)
             break
     return segments
 
@@ -69,7 +97,8 @@ def copy_value(segments, source_segment, source_field, dest_segment, dest_field)
                 while len(seg) <= dest_field:
                     seg.append('')
                 seg[dest_field] = source_val
-                logging.info(f"[RULE] copy_value {source_segment}.{source_field} -> {dest_segment}.{dest_field} '{source_val}'")
+                trace_logger.debug("[RULE] copy_value %s.%s -> %s.%s '%s'",
+                                   source_segment, source_field, dest_segment, dest_field, source_val)
                 break
     return segments
 
@@ -79,23 +108,57 @@ def agregar_campos(segments, segment_name, new_fields, start_index=None):
         if seg[0] == segment_name:
             if start_index is None or start_index >= len(seg):
                 seg.extend(new_fields)
-                logging.info(f"[RULE] agregar_campos {segment_name} append {new_fields}")
+                trace_logger.debug("[RULE] agregar_campos %s append %s", segment_name, new_fields)
             else:
                 for i, f in enumerate(new_fields):
                     seg.insert(start_index + i, f)
-                logging.info(f"[RULE] agregar_campos {segment_name} at {start_index} {new_fields}")
+                trace_logger.debug("[RULE] agregar_campos %s at %s %s", segment_name, start_index, new_fields)
             break
     return segments
 
+
+def _first_segment(segments, name):
+    for seg in segments:
+        if seg[0] == name:
+            return seg
+    return None
+
+
+def modify_path(segments, path, new_value):
+    """modify_field con ruta de componente (ej. 'PID.5.1'); ver core.field_path."""
+    path = parse_path(path)
+    seg = _first_segment(segments, path.segment)
+    if seg is not None:
+        old = path.read(seg)
+        path.write(seg, new_value)
+        trace_logger.debug("[RULE] modify_field %s '%s' -> '%s'", path.text, old, new_value)
+    return segments
+
+
+def copy_path(segments, source_path, dest_path):
+    """copy_value entre rutas de componente (ej. 'PID.3[2].1' -> 'ZPI.2.1')."""
+    source, dest = parse_path(source_path), parse_path(dest_path)
+    seg = _first_segment(segments, source.segment)
+    if seg is not None:
+        value = source.read(seg)
+        seg = _first_segment(segments, dest.segment)
+        if seg is not None:
+            dest.write(seg, value)
+            trace_logger.debug("[RULE] copy_value %s -> %s '%s'", source.text, dest.text, value)
+    return segments
+
 # Condición y orquestación
 
 def _evaluate_condition(segments, cond):
+    if not is_legacy_condition(cond):
+        # Operadores, rutas y grupos: mismo evaluador que el plan compilado
+        return compile_condition(cond)(HL7Message.from_segments(segments))
     for seg in segments:
         if seg[0] == cond['segment']:
             idx = cond['field_index']
             if 0 <= idx < len(seg):
                 res = seg[idx] == cond['value']
-                logging.info(f"[COND] {cond['segment']}.{idx} == '{cond['value']}' -> {res}")
+                trace_logger.debug("[COND] %s.%s == '%s' -> %s", cond['segment'], idx, cond['value'], res)
                 return res
     return False
 
@@ -104,13 +167,17 @@ def _apply_single_rule(segments, rule):
     action = rule.get('action')
     if action == 'delete_segment':
         segments = [s for s in segments if s[0] != rule.get('segment')]
-        logging.info(f"[RULE] delete_segment {rule.get('segment')}")
+        trace_logger.debug("[RULE] delete_segment %s", rule.get('segment'))
     elif action == 'add_segment':
         segments = add_segment(segments, rule.get('new_segment'), rule.get('position', len(segments)), rule.get('values', []))
+    elif action == 'modify_field' and 'path' in rule:
+        segments = modify_path(segments, rule.get('path'), rule.get('new_value'))
     elif action == 'modify_field':
         segments = modify_field(segments, rule.get('segment'), rule.get('field_index'), rule.get('new_value'))
     elif action == 'reorder_fields':
         segments = reorder_fields(segments, rule.get('segment'), rule.get('new_order'))
+    elif action == 'copy_value' and 'source_path' in rule:
+        segments = copy_path(segments, rule.get('source_path'), rule.get('dest_path'))
     elif action == 'copy_value':
         segments = copy_value(segments, rule.get('source_segment'), rule.get('source_field'), rule.get('dest_segment'), rule.get('dest_field'))
     elif action == 'agregar_campos':
@@ -121,6 +188,12 @@ def _apply_single_rule(segments, rule):
 
 
 def apply_transformations(segments, transformations):
+    if METRICS.enabled:
+        return _apply_measured(segments, transformations)
+    return _apply_rules(segments, transformations)
+
+
+def _apply_rules(segments, transformations):
     for rule in transformations:
         cond = rule.get('condition')
         if cond:
@@ -130,4 +203,22 @@ def apply_transformations(segments, transformations):
                 segments = _apply_single_rule(segments, act)
         else:
             segments = _apply_single_rule(segments, rule)
-    return segments
\ No newline at end of file
+    return segments
+
+def _apply_measured(segments, transformations):
+    """
+    apply_transformations con métricas: cuenta el mensaje y, en uno de cada
+    METRICS.rule_sample_every, mide la etapa 'transform' y cada regla.
+    """
+    METRICS.inc('hl7_messages_total', ('-', 'ok'))
+    if not METRICS.sample_rules():
+        return _apply_rules(segments, transformations)
+    perf = time.perf_counter
+    t0 = perf()
+    for rule in transformations:
+        t1 = perf()
+        segments = _apply_rules(segments, (rule,))
+        action = 'conditional' if rule.get('condition') else rule.get('action') or '-'
+        METRICS.observe('hl7_rule_seconds', ('-', action), perf() - t1)
+    METRICS.observe('hl7_stage_seconds', ('transform', '-'), perf() - t0)
+    return segments
@@ -0,0 +1,212 @@
+import logging
+import os
+import time
+
+from core.hl7_message import HL7Message
+from core.log_setup import log_message
+from core.writer import get_writer
+from core.metrics import METRICS
+from core.profiling import PROFILER
+
+# Segmentos de envoltura de lotes (file/batch header y trailer)
+BATCH_SEGMENTS = frozenset(('FHS', 'BHS', 'BTS', 'FTS'))
+
+READ_BUFFER_SIZE = 1 << 20
+
+
+def is_batch_envelope(message):
+    """True si el mensaje es un segmento de envoltura de lote (FHS/BHS/BTS/FTS)."""
+    return len(message) == 1 and message.segments[0].name in BATCH_SEGMENTS
+
+
+def iter_hl7_messages(file_path):
+    """
+    Lee un archivo HL7 en streaming y genera un HL7Message por cada mensaje.
+
+    Cada MSH inicia un mensaje nuevo. Los segmentos FHS/BHS/BTS/FTS se generan
+    como mensajes de un solo segmento (ver is_batch_envelope) para poder
+    reescribirlos en su posición. Sólo se mantiene en memoria el mensaje en curso,
+    por lo que la memoria no depende del tamaño del archivo.
+    """
+    lines = []
+    with open(file_path, 'r', encoding='utf-8', buffering=READ_BUFFER_SIZE) as f:
+        for raw in f:
+            line = raw.strip()
+            if not line:
+                continue
+            name = line.partition('|')[0]
+            if name == 'MSH' or name in BATCH_SEGMENTS:
+                if lines:
+                    yield HL7Message.from_lines(lines)
+                    lines = []
+                if name != 'MSH':
+                    yield HL7Message.from_lines([line])
+                    continue
+            lines.append(line)
+    if lines:
+        yield HL7Message.from_lines(lines)
+
+
+def apply_plan(plan, message):
+    """
+    Aplica a message el plan indicado o, si el plan enruta, el que corresponda
+    al mensaje. Devuelve el plan aplicado (None si ninguno).
+    """
+    selected = plan.select(message) if plan is not None else None
+    if PROFILER.enabled and PROFILER.sample():
+        PROFILER.run(selected, message)
+        if METRICS.enabled:
+            METRICS.inc('hl7_messages_total', ((selected.name or '-') if selected is not None else '-', 'ok'))
+    elif METRICS.enabled:
+        _apply_measured(selected, message)
+    elif selected is not None:
+        selected.apply(message)
+    return selected
+
+
+def _apply_measured(plan, message):
+    """
+    apply_plan con métricas: cuenta el mensaje y, en uno de cada
+    METRICS.rule_sample_every, mide la etapa 'transform' y cada regla.
+    """
+    config = (plan.name or '-') if plan is not None else '-'
+    METRICS.inc('hl7_messages_total', (config, 'ok'))
+    if plan is None:
+        return
+    if not METRICS.sample_rules():
+        plan.apply(message)
+        return
+    t0 = time.perf_counter()
+    plan.apply_timed(message, METRICS.rule_observer(config))
+    METRICS.observe('hl7_stage_seconds', ('transform', config), time.perf_counter() - t0)
+
+
+def _timed_messages(messages, stats):
+    """Recorre el generador de mensajes acumulando en stats['parse'] el tiempo de lectura."""
+    perf = time.perf_counter
+    it = iter(messages)
+    while True:
+        t0 = perf()
+        message = next(it, None)
+        stats['parse'] = stats.get('parse', 0.0) + perf() - t0
+        if message is None:
+            return
+        yield message
+
+
+def transform_file(input_path, output_path, plan=None, stats=None, dedup=None, output=None, journal=None):
+    """
+    Transforma un archivo HL7 (uno o varios mensajes, con o sin envoltura de
+    lote) mensaje a mensaje.
+
+    La salida se escribe con output (core.writer.OutputWriter; por defecto el
+    del proceso): en un temporal que se publica sobre output_path al terminar,
+    de modo que puede ser el mismo archivo de entrada. Si output agrupa lotes,
+    los mensajes se agregan al lote de la carpeta de output_path (sin la
+    envoltura original).
+
+    Si se pasa un diccionario stats, se acumulan en él los segundos dedicados a
+    cada etapa ('parse', 'transform', 'write').
+
+    Con dedup (core.dedup.DedupCache) se omiten los mensajes ya vistos; si todos
+    los mensajes del archivo son duplicados no se genera salida.
+
+    Con journal (core.journal.Journal) se registra 'transformed' cuando la
+    salida está completa, justo antes de publicarla.
+
+    Returns:
+        int: número de mensajes HL7 procesados (sin contar la envoltura).
+    """
+    output = output or get_writer()
+    if METRICS.enabled:
+        return _transform_measured(input_path, output_path, plan, stats, dedup, output, journal)
+    if output.batching:
+        return _transform_to_batch(input_path, output.batch(os.path.dirname(output_path)), plan, stats, dedup)
+    return _transform_to_file(input_path, output_path, plan, stats, dedup, output, journal)
+
+
+def _transform_to_file(input_path, output_path, plan, stats, dedup, output, journal=None):
+    """transform_file con salida a un archivo (core.writer.AtomicFileWriter)."""
+    source = os.path.basename(input_path)
+    perf = time.perf_counter
+    count = 0
+    duplicates = 0
+    with output.open_file(output_path) as writer:
+        if stats is None:
+            for message in iter_hl7_messages(input_path):
+                if not is_batch_envelope(message):
+                    if dedup is not None and dedup.is_duplicate(message, source):
+                        duplicates += 1
+                        continue
+                    t0 = perf()
+                    applied = apply_plan(plan, message)
+                    log_message(message, source, applied, perf() - t0)
+                    count += 1
+                writer.write(message)
+        else:
+            for message in _timed_messages(iter_hl7_messages(input_path), stats):
+                if not is_batch_envelope(message):
+                    if dedup is not None and dedup.is_duplicate(message, source):
+                        duplicates += 1
+                        continue
+                    t0 = perf()
+                    applied = apply_plan(plan, message)
+                    elapsed = perf() - t0
+                    stats['transform'] = stats.get('transform', 0.0) + elapsed
+                    log_message(message, source, applied, elapsed)
+                    count += 1
+                t0 = perf()
+                writer.write(message)
+                stats['write'] = stats.get('write', 0.0) + perf() - t0
+        if duplicates and not count:
+            writer.abort()
+            logging.info(f"Archivo HL7 {input_path} omitido: {duplicates} mensajes duplicados")
+            return 0
+        if journal is not None:
+            journal.record(input_path, 'transformed', output_path)
+    if duplicates:
+        logging.info(f"Archivo HL7 escrito en: {output_path} ({count} mensajes, {duplicates} duplicados omitidos)")
+    else:
+        logging.info(f"Archivo HL7 escrito en: {output_path} ({count} mensajes)")
+    return count
+
+
+def _transform_measured(input_path, output_path, plan, stats, dedup, output, journal):
+    """transform_file con métricas: registra por archivo las etapas 'parse' y 'write'."""
+    file_stats = {}
+    try:
+        if output.batching:
+            return _transform_to_batch(input_path, output.batch(os.path.dirname(output_path)), plan, file_stats, dedup)
+        return _transform_to_file(input_path, output_path, plan, file_stats, dedup, output, journal)
+    finally:
+        for stage in ('parse', 'write'):
+            if stage in file_stats:
+                METRICS.observe('hl7_stage_seconds', (stage, '-'), file_stats[stage])
+        if stats is not None:
+            for stage, seconds in file_stats.items():
+                stats[stage] = stats.get(stage, 0.0) + seconds
+
+
+def _transform_to_batch(input_path, batch, plan, stats, dedup):
+    """transform_file con salida agrupada en lotes (core.writer.BatchFileWriter)."""
+    source = os.path.basename(input_path)
+    perf = time.perf_counter
+    count = 0
+    messages = iter_hl7_messages(input_path) if stats is None else _timed_messages(iter_hl7_messages(input_path), stats)
+    for message in messages:
+        if is_batch_envelope(message):
+            continue
+        if dedup is not None and dedup.is_duplicate(message, source):
+            continue
+        t0 = perf()
+        applied = apply_plan(plan, message)
+        elapsed = perf() - t0
+        log_message(message, source, applied, elapsed)
+        t1 = perf()
+        batch.write(message)
+        if stats is not None:
+            stats['transform'] = stats.get('transform', 0.0) + elapsed
+            stats['write'] = stats.get('write', 0.0) + perf() - t1
+        count += 1
+    logging.info(f"Archivo HL7 {input_path}: {count} mensajes agregados al lote de {batch.output_dir}")
+    return count
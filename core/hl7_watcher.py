@@ -25,21 +25,26 @@ class HL7Watcher:
         self.observer = Observer()
 
     def start(self):
-        # Procesar existentes
-        try:
-            for fname in os.listdir(self.directory):
-                full = os.path.join(self.directory, fname)
-                if os.path.isfile(full) and full.lower().endswith('.hl7'):
-                    logging.info(f"Procesando existente al inicio: {full}")
-                    self.callback(full)
-        except Exception as e:
-            logging.error(f"Error procesando existentes en {self.directory}: {e}")
-
-        # Iniciar watcher
+        # Iniciar watcher antes del escaneo para no perder archivos que lleguen
+        # entre ambos; los duplicados los descarta la capa de ingesta.
         self.observer.schedule(self.event_handler, self.directory, recursive=False)
         self.observer.start()
         logging.info(f"Iniciada monitorización en: {self.directory}")
 
+        # Procesar existentes: una sola lectura del directorio (scandir ya sabe qué
+        # entradas son archivos, sin un stat por archivo) y una línea de log en total
+        found = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith('.hl7') and entry.is_file():
+                        self.callback(entry.path)
+                        found += 1
+        except Exception as e:
+            logging.error(f"Error procesando existentes en {self.directory}: {e}")
+        if found:
+            logging.info(f"{found} archivos existentes al inicio en {self.directory}")
+
     def stop(self):
         self.observer.stop()
         self.observer.join()
@@ -0,0 +1,91 @@
+import os
+import time
+import logging
+import threading
+
+
+class IngestionQueue:
+    """
+    Capa de ingesta entre HL7Watcher y el procesamiento.
+
+    - Deduplica: una ruta pendiente o en proceso no se vuelve a encolar, de modo
+      que el escaneo inicial y los eventos created/moved del mismo archivo se
+      fusionan en un único procesamiento.
+    - Espera a que el archivo sea estable: sólo se entrega cuando su tamaño y
+      mtime no han cambiado durante settle_time segundos (el emisor terminó de
+      escribirlo).
+    - Entrega las rutas listas a submit (por ejemplo ProcessingPool.submit) y
+      las mantiene como "en proceso" hasta que se llama a done(path).
+    """
+    def __init__(self, submit, settle_time=1.0, poll_interval=0.25):
+        self._submit = submit
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self._pending = {}      # ruta -> (tamaño, mtime, estable desde)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="hl7-ingestion", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+
+    def offer(self, path):
+        """
+        Registra una ruta detectada. Devuelve False si ya estaba pendiente o en
+        proceso (evento duplicado).
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._pending or path in self._in_flight:
+                return False
+            self._pending[path] = (None, None, 0.0)
+        return True
+
+    def done(self, path):
+        """Marca una ruta como terminada; a partir de aquí puede volver a aceptarse."""
+        with self._lock:
+            self._in_flight.discard(os.path.abspath(path))
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def _collect_ready(self):
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (size, mtime, since) in list(self._pending.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Desapareció antes de procesarse (movido o eliminado por otro proceso)
+                    del self._pending[path]
+                    continue
+                if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                    self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+                elif now - since >= self.settle_time:
+                    del self._pending[path]
+                    self._in_flight.add(path)
+                    ready.append(path)
+        return ready
+
+    def _loop(self):
+        while not self._stopping.wait(self.poll_interval):
+            for path in self._collect_ready():
+                # submit puede bloquear si la cola del pool está llena (backpressure)
+                if not self._submit(path):
+                    self.done(path)
+                    logging.info(f"Ingesta: {path} no se encoló (procesamiento detenido).")
@@ -0,0 +1,239 @@
+import os
+import glob
+import time
+import logging
+import threading
+
+# Diario de procesamiento (write-ahead log). Cada proceso agrega a su propio
+# archivo <journal_dir>/journal_<pid>_<inicio>.log una línea por cambio de
+# estado de un archivo de entrada:
+#
+#   <time_ns>\t<estado>\t<ruta de entrada>\t<salida>
+#
+#   claimed      un worker tomó el archivo (antes de leerlo)
+#   transformed  la salida está completa en su temporal (aún sin publicar)
+#   written      la salida se publicó (o se envió por MLLP)
+#   backedup     el original se retiró a backups: el archivo está terminado
+#   failed       el procesamiento falló; el original sigue en la entrada
+#
+# Cada cambio es una sola escritura al final del archivo (sin fsync salvo que se
+# pida), por lo que sobrevive a la caída del proceso. Al arrancar, el monitor
+# llama a replay_journal: lo que quedó en claimed/transformed/failed se deshace
+# (temporales eliminados, el original se reprocesa) y lo que quedó en written se
+# termina (el original va a backups sin reprocesarse), de modo que cada archivo
+# produce su salida una sola vez.
+
+STATES = ('claimed', 'transformed', 'written', 'backedup', 'failed')
+TERMINAL_STATES = frozenset(('backedup',))
+ROLLBACK_STATES = frozenset(('claimed', 'transformed', 'failed'))
+
+# Registros tras los que el diario se reescribe sólo con los archivos en curso
+COMPACT_EVERY = 10000
+
+
+class JournalSettings:
+    """
+    Parámetros del diario. Es un objeto simple para que pueda enviarse a los
+    workers en modo proceso; cada proceso escribe su propio archivo (ver
+    get_journal).
+    """
+    __slots__ = ('journal_dir', 'fsync', 'compact_every')
+
+    def __init__(self, journal_dir, fsync=False, compact_every=COMPACT_EVERY):
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.compact_every = compact_every
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def cache_key(self):
+        return self.__getstate__()
+
+
+def _format(path, state, output):
+    return f"{time.time_ns()}\t{state}\t{path}\t{output or ''}\n"
+
+
+class Journal:
+    """
+    Diario de un proceso. Mantiene en memoria el claimed y el último registro
+    de cada archivo en curso; cada compact_every registros reescribe el diario
+    sólo con ellos (temporal + os.replace), así que su tamaño depende de los
+    archivos en curso y no del total procesado.
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        os.makedirs(settings.journal_dir, exist_ok=True)
+        self.path = os.path.join(settings.journal_dir, f"journal_{os.getpid()}_{time.time_ns()}.log")
+        self.records = 0
+        self._live = {}
+        self._since_compact = 0
+        self._lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def record(self, path, state, output=None):
+        """Registra el nuevo estado de un archivo de entrada."""
+        line = _format(path, state, output)
+        with self._lock:
+            os.write(self._fd, line.encode('utf-8'))
+            if self.settings.fsync:
+                os.fsync(self._fd)
+            if state in TERMINAL_STATES:
+                self._live.pop(path, None)
+            elif state == 'claimed' or path not in self._live:
+                self._live[path] = (line, line)
+            else:
+                # Se conserva también el claimed: replay_journal necesita su instante
+                self._live[path] = (self._live[path][0], line)
+            self.records += 1
+            self._since_compact += 1
+            if self._since_compact >= self.settings.compact_every:
+                self._compact()
+
+    def _compact(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8', newline='') as f:
+            f.write(''.join(claim if claim is line else claim + line for claim, line in self._live.values()))
+            f.flush()
+            if self.settings.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        self._since_compact = 0
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    @property
+    def in_flight(self):
+        return len(self._live)
+
+    def close(self):
+        """Cierra el diario; si no queda nada en curso se elimina el archivo."""
+        with self._lock:
+            if self._fd is None:
+                return
+            os.close(self._fd)
+            self._fd = None
+            if not self._live:
+                os.remove(self.path)
+
+
+def read_journal(journal_dir):
+    """
+    Último registro de cada archivo en los diarios de journal_dir.
+
+    Returns:
+        (dict, list): {ruta: (time_ns, estado, salida, time_ns del último
+        claimed)} y los diarios leídos.
+    """
+    entries = {}
+    files = sorted(glob.glob(os.path.join(journal_dir, 'journal_*.log')))
+    for journal_file in files:
+        with open(journal_file, 'r', encoding='utf-8', newline='') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                # La última línea puede estar incompleta si el proceso cayó al escribirla
+                if not line.endswith('\n') or len(parts) != 4 or parts[1] not in STATES:
+                    continue
+                ts, state, path, output = int(parts[0]), parts[1], parts[2], parts[3]
+                current = entries.get(path)
+                if current is None or ts >= current[0]:
+                    claimed = ts if state == 'claimed' or current is None else current[3]
+                    entries[path] = (ts, state, output, claimed)
+                elif state == 'claimed' and ts > current[3]:
+                    entries[path] = current[:3] + (ts,)
+    return entries, files
+
+
+def _remove_temporaries(output):
+    """Elimina los temporales de una salida sin publicar (ver core.writer._temp_path)."""
+    if not output or output.startswith('mllp://'):
+        return
+    directory, name = os.path.split(output)
+    for tmp in glob.glob(os.path.join(glob.escape(directory), f".{glob.escape(name)}.*.tmp")):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def replay_journal(settings, backup_dir=None, backup=None, dedup=None):
+    """
+    Completa o deshace el trabajo que quedó a medias en los diarios anteriores
+    (llamar antes de arrancar los workers y el watcher).
+
+    - claimed/transformed/failed: se eliminan los temporales de la salida y,
+      con dedup (core.dedup.DedupSettings), las huellas que registró ese
+      intento, para que el original se reprocese completo.
+    - written: la salida ya se publicó; el original se retira a backup_dir sin
+      reprocesarlo.
+
+    Si el proceso vuelve a caer durante la recuperación, repetirla da el mismo
+    resultado: los diarios sólo se eliminan al terminar.
+
+    Returns:
+        (int, int): archivos deshechos y archivos terminados.
+    """
+    from core.backup import backup_file
+    from core.dedup import get_dedup
+
+    if not os.path.isdir(settings.journal_dir):
+        return 0, 0
+    entries, files = read_journal(settings.journal_dir)
+    cache = get_dedup(dedup)
+    rolled_back = finished = 0
+    for path, (ts, state, output, claimed) in entries.items():
+        if state in ROLLBACK_STATES:
+            _remove_temporaries(output)
+            if cache is not None and os.path.exists(path):
+                cache.forget_file(path, since=claimed / 1e9)
+            rolled_back += 1
+            logging.info(f"[JOURNAL] {path} quedó en '{state}': se reprocesará")
+        elif state == 'written':
+            if backup_dir and os.path.exists(path):
+                backup_file(path, backup_dir, backup)
+            finished += 1
+            logging.info(f"[JOURNAL] {path} ya tenía salida ({output}): retirado a backups sin reprocesar")
+    for journal_file in files:
+        os.remove(journal_file)
+    if rolled_back or finished:
+        logging.info(f"[JOURNAL] Recuperación: {rolled_back} archivos a reprocesar, {finished} terminados")
+    return rolled_back, finished
+
+
+# Un diario por configuración y proceso (los workers en modo proceso crean el suyo)
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(settings):
+    """Devuelve el Journal de este proceso para unos JournalSettings (None si no hay)."""
+    if settings is None:
+        return None
+    key = settings.cache_key()
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            if not _journals:
+                # También al terminar un worker de ProcessPoolExecutor (no ejecuta atexit)
+                from multiprocessing import util
+                util.Finalize(None, close_journals, exitpriority=10)
+            journal = Journal(settings)
+            _journals[key] = journal
+        return journal
+
+
+def close_journals():
+    """Cierra los diarios de este proceso."""
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
@@ -0,0 +1,111 @@
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOG_DIR = "logs"
+LOG_FILE = "hl7_processor.log"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Traza por regla ([RULE]/[COND]): desactivada por defecto. Los mensajes se
+# registran con argumentos % para que no se formateen si el nivel está apagado.
+trace_logger = logging.getLogger("hl7.trace")
+trace_logger.setLevel(logging.INFO)
+
+# Un registro resumen por mensaje procesado
+summary_logger = logging.getLogger("hl7.summary")
+
+_listeners = []
+_file_handler = None
+_worker_queue = None
+
+
+def set_trace(enabled):
+    """Activa o desactiva la traza por regla."""
+    trace_logger.setLevel(logging.DEBUG if enabled else logging.INFO)
+
+
+def setup_logging(log_dir=LOG_DIR, level=logging.INFO, trace=False,
+                  max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+    """
+    Configura el logging de la aplicación:
+      - El root logger sólo encola los registros (QueueHandler); un hilo
+        QueueListener los escribe en disco, fuera del camino de procesamiento.
+      - El archivo rota por tamaño (max_bytes, backup_count copias).
+      - La traza por regla queda apagada salvo trace=True.
+
+    Es idempotente: llamadas posteriores sólo ajustan la traza.
+    """
+    global _file_handler
+    set_trace(trace)
+    if _file_handler is not None:
+        return
+    os.makedirs(log_dir, exist_ok=True)
+    _file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, LOG_FILE), maxBytes=max_bytes, backupCount=backup_count,
+        encoding='utf-8', delay=True)
+    _file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _start_listener(log_queue)
+    atexit.register(shutdown_logging)
+
+
+def _start_listener(log_queue):
+    listener = logging.handlers.QueueListener(log_queue, _file_handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+def shutdown_logging():
+    """Detiene los listeners vaciando antes los registros pendientes."""
+    while _listeners:
+        _listeners.pop().stop()
+    if _file_handler is not None:
+        _file_handler.close()
+
+
+def worker_logging_args():
+    """
+    Devuelve (initializer, initargs) para un ProcessPoolExecutor: los procesos
+    worker envían sus registros por una cola multiproceso al listener del
+    proceso principal en lugar de escribir el archivo por su cuenta.
+    """
+    global _worker_queue
+    if _file_handler is not None and _worker_queue is None:
+        import multiprocessing
+        _worker_queue = multiprocessing.Queue()
+        _start_listener(_worker_queue)
+    return init_worker_logging, (_worker_queue, trace_logger.level, logging.getLogger().level)
+
+
+def init_worker_logging(log_queue, trace_level=logging.INFO, level=logging.INFO):
+    """Initializer de los procesos worker (ver worker_logging_args)."""
+    root = logging.getLogger()
+    # Con fork se heredan los handlers del padre, cuyo listener no existe aquí
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if log_queue is not None:
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    trace_logger.setLevel(trace_level)
+
+
+def log_message(message, source, plan=None, elapsed=0.0, status='ok'):
+    """
+    Registra el resumen de un mensaje procesado en una sola línea clave=valor:
+    control ID (MSH-10), origen, configuración, segmentos, reglas y duración.
+    """
+    if not summary_logger.isEnabledFor(logging.INFO):
+        return
+    msh = message.find('MSH')
+    control_id = msh.fields[9] if msh is not None and len(msh.fields) > 9 else ''
+    summary_logger.info("[MSG] id=%s source=%s config=%s segments=%d rules=%d ms=%.3f status=%s",
+                        control_id, source, getattr(plan, 'name', None) or '-', len(message),
+                        plan.rule_count if plan is not None else 0, elapsed * 1000, status)
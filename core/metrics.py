@@ -0,0 +1,259 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+
+# Métricas del procesamiento en formato de texto de Prometheus. Desactivadas por
+# defecto: mientras METRICS.enabled es False los puntos de medida sólo
+# comprueban ese atributo.
+#
+#   hl7_files_total{status}                   archivos terminados (ok / error)
+#   hl7_messages_total{config,status}         mensajes (ok / duplicate)
+#   hl7_stage_seconds{stage,config}           parse / write / backup / file por archivo;
+#                                             transform por mensaje (muestreada)
+#   hl7_rule_seconds{config,action}           duración de cada regla (muestreada)
+#   hl7_pending_files, hl7_in_flight_files... indicadores registrados con gauge()
+
+# Límites (segundos) de los histogramas
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Se mide la transformación (y cada regla) de uno de cada RULE_SAMPLE_EVERY
+# mensajes: medir todos costaría más que las propias reglas en mensajes cortos
+RULE_SAMPLE_EVERY = 16
+
+_DEFINITIONS = {
+    'hl7_files_total':    ('counter', 'Archivos procesados', ('status',)),
+    'hl7_messages_total': ('counter', 'Mensajes procesados', ('config', 'status')),
+    'hl7_stage_seconds':  ('histogram', 'Duración de cada etapa del procesamiento (transform muestreada)', ('stage', 'config')),
+    'hl7_rule_seconds':   ('histogram', 'Duración de cada regla (muestreada)', ('config', 'action')),
+}
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metrics:
+    """
+    Registro de contadores, histogramas e indicadores de un proceso.
+
+    Los workers en modo proceso acumulan en su propio registro; drain() devuelve
+    lo acumulado desde la última llamada y merge() lo suma al del proceso
+    principal (ver run_collecting).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.rule_sample_every = RULE_SAMPLE_EVERY
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._rule_tick = 0
+        self._lock = threading.Lock()
+
+    def enable(self, rule_sample_every=RULE_SAMPLE_EVERY):
+        self.rule_sample_every = max(1, int(rule_sample_every or RULE_SAMPLE_EVERY))
+        self.enabled = True
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            hist[0][bisect_left(BUCKETS, seconds)] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def gauge(self, name, function, help_text=''):
+        """Registra un indicador cuyo valor se lee (function()) al exportar."""
+        self._gauges[name] = (function, help_text)
+
+    def remove_gauge(self, name):
+        self._gauges.pop(name, None)
+
+    def sample_rules(self):
+        """True para uno de cada rule_sample_every mensajes (sin bloqueo: un desvío ocasional no importa)."""
+        self._rule_tick += 1
+        return self._rule_tick % self.rule_sample_every == 0
+
+    def rule_observer(self, config):
+        """Función observe(acción, segundos) para TransformationPlan.apply_timed."""
+        config = config or '-'
+        return lambda action, seconds: self.observe('hl7_rule_seconds', (config, action), seconds)
+
+    # Agregación entre procesos
+
+    def drain(self):
+        """Devuelve y reinicia lo acumulado (contadores e histogramas)."""
+        with self._lock:
+            delta = (self._counters, self._histograms)
+            self._counters = {}
+            self._histograms = {}
+        return delta
+
+    def merge(self, delta):
+        counters, histograms = delta
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (buckets, total, count) in histograms.items():
+                hist = self._histograms.get(key)
+                if hist is None:
+                    self._histograms[key] = [list(buckets), total, count]
+                else:
+                    hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+                    hist[1] += total
+                    hist[2] += count
+
+    # Exportación
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text, label_names) in _DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (n, labels), value in sorted(counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_format_labels(label_names, labels)} {value}")
+                continue
+            for (n, labels), (buckets, total, count) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, hits in zip(BUCKETS + ('+Inf',), buckets):
+                    cumulative += hits
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_format_labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(label_names, labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(label_names, labels)} {count}")
+        for name, (function, help_text) in sorted(self._gauges.items()):
+            try:
+                value = function()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def run_collecting(handler, path, rule_sample_every=RULE_SAMPLE_EVERY, **kwargs):
+    """
+    Ejecuta handler(path, **kwargs) en un worker de proceso con las métricas
+    activas y devuelve (resultado, métricas acumuladas) para sumarlas en el
+    proceso principal con METRICS.merge.
+    """
+    if not METRICS.enabled:
+        METRICS.enable(rule_sample_every)
+    try:
+        result = handler(path, **kwargs)
+    except Exception:
+        METRICS.drain()   # lo medido en un archivo fallido se descarta
+        raise
+    return result, METRICS.drain()
+
+
+class MetricsServer:
+    """Servidor HTTP local que sirve METRICS.render() en /metrics."""
+    def __init__(self, port, host='127.0.0.1', metrics=METRICS):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass   # sin una línea de log por consulta
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logging.info(f"[METRICS] Métricas en http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsSnapshotWriter:
+    """
+    Escribe METRICS.render() en un archivo cada interval segundos (reemplazo
+    atómico), por ejemplo para el textfile collector de node_exporter.
+    """
+    def __init__(self, path, interval=15.0, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logging.error(f"[METRICS] No se pudo escribir {self.path}: {e}")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+        try:
+            self.write()
+        except OSError as e:
+            logging.error(f"[METRICS] No se pudo escribir {self.path}: {e}")
+
+
+def stage_start():
+    """Instante de inicio de una etapa si las métricas están activas (None si no); ver stage_end."""
+    return time.perf_counter() if METRICS.enabled else None
+
+
+def stage_end(t0, stage, config='-'):
+    if t0 is not None:
+        METRICS.observe('hl7_stage_seconds', (stage, config or '-'), time.perf_counter() - t0)
@@ -0,0 +1,202 @@
+import re
+import time
+import socket
+import asyncio
+import logging
+
+from core.hl7_message import HL7Message
+
+# Marco MLLP: <VT> mensaje <FS><CR>
+START_BLOCK = b'\x0b'
+END_BLOCK = b'\x1c\x0d'
+
+# Límite de tamaño de un mensaje MLLP en lectura
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+def frame(payload):
+    """Envuelve un mensaje (bytes) en el marco MLLP."""
+    return START_BLOCK + payload + END_BLOCK
+
+
+def unframe(data):
+    """Extrae el contenido de un bloque MLLP leído hasta END_BLOCK (descarta basura previa a VT)."""
+    start = data.find(START_BLOCK)
+    return data[start + 1 if start >= 0 else 0:-len(END_BLOCK)]
+
+
+def _msh_field(message, hl7_index, default=''):
+    """Campo de MSH en numeración HL7 (MSH-1 es el separador '|')."""
+    msh = message.find('MSH') if message is not None else None
+    if msh is None:
+        return default
+    fields = msh.fields
+    idx = hl7_index - 1
+    return fields[idx] if 0 < idx < len(fields) else default
+
+
+def build_ack(message, code='AA', text=''):
+    """
+    Construye el ACK (AA) o NAK (AE/AR) para un mensaje recibido, intercambiando
+    emisor y receptor y referenciando su MSH-10.
+    """
+    trigger = _msh_field(message, 9).split('^')
+    trigger = trigger[1] if len(trigger) > 1 else ''
+    msh = [
+        'MSH', _msh_field(message, 2, '^~\\&'),
+        _msh_field(message, 5), _msh_field(message, 6),
+        _msh_field(message, 3), _msh_field(message, 4),
+        time.strftime('%Y%m%d%H%M%S'), '',
+        f"ACK^{trigger}" if trigger else 'ACK',
+        f"ACK{int(time.time() * 1000)}",
+        _msh_field(message, 11, 'P'), _msh_field(message, 12, '2.5'),
+    ]
+    msa = ['MSA', code, _msh_field(message, 10)]
+    if text:
+        msa.append(re.sub(r'[|\r\n]', ' ', text)[:80])
+    return '|'.join(msh) + '\r' + '|'.join(msa) + '\r'
+
+
+def ack_code(ack_text):
+    """Código MSA-1 de un ACK (AA, AE, AR, CA...) o '' si no se encuentra."""
+    for line in re.split(r'\r\n|\r|\n', ack_text):
+        if line.startswith('MSA|'):
+            return line.split('|')[1]
+    return ''
+
+
+class MLLPServer:
+    """
+    Servidor MLLP asíncrono (asyncio) que atiende muchas conexiones concurrentes.
+
+    handler(text) recibe el texto del mensaje y hace el trabajo (transformar,
+    escribir, reenviar). Si se indica executor, el handler se ejecuta en él para
+    no bloquear el event loop con transformaciones costosas; con un
+    ProcessPoolExecutor el handler debe poder serializarse.
+    Por cada mensaje se responde AA si el handler termina, AE si lanza una
+    excepción y AR si el mensaje no contiene MSH.
+    """
+    def __init__(self, host, port, handler, executor=None, encoding='utf-8'):
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.executor = executor
+        self.encoding = encoding
+        self.messages = 0
+        self.errors = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port, limit=MAX_MESSAGE_SIZE
+        )
+        # Con port=0 el sistema asigna uno libre (útil en pruebas)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info(f"[MLLP] Escuchando en {self.host}:{self.port}")
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _process(self, text):
+        if self.executor is None:
+            return self.handler(text)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.handler, text)
+
+    async def _handle_client(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        logging.info(f"[MLLP] Conexión de {peer}")
+        try:
+            while True:
+                try:
+                    data = await reader.readuntil(END_BLOCK)
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    logging.error(f"[MLLP] Mensaje de {peer} supera {MAX_MESSAGE_SIZE} bytes; se cierra la conexión")
+                    break
+                text = unframe(data).decode(self.encoding, errors='replace')
+                message = HL7Message.from_text(text)
+                if message.find('MSH') is None:
+                    ack = build_ack(None, 'AR', 'Mensaje sin segmento MSH')
+                    self.errors += 1
+                else:
+                    try:
+                        await self._process(text)
+                        ack = build_ack(message, 'AA')
+                        self.messages += 1
+                    except Exception as e:
+                        logging.error(f"[MLLP] Error procesando mensaje de {peer}: {e}")
+                        ack = build_ack(message, 'AE', str(e))
+                        self.errors += 1
+                writer.write(frame(ack.encode(self.encoding)))
+                await writer.drain()
+        except ConnectionError as e:
+            logging.warning(f"[MLLP] Conexión con {peer} interrumpida: {e}")
+        finally:
+            writer.close()
+            logging.info(f"[MLLP] Conexión cerrada: {peer}")
+
+
+class MLLPClient:
+    """
+    Cliente MLLP síncrono sobre una conexión TCP persistente: envía mensajes y
+    lee sus ACK. Sirve como emisor de pruebas contra el servidor MLLP.
+    """
+    def __init__(self, host, port, timeout=10.0, encoding='utf-8'):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.encoding = encoding
+        self._sock = None
+        self._buffer = b''
+
+    def connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._buffer = b''
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def send_frame(self, text):
+        """Envía un mensaje sin esperar su ACK."""
+        if self._sock is None:
+            self.connect()
+        self._sock.sendall(frame(text.encode(self.encoding)))
+
+    def read_ack(self):
+        """Lee el siguiente ACK de la conexión (bloquea hasta timeout)."""
+        while END_BLOCK not in self._buffer:
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Conexión cerrada por el receptor antes del ACK")
+            self._buffer += chunk
+        data, _, self._buffer = self._buffer.partition(END_BLOCK)
+        return unframe(data + END_BLOCK).decode(self.encoding, errors='replace')
+
+    def send(self, text):
+        """Envía un mensaje y devuelve el texto de su ACK."""
+        self.send_frame(text)
+        return self.read_ack()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,267 @@
+import os
+import time
+import queue
+import logging
+import threading
+import itertools
+
+from core.hl7_stream import iter_hl7_messages, is_batch_envelope, apply_plan
+from core.mllp import MLLPClient, ack_code
+from core.log_setup import log_message
+
+
+class MLLPRejectedError(Exception):
+    """El receptor rechazó el mensaje (AR/CR) o respondió error tras agotar reintentos."""
+
+
+def parse_target(target):
+    """Convierte 'host:puerto' en (host, puerto)."""
+    host, _, port = target.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Destino MLLP inválido (se espera host:puerto): {target}")
+    return host, int(port)
+
+
+class MLLPSender:
+    """
+    Emisor MLLP hacia un host:puerto con un pool de conexiones persistentes.
+
+    - Cada conexión se reutiliza entre mensajes (sin connect por archivo).
+    - send_many() envía en pipeline: escribe varios mensajes seguidos y después
+      lee sus ACK en orden.
+    - Cada ACK se espera como máximo timeout segundos; los errores de conexión y
+      los AE se reintentan hasta retries veces.
+    - Si el receptor no está disponible tras los reintentos, el mensaje se guarda
+      en spool_dir y un hilo en segundo plano lo reenvía cuando vuelve. Mientras
+      quede algo en el spool, los mensajes nuevos también van al spool para
+      conservar el orden.
+    """
+    def __init__(self, host, port, pool_size=2, timeout=10.0, retries=3, retry_delay=1.0,
+                 spool_dir=None, pipeline=16, encoding='utf-8', flush_interval=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.spool_dir = spool_dir
+        self.pipeline = max(1, pipeline)
+        self.encoding = encoding
+        self.flush_interval = flush_interval
+        self.sent = 0
+        self.spooled = 0
+        self._clients = queue.LifoQueue()
+        for _ in range(max(1, pool_size)):
+            self._clients.put(MLLPClient(host, port, timeout=timeout, encoding=encoding))
+        self._spool_seq = itertools.count()
+        self._spool_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._flusher = None
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            self._recover_spool()
+            self._flusher = threading.Thread(target=self._flush_loop, name="mllp-spool", daemon=True)
+            self._flusher.start()
+
+    # Envío
+
+    def _send_with_retries(self, client, text):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay)
+            try:
+                ack = client.send(text)
+            except (OSError, ConnectionError) as e:
+                client.close()
+                last_error = e
+                logging.warning(f"[MLLP] Envío a {self.host}:{self.port} fallido (intento {attempt + 1}): {e}")
+                continue
+            code = ack_code(ack)
+            if code in ('AA', 'CA'):
+                self.sent += 1
+                return ack
+            if code in ('AR', 'CR'):
+                raise MLLPRejectedError(f"Mensaje rechazado por {self.host}:{self.port}: {ack!r}")
+            last_error = MLLPRejectedError(f"ACK {code or 'desconocido'} de {self.host}:{self.port}")
+        raise last_error
+
+    def send(self, text):
+        """
+        Envía un mensaje y devuelve su ACK, o None si quedó en el spool porque el
+        receptor no está disponible.
+        """
+        if self._spool_pending():
+            self._spool(text)
+            return None
+        client = self._clients.get()
+        try:
+            return self._send_with_retries(client, text)
+        except (OSError, ConnectionError):
+            if not self.spool_dir:
+                raise
+            self._spool(text)
+            return None
+        finally:
+            self._clients.put(client)
+
+    def send_many(self, texts):
+        """
+        Envía una lista de mensajes en pipeline sobre una sola conexión. Los que
+        no reciben AA se reenvían uno a uno con reintentos (o van al spool).
+        """
+        if self._spool_pending():
+            for text in texts:
+                self._spool(text)
+            return
+        client = self._clients.get()
+        acked = 0
+        try:
+            for start in range(0, len(texts), self.pipeline):
+                window = texts[start:start + self.pipeline]
+                for text in window:
+                    client.send_frame(text)
+                for text in window:
+                    if ack_code(client.read_ack()) not in ('AA', 'CA'):
+                        raise MLLPRejectedError("ACK distinto de AA en pipeline")
+                    acked += 1
+                    self.sent += 1
+        except (OSError, ConnectionError, MLLPRejectedError) as e:
+            client.close()
+            logging.warning(f"[MLLP] Pipeline a {self.host}:{self.port} interrumpido tras {acked} ACK: {e}")
+        finally:
+            self._clients.put(client)
+        for text in texts[acked:]:
+            self.send(text)
+
+    # Spool en disco
+
+    def _spool_pending(self):
+        return self.spool_dir is not None and self.spooled > 0
+
+    def _spool(self, text):
+        name = f"{time.time_ns():020d}_{next(self._spool_seq):06d}.hl7"
+        tmp = os.path.join(self.spool_dir, name + '.tmp')
+        with open(tmp, 'w', encoding=self.encoding, newline='') as f:
+            f.write(text)
+        os.replace(tmp, os.path.join(self.spool_dir, name))
+        with self._spool_lock:
+            self.spooled += 1
+        logging.warning(f"[MLLP] {self.host}:{self.port} no disponible; mensaje guardado en spool: {name}")
+
+    def _recover_spool(self):
+        # Restaurar mensajes que quedaron reclamados por un envío interrumpido
+        for name in os.listdir(self.spool_dir):
+            if name.endswith('.inflight'):
+                path = os.path.join(self.spool_dir, name)
+                try:
+                    os.replace(path, path[:-len('.inflight')])
+                except OSError:
+                    pass
+        self.spooled = sum(1 for n in os.listdir(self.spool_dir) if n.endswith('.hl7'))
+
+    def flush_spool(self):
+        """Reenvía los mensajes del spool en orden; se detiene al primer fallo."""
+        for name in sorted(n for n in os.listdir(self.spool_dir) if n.endswith('.hl7')):
+            path = os.path.join(self.spool_dir, name)
+            claimed = path + '.inflight'
+            try:
+                # Reclamar el archivo: si otro proceso lo tomó antes, el rename falla
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, 'r', encoding=self.encoding, newline='') as f:
+                text = f.read()
+            client = self._clients.get()
+            try:
+                self._send_with_retries(client, text)
+            except MLLPRejectedError as e:
+                # Se conserva aparte para revisión manual en lugar de reintentarlo indefinidamente
+                os.replace(claimed, path + '.rejected')
+                logging.error(f"[MLLP] Mensaje del spool rechazado, apartado como {name}.rejected: {e}")
+                continue
+            except (OSError, ConnectionError):
+                os.replace(claimed, path)
+                return False
+            finally:
+                self._clients.put(client)
+            os.remove(claimed)
+            with self._spool_lock:
+                self.spooled = max(0, self.spooled - 1)
+        with self._spool_lock:
+            self.spooled = sum(1 for n in os.listdir(self.spool_dir) if n.endswith('.hl7'))
+        return True
+
+    def _flush_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            if self.spooled:
+                try:
+                    if self.flush_spool():
+                        logging.info(f"[MLLP] Spool vaciado hacia {self.host}:{self.port}")
+                except Exception as e:
+                    logging.error(f"[MLLP] Error vaciando spool: {e}")
+
+    def close(self):
+        self._stopping.set()
+        if self._flusher:
+            self._flusher.join()
+        while True:
+            try:
+                self._clients.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def forward_file(input_path, sender, plan=None, dedup=None):
+    """
+    Transforma un archivo HL7 en streaming y envía cada mensaje por MLLP (sin la
+    envoltura de lote), en bloques de sender.pipeline mensajes. Con dedup
+    (core.dedup.DedupCache) no se reenvían los mensajes ya vistos.
+
+    Returns:
+        int: número de mensajes enviados o guardados en spool.
+    """
+    source = os.path.basename(input_path)
+    count = 0
+    batch = []
+    for message in iter_hl7_messages(input_path):
+        if is_batch_envelope(message):
+            continue
+        if dedup is not None and dedup.is_duplicate(message, source):
+            continue
+        t0 = time.perf_counter()
+        applied = apply_plan(plan, message)
+        log_message(message, source, applied, time.perf_counter() - t0)
+        batch.append(message.to_text())
+        count += 1
+        if len(batch) >= sender.pipeline:
+            sender.send_many(batch)
+            batch = []
+    if batch:
+        sender.send_many(batch)
+    logging.info(f"[MLLP] {count} mensajes de {input_path} enviados a {sender.host}:{sender.port}")
+    return count
+
+
+# Un emisor por destino y proceso (los workers en modo proceso crean el suyo)
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+def get_sender(target, spool_dir=None, pool_size=2):
+    """Devuelve el MLLPSender compartido para 'host:puerto', creándolo la primera vez."""
+    key = (target, spool_dir)
+    with _senders_lock:
+        sender = _senders.get(key)
+        if sender is None:
+            host, port = parse_target(target)
+            sender = MLLPSender(host, port, pool_size=pool_size, spool_dir=spool_dir)
+            _senders[key] = sender
+        return sender
+
+
+def close_senders():
+    """Cierra todas las conexiones de los emisores compartidos."""
+    with _senders_lock:
+        for sender in _senders.values():
+            sender.close()
+        _senders.clear()
@@ -0,0 +1,112 @@
+import os
+import re
+import time
+import uuid
+import logging
+
+from core.hl7_message import HL7Message
+from core.hl7_stream import transform_file, apply_plan
+from core.routing import resolve_plan
+from core.log_setup import log_message
+from core.dedup import get_dedup
+from core.writer import get_writer
+from core.backup import backup_file
+from core.metrics import stage_start, stage_end
+from core.profiling import activate_profiler
+from core.journal import get_journal
+
+
+def process_file(file_path, output_dir, backup_dir, config_name, configs, forward=None, spool_dir=None,
+                 dedup=None, output=None, backup=None, profile=None, journal=None):
+    """
+    Procesa un archivo HL7 completo:
+      - Transforma en streaming cada mensaje con la configuración indicada (si existe)
+        o, si no se indica, con la que elija la tabla de enrutado para cada mensaje.
+      - Escribe el resultado en output_dir (o junto al original si no se indica)
+        según output (core.writer.OutputSettings: terminador, fsync, lotes),
+        o lo envía por MLLP a forward ('host:puerto') si se indica.
+      - Retira el original a backup_dir (si se indica): con backup
+        (core.backup.BackupSettings) lo encola para archivarlo comprimido; sin
+        él lo mueve como archivo suelto.
+      - Con dedup (core.dedup.DedupSettings) omite los mensajes ya procesados.
+      - Con profile (core.profiling.ProfileSettings) perfila uno de cada N mensajes.
+      - Con journal (core.journal.JournalSettings) registra cada etapa en el
+        diario para que un reinicio termine o deshaga el archivo (ver
+        core.journal.replay_journal).
+
+    Es una función de módulo para que los workers en modo proceso puedan recibirla.
+
+    Returns:
+        str: ruta del archivo de salida (o destino mllp://host:puerto).
+    """
+    plan = resolve_plan(config_name, configs)
+    cache = get_dedup(dedup)
+    activate_profiler(profile)
+    log = get_journal(journal)
+
+    if forward:
+        output_file = f"mllp://{forward}"
+    else:
+        output_file = os.path.join(output_dir or os.path.dirname(file_path), os.path.basename(file_path))
+    if log is not None:
+        log.record(file_path, 'claimed', output_file)
+    try:
+        if forward:
+            from core import mllp_sender
+            mllp_sender.forward_file(file_path, mllp_sender.get_sender(forward, spool_dir), plan, cache)
+        else:
+            transform_file(file_path, output_file, plan, dedup=cache, output=get_writer(output), journal=log)
+    except Exception:
+        if log is not None:
+            log.record(file_path, 'failed', output_file)
+        raise
+    if log is not None:
+        log.record(file_path, 'written', output_file)
+
+    if backup_dir:
+        t0 = stage_start()
+        backup_file(file_path, backup_dir, backup)
+        stage_end(t0, 'backup')
+        if log is not None:
+            log.record(file_path, 'backedup')
+
+    logging.info(f"Archivo procesado: {file_path} -> {output_file}")
+    return output_file
+
+
+def _message_file_name(message):
+    """Nombre de archivo único para un mensaje recibido en memoria (basado en MSH-10)."""
+    msh = message.find('MSH')
+    control_id = msh.fields[9] if msh is not None and len(msh.fields) > 9 else ''
+    control_id = re.sub(r'[^A-Za-z0-9_.-]', '_', control_id) or 'msg'
+    return f"{control_id}_{uuid.uuid4().hex[:8]}.hl7"
+
+
+def process_message_text(text, output_dir, config_name, configs, forward=None, spool_dir=None, dedup=None,
+                         output=None):
+    """
+    Procesa un mensaje HL7 recibido en memoria (por ejemplo vía MLLP): aplica la
+    configuración y lo escribe en output_dir, o lo reenvía por MLLP a forward.
+    Con dedup (core.dedup.DedupSettings) los duplicados no se procesan.
+
+    Returns:
+        str: ruta del archivo de salida (o destino mllp://host:puerto), o None
+        si el mensaje es un duplicado.
+    """
+    message = HL7Message.from_text(text)
+    cache = get_dedup(dedup)
+    if cache is not None and cache.is_duplicate(message, 'mllp'):
+        return None
+    t0 = time.perf_counter()
+    applied = apply_plan(resolve_plan(config_name, configs), message)
+    log_message(message, 'mllp', applied, time.perf_counter() - t0)
+
+    if forward:
+        from core import mllp_sender
+        mllp_sender.get_sender(forward, spool_dir).send(message.to_text())
+        return f"mllp://{forward}"
+
+    output_file = os.path.join(output_dir, _message_file_name(message))
+    get_writer(output).write_message(message, output_file)
+    logging.info(f"Mensaje procesado -> {output_file}")
+    return output_file
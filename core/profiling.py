@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import itertools
+
+# Perfilado por muestreo: uno de cada N mensajes se transforma bajo cProfile
+# (y, opcionalmente, con tracemalloc) y deja en la carpeta de perfiles:
+#
+#   <fecha>_<pid>_<seq>_<config>_<bytes>B.prof   estadísticas de pstats
+#   <fecha>_<pid>_<seq>_<config>_<bytes>B.mem    instantánea de tracemalloc
+#   <fecha>_<pid>_<seq>_<config>_<bytes>B.json   configuración, tamaño, control ID
+#                                                y duración de cada paso del plan
+#
+# cProfile, pstats y tracemalloc se importan al perfilar el primer mensaje para
+# no retrasar el arranque de la CLI.
+
+SORT_KEYS = ('tottime', 'cumtime', 'ncalls')
+
+
+def _safe_name(text):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', text) or '-'
+
+
+def message_size(message):
+    """Tamaño aproximado del mensaje en bytes (texto con terminadores)."""
+    return sum(len(line) + 1 for line in message.lines())
+
+
+class ProfileSettings:
+    """
+    Parámetros del perfilado. Es un objeto simple para que pueda enviarse a los
+    workers en modo proceso; cada proceso activa su perfilador (ver
+    activate_profiler).
+    """
+    __slots__ = ('profile_dir', 'every', 'memory', 'frames')
+
+    def __init__(self, profile_dir='profiles', every=100, memory=False, frames=8):
+        if every < 1:
+            raise ValueError("El intervalo de muestreo debe ser al menos 1")
+        self.profile_dir = profile_dir
+        self.every = every
+        self.memory = memory
+        self.frames = frames
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def cache_key(self):
+        return self.__getstate__()
+
+
+class MessageProfiler:
+    """
+    Perfilador de mensajes de un proceso. Mientras enabled es False,
+    hl7_stream.apply_plan sólo comprueba ese atributo.
+
+    Los mensajes muestreados se perfilan de uno en uno (cProfile y tracemalloc
+    son globales al proceso), por lo que con varios hilos un mensaje puede
+    esperar a que termine el perfil de otro.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.settings = None
+        self.written = 0
+        self._tick = 0
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, settings):
+        os.makedirs(settings.profile_dir, exist_ok=True)
+        self.settings = settings
+        self.enabled = True
+        logging.info(f"[PROFILE] Perfilando 1 de cada {settings.every} mensajes en {settings.profile_dir}"
+                     f"{' (con tracemalloc)' if settings.memory else ''}")
+
+    def sample(self):
+        """True para uno de cada settings.every mensajes."""
+        self._tick += 1
+        return self._tick % self.settings.every == 0
+
+    def run(self, plan, message):
+        """Aplica plan a message bajo cProfile (y tracemalloc) y guarda el perfil."""
+        import cProfile
+        settings = self.settings
+        config = (plan.name or '-') if plan is not None else '-'
+        size = message_size(message)
+        msh = message.find('MSH')
+        control_id = msh.fields[9] if msh is not None and len(msh.fields) > 9 else ''
+        steps = []
+        observe = lambda action, seconds: steps.append((action, seconds))
+        with self._lock:
+            snapshot = None
+            profiler = cProfile.Profile()
+            tracing = False
+            if settings.memory:
+                import tracemalloc
+                # Sólo se trazan las asignaciones de este mensaje (salvo que ya se trazara con -X tracemalloc)
+                tracing = not tracemalloc.is_tracing()
+                if tracing:
+                    tracemalloc.start(settings.frames)
+            try:
+                profiler.enable()
+                if plan is not None:
+                    plan.apply_timed(message, observe)
+                profiler.disable()
+                if settings.memory:
+                    snapshot = tracemalloc.take_snapshot().filter_traces((
+                        tracemalloc.Filter(False, __file__),
+                        tracemalloc.Filter(False, tracemalloc.__file__),
+                    ))
+            finally:
+                if tracing:
+                    tracemalloc.stop()
+            base = os.path.join(settings.profile_dir, f"{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}_"
+                                                      f"{next(self._seq):06d}_{_safe_name(config)}_{size}B")
+            try:
+                profiler.dump_stats(base + '.prof')
+                if snapshot is not None:
+                    snapshot.dump(base + '.mem')
+                with open(base + '.json', 'w', encoding='utf-8') as f:
+                    json.dump({'config': config, 'size': size, 'control_id': control_id,
+                               'time': time.time(), 'steps': steps}, f)
+                self.written += 1
+            except OSError as e:
+                logging.error(f"[PROFILE] No se pudo guardar el perfil {base}: {e}")
+
+
+PROFILER = MessageProfiler()
+
+
+def activate_profiler(settings):
+    """Activa el perfilador de este proceso con settings (None no hace nada)."""
+    if settings is None:
+        return
+    if PROFILER.enabled and PROFILER.settings.cache_key() == settings.cache_key():
+        return
+    PROFILER.configure(settings)
+
+
+# Resumen
+
+def _profile_bases(profile_dir, config=None):
+    bases = []
+    for name in sorted(os.listdir(profile_dir)):
+        if not name.endswith('.json'):
+            continue
+        base = os.path.join(profile_dir, name[:-len('.json')])
+        if config is not None:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                if json.load(f).get('config') != config:
+                    continue
+        bases.append(base)
+    return bases
+
+
+def summarize_profiles(profile_dir, config=None, top=15, sort='tottime', stream=None):
+    """
+    Suma los perfiles de profile_dir (o sólo los de config) y escribe en stream
+    los pasos del plan, funciones y líneas de asignación de memoria que más
+    pesan.
+
+    Returns:
+        int: número de perfiles sumados.
+    """
+    import pstats
+    import sys
+    stream = stream or sys.stdout
+    bases = _profile_bases(profile_dir, config)
+    if not bases:
+        return 0
+
+    # Pasos del plan: (config, posición, acción) -> [veces, total, máximo]
+    steps = {}
+    sizes = []
+    for base in bases:
+        with open(base + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        sizes.append(meta['size'])
+        for i, (action, seconds) in enumerate(meta['steps'], 1):
+            entry = steps.setdefault((meta['config'], i, action), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+    stream.write(f"{len(bases)} mensajes perfilados ({min(sizes)}-{max(sizes)} bytes, "
+                 f"media {sum(sizes) // len(sizes)})\n\n")
+    stream.write(f"Reglas con más tiempo (top {top}):\n")
+    stream.write(f"  {'config':<20} {'paso':>4}  {'acción':<16} {'veces':>6} {'total ms':>10} {'media µs':>10} {'máx µs':>10}\n")
+    ranked = sorted(steps.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    for (name, i, action), (count, total, peak) in ranked:
+        stream.write(f"  {name:<20} {i:>4}  {action:<16} {count:>6} {total * 1000:>10.3f} "
+                     f"{total / count * 1e6:>10.1f} {peak * 1e6:>10.1f}\n")
+
+    stream.write(f"\nFunciones con más tiempo (orden {sort}, top {top}):\n")
+    stats = pstats.Stats(*[base + '.prof' for base in bases if os.path.exists(base + '.prof')], stream=stream)
+    stats.files = []   # sin la cabecera de cada archivo .prof
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+    mems = [base + '.mem' for base in bases if os.path.exists(base + '.mem')]
+    if mems:
+        import tracemalloc
+        lines = {}
+        for path in mems:
+            for stat in tracemalloc.Snapshot.load(path).statistics('lineno'):
+                frame = stat.traceback[0]
+                entry = lines.setdefault((frame.filename, frame.lineno), [0, 0])
+                entry[0] += stat.size
+                entry[1] += stat.count
+        stream.write(f"Líneas con más memoria asignada ({len(mems)} instantáneas, top {top}):\n")
+        for (filename, lineno), (size, count) in sorted(lines.items(), key=lambda item: item[1][0], reverse=True)[:top]:
+            stream.write(f"  {size / 1024:>10.1f} KiB {count:>8} bloques  {filename}:{lineno}\n")
+    return len(bases)
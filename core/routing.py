@@ -0,0 +1,166 @@
+import re
+import json
+import logging
+import threading
+
+from config.manager import ROUTES_KEY
+from core.rule_compiler import get_compiled_plan
+
+# Clave reservada de configurations.json con la tabla de enrutado:
+#
+#   "__routes__": {
+#       "default": "config-general",
+#       "routes": [
+#           {"match": {"MSH-4": "FAC01", "MSH-9": "ADT^A01"}, "config": "cliente-a-adt"},
+#           {"match": {"MSH-4": "FAC01"}, "config": "cliente-a"},
+#           {"match": {"MSH-3": "LAB", "MSH-5": "RIS"}, "config": "lab-ris"}
+#       ]
+#   }
+#
+# Los campos se indican con la numeración HL7 de MSH (MSH-3 = aplicación emisora,
+# MSH-4 = centro emisor, MSH-5 = aplicación receptora, MSH-9 = tipo de mensaje)
+# y se comparan con el valor completo del campo.
+
+_FIELD_KEY = re.compile(r'^MSH[-.](\d+)$')
+
+
+class RoutingError(ValueError):
+    """Tabla de enrutado inválida."""
+
+
+def _field_position(key):
+    """'MSH-9' -> posición en la lista de campos del segmento MSH (MSH-n = fields[n-1])."""
+    m = _FIELD_KEY.match(key.strip().upper()) if isinstance(key, str) else None
+    if not m or int(m.group(1)) < 1:
+        raise RoutingError(f"Campo de enrutado no soportado: {key!r} (se espera MSH-n)")
+    return int(m.group(1)) - 1
+
+
+class RoutingTable:
+    """
+    Elige la configuración de cada mensaje a partir de campos de MSH.
+
+    Las rutas se agrupan por firma (el conjunto de campos que comparan) y cada
+    grupo es un diccionario {valores: configuración}, de modo que elegir una
+    ruta cuesta una búsqueda por grupo y no una comparación por ruta. Los grupos
+    más específicos (más campos) se consultan antes; a igual número de campos,
+    en el orden en que aparecen por primera vez. Si nada coincide se usa default
+    (o ninguna configuración si no hay default).
+    """
+    def __init__(self, routes, default=None):
+        self.default = default
+        self.route_count = 0
+        groups = {}
+        for route in routes:
+            if not isinstance(route, dict) or not isinstance(route.get('match'), dict) or not route['match']:
+                raise RoutingError(f"Ruta inválida (se espera {{'match': {{...}}, 'config': ...}}): {route!r}")
+            config = route.get('config')
+            if not isinstance(config, str) or not config:
+                raise RoutingError(f"Ruta sin 'config': {route!r}")
+            items = sorted((_field_position(k), str(v)) for k, v in route['match'].items())
+            signature = tuple(pos for pos, _ in items)
+            values = tuple(v for _, v in items)
+            index = groups.setdefault(signature, {})
+            if values in index:
+                raise RoutingError(f"Ruta duplicada para {route['match']!r}")
+            index[values] = config
+            self.route_count += 1
+        # Orden de consulta: más campos primero; sorted es estable y conserva el de aparición
+        self._groups = tuple(sorted(groups.items(), key=lambda item: -len(item[0])))
+
+    @property
+    def config_names(self):
+        names = {config for _, index in self._groups for config in index.values()}
+        if self.default:
+            names.add(self.default)
+        return names
+
+    def route(self, message):
+        """Devuelve el nombre de configuración para un HL7Message (o default)."""
+        msh = message.find('MSH')
+        if msh is None:
+            return self.default
+        fields = msh.fields
+        n = len(fields)
+        for signature, index in self._groups:
+            key = tuple(fields[pos] if pos < n else '' for pos in signature)
+            config = index.get(key)
+            if config is not None:
+                return config
+        return self.default
+
+    @classmethod
+    def from_configurations(cls, configs):
+        """
+        Construye la tabla a partir de la clave __routes__ de las configuraciones
+        y comprueba que todas las configuraciones referenciadas existen.
+        Devuelve None si no hay tabla de enrutado.
+        """
+        spec = configs.get(ROUTES_KEY)
+        if spec is None:
+            return None
+        if not isinstance(spec, dict):
+            raise RoutingError(f"'{ROUTES_KEY}' debe ser un objeto JSON.")
+        table = cls(spec.get('routes', []), spec.get('default'))
+        missing = sorted(name for name in table.config_names if not isinstance(configs.get(name), list))
+        if missing:
+            raise RoutingError(f"Rutas hacia configuraciones inexistentes: {', '.join(missing)}")
+        return table
+
+
+class RoutedPlan:
+    """
+    Plan que delega en el plan compilado de la configuración elegida para cada
+    mensaje. Ofrece la misma interfaz que TransformationPlan (select/apply).
+    """
+    def __init__(self, table, configs):
+        self.table = table
+        self.plans = {name: get_compiled_plan(name, configs[name]) for name in table.config_names}
+        self.rule_count = 0
+        self.name = 'routed'
+
+    def select(self, message):
+        name = self.table.route(message)
+        return self.plans.get(name) if name else None
+
+    def apply(self, message):
+        plan = self.select(message)
+        if plan is not None:
+            plan.apply(message)
+        return message
+
+
+_routed_cache = {}
+_routed_cache_lock = threading.Lock()
+
+
+def get_routed_plan(configs):
+    """
+    Devuelve el RoutedPlan de unas configuraciones (o None si no definen rutas),
+    reutilizando el anterior mientras el contenido no cambie.
+    """
+    if ROUTES_KEY not in configs:
+        return None
+    fingerprint = json.dumps(configs, sort_keys=True)
+    with _routed_cache_lock:
+        cached = _routed_cache.get('current')
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+    plan = RoutedPlan(RoutingTable.from_configurations(configs), configs)
+    logging.info(f"[ROUTE] Tabla de enrutado cargada: {plan.table.route_count} rutas, "
+                 f"default: {plan.table.default or '-'}")
+    with _routed_cache_lock:
+        _routed_cache['current'] = (fingerprint, plan)
+    return plan
+
+
+def resolve_plan(config_name, configs):
+    """
+    Plan a aplicar a un archivo: el de config_name si se indica; si no, el
+    enrutado por mensaje cuando configurations.json define rutas; si no, None.
+    """
+    if config_name:
+        if config_name in configs:
+            return get_compiled_plan(config_name, configs[config_name])
+        return None
+    return get_routed_plan(configs)
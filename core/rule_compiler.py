@@ -0,0 +1,345 @@
+import json
+import time
+import logging
+import threading
+
+from core.field_path import parse_path, FieldPathError
+from core.conditions import compile_condition, is_legacy_condition, ConditionError
+
+
+class RuleValidationError(ValueError):
+    """Regla con parámetros inválidos detectada al compilar una configuración."""
+
+
+# Utilidades de validación
+
+def _require_str(rule, key):
+    value = rule.get(key)
+    if not isinstance(value, str):
+        raise RuleValidationError(f"'{rule.get('action')}': '{key}' debe ser texto (valor: {value!r})")
+    return value
+
+
+def _require_int(rule, key, optional=False):
+    value = rule.get(key)
+    if value is None and optional:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise RuleValidationError(f"'{rule.get('action')}': '{key}' debe ser entero (valor: {value!r})")
+    return value
+
+
+def _require_str_list(rule, key):
+    value = rule.get(key) or []
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise RuleValidationError(f"'{rule.get('action')}': '{key}' debe ser una lista de textos (valor: {value!r})")
+    return value
+
+
+def _require_path(rule, key):
+    text = _require_str(rule, key)
+    try:
+        return parse_path(text)
+    except FieldPathError as e:
+        raise RuleValidationError(f"'{rule.get('action')}': '{key}': {e}") from e
+
+
+def _noop(rule, reason):
+    logging.warning(f"[PLAN] Regla sin efecto omitida ({reason}): {rule}")
+    return None
+
+
+class _CompiledRule:
+    """
+    Acción ya validada y resuelta a una función apply(message).
+
+    delete_names contiene los segmentos a eliminar cuando la acción es un
+    delete_segment, para poder fusionar eliminaciones consecutivas en una pasada.
+    action es la etiqueta de la regla en las métricas ('conditional' si tiene
+    condición).
+    """
+    __slots__ = ('apply', 'delete_names', 'action')
+
+    def __init__(self, apply, delete_names=None):
+        self.apply = apply
+        self.delete_names = delete_names
+        self.action = None
+
+
+# Compiladores por acción
+
+def _compile_delete_segment(rule):
+    name = rule.get('segment')
+    if name is None:
+        return _noop(rule, "sin 'segment'")
+    name = _require_str(rule, 'segment')
+
+    def apply(message):
+        message.delete_segment(name)
+
+    return _CompiledRule(apply, (name,))
+
+
+def _compile_add_segment(rule):
+    new_segment = _require_str(rule, 'new_segment')
+    position = _require_int(rule, 'position') if 'position' in rule else None
+    values = _require_str_list(rule, 'values')
+
+    def apply(message):
+        pos = len(message) if position is None else position
+        message.add_segment(new_segment, pos, values)
+
+    return _CompiledRule(apply)
+
+
+def _compile_modify_field(rule):
+    if 'path' in rule:
+        path = _require_path(rule, 'path')
+        new_value = _require_str(rule, 'new_value')
+
+        def apply(message):
+            message.set_path(path, new_value)
+
+        return _CompiledRule(apply)
+
+    name = rule.get('segment')
+    if name is None:
+        return _noop(rule, "sin 'segment'")
+    name = _require_str(rule, 'segment')
+    field_index = _require_int(rule, 'field_index')
+    new_value = _require_str(rule, 'new_value')
+
+    def apply(message):
+        message.modify_field(name, field_index, new_value)
+
+    return _CompiledRule(apply)
+
+
+def _compile_reorder_fields(rule):
+    name = rule.get('segment')
+    if name is None:
+        return _noop(rule, "sin 'segment'")
+    name = _require_str(rule, 'segment')
+    new_order = rule.get('new_order')
+    if (not isinstance(new_order, list) or not new_order
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in new_order)):
+        raise RuleValidationError(f"'reorder_fields': 'new_order' debe ser una lista no vacía de enteros (valor: {new_order!r})")
+    new_order = list(new_order)
+
+    def apply(message):
+        message.reorder_fields(name, new_order)
+
+    return _CompiledRule(apply)
+
+
+def _compile_copy_value(rule):
+    if 'source_path' in rule or 'dest_path' in rule:
+        source_path = _require_path(rule, 'source_path')
+        dest_path = _require_path(rule, 'dest_path')
+
+        def apply(message):
+            message.copy_path(source_path, dest_path)
+
+        return _CompiledRule(apply)
+
+    source = rule.get('source_segment')
+    if source is None:
+        return _noop(rule, "sin 'source_segment'")
+    source = _require_str(rule, 'source_segment')
+    source_field = _require_int(rule, 'source_field')
+    dest = rule.get('dest_segment')
+    if dest is None:
+        return _noop(rule, "sin 'dest_segment'")
+    dest = _require_str(rule, 'dest_segment')
+    dest_field = _require_int(rule, 'dest_field')
+
+    def apply(message):
+        message.copy_value(source, source_field, dest, dest_field)
+
+    return _CompiledRule(apply)
+
+
+def _compile_agregar_campos(rule):
+    name = rule.get('segment')
+    if name is None:
+        return _noop(rule, "sin 'segment'")
+    name = _require_str(rule, 'segment')
+    values = _require_str_list(rule, 'values')
+    start_index = _require_int(rule, 'start_index', optional=True)
+
+    def apply(message):
+        message.agregar_campos(name, values, start_index)
+
+    return _CompiledRule(apply)
+
+
+_ACTION_COMPILERS = {
+    'delete_segment': _compile_delete_segment,
+    'add_segment':    _compile_add_segment,
+    'modify_field':   _compile_modify_field,
+    'reorder_fields': _compile_reorder_fields,
+    'copy_value':     _compile_copy_value,
+    'agregar_campos': _compile_agregar_campos,
+}
+
+
+def _compile_action(rule):
+    if not isinstance(rule, dict):
+        raise RuleValidationError(f"La regla debe ser un objeto JSON (valor: {rule!r})")
+    action = rule.get('action')
+    compiler = _ACTION_COMPILERS.get(action)
+    if compiler is None:
+        logging.warning(f"[PLAN] Acción no reconocida omitida: {action}")
+        return None
+    compiled = compiler(rule)
+    if compiled is not None:
+        compiled.action = action
+    return compiled
+
+
+def _compile_conditional(rule, cond):
+    if not isinstance(cond, dict):
+        raise RuleValidationError(f"La condición debe ser un objeto JSON (valor: {cond!r})")
+    if is_legacy_condition(cond):
+        for key in ('segment', 'field_index', 'value'):
+            if key not in cond:
+                raise RuleValidationError(f"Condición sin '{key}': {cond}")
+        if cond['segment'] is None:
+            return _noop(rule, "condición sin 'segment'")
+    try:
+        test = compile_condition(cond)
+    except ConditionError as e:
+        raise RuleValidationError(str(e)) from e
+
+    actions = rule.get('actions', [])
+    if not isinstance(actions, list):
+        raise RuleValidationError(f"'actions' debe ser una lista (valor: {actions!r})")
+    steps = _fuse([c for c in (_compile_action(act) for act in actions) if c is not None])
+
+    def apply(message):
+        if test(message):
+            for step in steps:
+                step(message)
+
+    compiled = _CompiledRule(apply)
+    compiled.action = 'conditional'
+    return compiled
+
+
+def _fuse(compiled_rules, labels=None):
+    """
+    Convierte reglas compiladas en pasos ejecutables, fusionando los
+    delete_segment consecutivos en una sola reconstrucción del mensaje.
+    Si se pasa la lista labels, se agrega en ella la acción de cada paso.
+    """
+    steps = []
+    pending_deletes = []
+
+    def flush():
+        if pending_deletes:
+            names = tuple(pending_deletes)
+            if len(names) == 1:
+                steps.append(lambda message: message.delete_segment(names[0]))
+            else:
+                steps.append(lambda message: message.delete_segments(names))
+            if labels is not None:
+                labels.append('delete_segment')
+            pending_deletes.clear()
+
+    for compiled in compiled_rules:
+        if compiled.delete_names:
+            pending_deletes.extend(compiled.delete_names)
+        else:
+            flush()
+            steps.append(compiled.apply)
+            if labels is not None:
+                labels.append(compiled.action)
+    flush()
+    return tuple(steps)
+
+
+class TransformationPlan:
+    """
+    Plan de transformación precompilado a partir de una lista de reglas.
+
+    Opera sobre un HL7Message y produce exactamente el mismo resultado que
+    hl7_parser.apply_transformations, pero valida y resuelve las reglas una sola
+    vez; cada regla localiza su segmento mediante el índice del mensaje.
+    """
+    def __init__(self, steps, rule_count, name=None, labels=None):
+        self.steps = tuple(steps)
+        self.rule_count = rule_count
+        self.name = name
+        self.labels = tuple(labels) if labels is not None else ('-',) * len(self.steps)
+
+    def select(self, message):
+        """Plan a aplicar a message (siempre este; ver routing.RoutedPlan)."""
+        return self
+
+    def apply(self, message):
+        for step in self.steps:
+            step(message)
+        return message
+
+    def apply_timed(self, message, observe):
+        """Como apply, llamando a observe(acción, segundos) tras cada paso (métricas por regla)."""
+        perf = time.perf_counter
+        for step, label in zip(self.steps, self.labels):
+            t0 = perf()
+            step(message)
+            observe(label, perf() - t0)
+        return message
+
+
+def compile_configuration(transformations, name=None):
+    """
+    Compila una configuración (lista de reglas) en un TransformationPlan.
+
+    Raises:
+        RuleValidationError: si alguna regla tiene parámetros inválidos.
+    """
+    if not isinstance(transformations, list):
+        raise RuleValidationError("La configuración debe ser una lista de reglas.")
+
+    compiled_rules = []
+    for rule in transformations:
+        cond = rule.get('condition') if isinstance(rule, dict) else None
+        compiled = _compile_conditional(rule, cond) if cond else _compile_action(rule)
+        if compiled is not None:
+            compiled_rules.append(compiled)
+    labels = []
+    steps = _fuse(compiled_rules, labels)
+
+    logging.info(f"[PLAN] {len(transformations)} reglas compiladas en {len(steps)} pasos")
+    return TransformationPlan(steps, len(transformations), name, labels)
+
+
+# Caché de planes por nombre de configuración
+
+_plan_cache = {}
+_plan_cache_lock = threading.Lock()
+
+
+def get_compiled_plan(config_name, transformations):
+    """
+    Devuelve el plan compilado para una configuración, reutilizando el de la caché
+    mientras las reglas no cambien. Si las reglas se editan, se recompila.
+    """
+    fingerprint = json.dumps(transformations, sort_keys=True)
+    with _plan_cache_lock:
+        cached = _plan_cache.get(config_name)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+    plan = compile_configuration(transformations, config_name)
+    with _plan_cache_lock:
+        _plan_cache[config_name] = (fingerprint, plan)
+    return plan
+
+
+def invalidate_plan_cache(config_name=None):
+    """Descarta el plan de una configuración (o todos si no se indica nombre)."""
+    with _plan_cache_lock:
+        if config_name is None:
+            _plan_cache.clear()
+        else:
+            _plan_cache.pop(config_name, None)
@@ -0,0 +1,130 @@
+import time
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from core.log_setup import worker_logging_args
+from core.metrics import METRICS, run_collecting
+
+POOL_MODES = ('thread', 'process')
+
+
+class ProcessingPool:
+    """
+    Pool de workers que consume rutas de archivo desde una cola acotada.
+
+    - submit() bloquea cuando la cola está llena (backpressure hacia el watcher).
+    - En modo 'thread' el handler se ejecuta en hilos del propio proceso; en modo
+      'process' cada hilo despachador lo envía a un ProcessPoolExecutor, por lo
+      que el handler debe poder serializarse (función de módulo o functools.partial).
+    - dispatch_kwargs, si se indica, se llama en el hilo despachador justo antes
+      de procesar cada archivo y sus claves se pasan como argumentos al handler
+      (por ejemplo la instantánea vigente de las configuraciones).
+    - Con las métricas activas (core.metrics) se cuentan los archivos y su
+      duración (etapa 'file'); en modo 'process' cada worker devuelve junto al
+      resultado lo que midió y se suma al registro de este proceso.
+    - shutdown() deja de aceptar trabajo y espera a que terminen los archivos en
+      curso; los que seguían en cola quedan en el directorio de entrada.
+    """
+    def __init__(self, handler, workers=1, queue_size=None, mode='thread', on_done=None, on_error=None,
+                 dispatch_kwargs=None):
+        if mode not in POOL_MODES:
+            raise ValueError(f"Modo de pool no soportado: {mode}")
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        self.on_done = on_done
+        self.on_error = on_error
+        self.dispatch_kwargs = dispatch_kwargs
+        self.queue = queue.Queue(maxsize=queue_size or self.workers * 4)
+        self._stopping = threading.Event()
+        self._executor = None
+        if mode == 'process':
+            initializer, initargs = worker_logging_args()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initializer, initargs=initargs)
+        self._threads = []
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"hl7-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logging.info(f"Pool iniciado: {self.workers} workers ({self.mode}), cola máx. {self.queue.maxsize}")
+
+    def submit(self, path):
+        """
+        Encola una ruta para procesar. Bloquea mientras la cola esté llena.
+        Devuelve False si el pool se está deteniendo.
+        """
+        while not self._stopping.is_set():
+            try:
+                self.queue.put(path, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @property
+    def pending(self):
+        """Número aproximado de archivos en cola."""
+        return self.queue.qsize()
+
+    @property
+    def in_flight(self):
+        """Número de archivos que se están procesando."""
+        return self._in_flight
+
+    def _run(self, path, kwargs):
+        if self._executor is None:
+            return self.handler(path, **kwargs)
+        if not METRICS.enabled:
+            return self._executor.submit(self.handler, path, **kwargs).result()
+        result, delta = self._executor.submit(run_collecting, self.handler, path,
+                                              METRICS.rule_sample_every, **kwargs).result()
+        METRICS.merge(delta)
+        return result
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                path = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._in_flight_lock:
+                self._in_flight += 1
+            t0 = time.perf_counter()
+            try:
+                kwargs = self.dispatch_kwargs() if self.dispatch_kwargs else {}
+                result = self._run(path, kwargs)
+                if METRICS.enabled:
+                    METRICS.observe('hl7_stage_seconds', ('file', '-'), time.perf_counter() - t0)
+                    METRICS.inc('hl7_files_total', ('ok',))
+                if self.on_done:
+                    self.on_done(path, result)
+            except Exception as e:
+                logging.error(f"Error procesando {path}: {e}")
+                if METRICS.enabled:
+                    METRICS.inc('hl7_files_total', ('error',))
+                if self.on_error:
+                    self.on_error(path, e)
+            finally:
+                with self._in_flight_lock:
+                    self._in_flight -= 1
+                self.queue.task_done()
+
+    def shutdown(self, wait=True):
+        """Detiene el pool; con wait=True espera a que terminen los archivos en curso."""
+        self._stopping.set()
+        if wait:
+            for t in self._threads:
+                t.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+        dropped = self.queue.qsize()
+        if dropped:
+            logging.info(f"Pool detenido: {dropped} archivos en cola quedan pendientes en la entrada.")
+        else:
+            logging.info("Pool detenido.")
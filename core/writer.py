@@ -0,0 +1,372 @@
+import os
+import time
+import logging
+import itertools
+import threading
+
+# Terminador de segmento estándar HL7 (CR); lf/crlf para destinos que lo requieran
+TERMINATORS = {'cr': '\r', 'lf': '\n', 'crlf': '\r\n'}
+
+# Política de fsync de cada salida:
+#   none:  sin fsync (el sistema operativo decide cuándo llega al disco).
+#   file:  fsync de cada archivo antes de renombrarlo.
+#   group: los archivos se publican al terminar y se sincronizan en grupo cada
+#          group_files archivos o group_ms milisegundos (lo que ocurra antes).
+FSYNC_POLICIES = ('none', 'file', 'group')
+
+# Tamaño a partir del cual una salida se vuelca al temporal antes de terminar
+SPILL_BYTES = 8 * 1024 * 1024
+
+
+def _temp_path(path):
+    """Temporal oculto junto al destino: los sondeos por *.hl7 no lo ven y os.replace es atómico."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _fsync_path(path, directory=False):
+    """fsync de un archivo o directorio ya cerrado (los directorios sólo en POSIX)."""
+    if directory and os.name == 'nt':
+        return
+    try:
+        # Windows exige acceso de escritura para sincronizar un archivo
+        fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    except OSError:
+        return   # ya consumido por el destino
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class OutputSettings:
+    """
+    Parámetros de escritura de salidas. Es un objeto simple para que pueda
+    enviarse a los workers en modo proceso; cada proceso crea su OutputWriter
+    (ver get_writer).
+
+    Con batch_messages > 0 los mensajes se agrupan en archivos de lote FHS/BHS
+    que se cierran al llegar a batch_messages mensajes, batch_bytes bytes o
+    batch_seconds segundos desde el primer mensaje.
+    """
+    __slots__ = ('terminator', 'fsync', 'group_files', 'group_ms',
+                 'batch_messages', 'batch_bytes', 'batch_seconds')
+
+    def __init__(self, terminator='cr', fsync='none', group_files=32, group_ms=200,
+                 batch_messages=0, batch_bytes=16 * 1024 * 1024, batch_seconds=60):
+        if terminator not in TERMINATORS:
+            raise ValueError(f"Terminador no soportado: {terminator}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync no soportada: {fsync}")
+        self.terminator = terminator
+        self.fsync = fsync
+        self.group_files = group_files
+        self.group_ms = group_ms
+        self.batch_messages = batch_messages
+        self.batch_bytes = batch_bytes
+        self.batch_seconds = batch_seconds
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def cache_key(self):
+        return self.__getstate__()
+
+
+class GroupCommit:
+    """
+    Sincroniza en bloque los archivos publicados: un fsync por archivo y uno por
+    directorio cada max_files archivos o max_ms milisegundos, en lugar de
+    esperar al disco en cada salida.
+    """
+    def __init__(self, max_files=32, max_ms=200):
+        self.max_files = max_files
+        self.max_seconds = max_ms / 1000.0
+        self.commits = 0
+        self._pending = []
+        self._first = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        with self._lock:
+            if not self._pending:
+                self._first = time.monotonic()
+            self._pending.append(path)
+            due = len(self._pending) >= self.max_files
+        if due:
+            self.flush()
+
+    def tick(self):
+        """Sincroniza si el grupo pendiente ya superó max_ms."""
+        with self._lock:
+            due = self._pending and time.monotonic() - self._first >= self.max_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        for path in pending:
+            _fsync_path(path)
+        for directory in {os.path.dirname(path) or '.' for path in pending}:
+            _fsync_path(directory, directory=True)
+        self.commits += 1
+
+
+class AtomicFileWriter:
+    """
+    Escribe un archivo HL7 completo de forma atómica: los mensajes se acumulan
+    en memoria y se escriben con una sola llamada en un temporal que se renombra
+    sobre el destino al cerrar. Un lector nunca ve un archivo a medio escribir
+    y, si el proceso falla, el destino anterior (si existía) queda intacto.
+
+    Las salidas de más de SPILL_BYTES se vuelcan al temporal por bloques para
+    que la memoria no dependa del tamaño del lote.
+    """
+    def __init__(self, output_path, terminator='\r', fsync='none', group=None):
+        self.output_path = output_path
+        self.terminator = terminator
+        self.fsync = fsync
+        self.group = group
+        self.messages_written = 0
+        self._tmp = _temp_path(output_path)
+        self._parts = []
+        self._size = 0
+        self._file = None
+        self._finished = False
+
+    def write(self, message):
+        terminator = self.terminator
+        parts = self._parts
+        size = len(terminator)
+        for line in message.lines():
+            parts.append(line)
+            parts.append(terminator)
+            self._size += len(line) + size
+        self.messages_written += 1
+        if self._size >= SPILL_BYTES:
+            self._spill()
+
+    def write_text(self, text):
+        """Agrega texto ya serializado (segmentos con su terminador)."""
+        self._parts.append(text)
+        self._size += len(text)
+
+    def _spill(self):
+        if self._file is None:
+            self._file = open(self._tmp, 'w', encoding='utf-8', newline='')
+        self._file.write(''.join(self._parts))
+        self._parts = []
+        self._size = 0
+
+    def close(self):
+        """Escribe lo pendiente y publica el archivo."""
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            self._spill()
+            if self.fsync == 'file':
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._tmp, self.output_path)
+        except BaseException:
+            self.abort()
+            raise
+        if self.group is not None:
+            self.group.add(self.output_path)
+
+    def abort(self):
+        """Descarta la salida sin tocar el destino."""
+        self._finished = True
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._tmp)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class BatchFileWriter:
+    """
+    Agrupa los mensajes de una carpeta de salida en archivos de lote
+    (FHS/BHS ... BTS/FTS) para que el destino recoja pocos archivos grandes en
+    lugar de uno por mensaje. Cada lote se acumula en memoria y se publica con
+    AtomicFileWriter al alcanzar el límite de mensajes, bytes o antigüedad.
+    """
+    def __init__(self, output_dir, terminator='\r', fsync='none', group=None,
+                 max_messages=1000, max_bytes=16 * 1024 * 1024, max_seconds=60, prefix='batch'):
+        self.output_dir = output_dir
+        self.terminator = terminator
+        self.fsync = fsync
+        self.group = group
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.prefix = prefix
+        self.files_written = 0
+        self._seq = itertools.count(1)
+        self._parts = []
+        self._count = 0
+        self._size = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def write(self, message):
+        terminator = self.terminator
+        size = len(terminator)
+        with self._lock:
+            if not self._count:
+                self._opened = time.monotonic()
+            for line in message.lines():
+                self._parts.append(line)
+                self._parts.append(terminator)
+                self._size += len(line) + size
+            self._count += 1
+            if self._count >= self.max_messages or self._size >= self.max_bytes:
+                self._roll()
+
+    def tick(self):
+        """Cierra el lote en curso si supera max_seconds."""
+        with self._lock:
+            if self._count and time.monotonic() - self._opened >= self.max_seconds:
+                self._roll()
+
+    def _roll(self):
+        stamp = time.strftime('%Y%m%d%H%M%S')
+        seq = next(self._seq)
+        control_id = f"{stamp}{os.getpid()}{seq:06d}"
+        name = f"{self.prefix}_{stamp}_{os.getpid()}_{seq:06d}.hl7"
+        t = self.terminator
+        writer = AtomicFileWriter(os.path.join(self.output_dir, name), t, self.fsync, self.group)
+        writer.write_text(f"FHS|^~\\&|||||{stamp}||||{control_id}{t}BHS|^~\\&|||||{stamp}||||{control_id}{t}")
+        writer.write_text(''.join(self._parts))
+        writer.write_text(f"BTS|{self._count}{t}FTS|1{t}")
+        writer.close()
+        logging.info(f"[BATCH] Lote escrito: {name} ({self._count} mensajes)")
+        self.files_written += 1
+        self._parts = []
+        self._count = 0
+        self._size = 0
+
+    def close(self):
+        with self._lock:
+            if self._count:
+                self._roll()
+
+
+class OutputWriter:
+    """
+    Punto único de escritura de salidas de un proceso: crea los AtomicFileWriter
+    con el terminador y la política de fsync configurados, mantiene un
+    BatchFileWriter por carpeta si se agrupan lotes y un hilo que cierra los
+    grupos de fsync y los lotes que superan su tiempo máximo.
+    """
+    def __init__(self, settings=None):
+        self.settings = settings or OutputSettings()
+        self.terminator = TERMINATORS[self.settings.terminator]
+        self.group = None
+        if self.settings.fsync == 'group':
+            self.group = GroupCommit(self.settings.group_files, self.settings.group_ms)
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        if self.group is not None or self.batching:
+            interval = min(self.settings.group_ms / 1000.0 if self.group else 1.0, 1.0)
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="output-writer", daemon=True)
+            self._thread.start()
+
+    @property
+    def batching(self):
+        return self.settings.batch_messages > 0
+
+    def _fsync(self):
+        return 'none' if self.settings.fsync == 'group' else self.settings.fsync
+
+    def open_file(self, output_path):
+        """AtomicFileWriter para output_path (usar como context manager)."""
+        return AtomicFileWriter(output_path, self.terminator, self._fsync(), self.group)
+
+    def write_message(self, message, output_path):
+        """Escribe un mensaje en output_path, o en el lote de su carpeta si se agrupan lotes."""
+        if self.batching:
+            self.batch(os.path.dirname(output_path)).write(message)
+            return
+        with self.open_file(output_path) as writer:
+            writer.write(message)
+
+    def batch(self, output_dir):
+        """BatchFileWriter compartido de una carpeta de salida."""
+        with self._lock:
+            batch = self._batches.get(output_dir)
+            if batch is None:
+                s = self.settings
+                batch = BatchFileWriter(output_dir, self.terminator, self._fsync(), self.group,
+                                        s.batch_messages, s.batch_bytes, s.batch_seconds)
+                self._batches[output_dir] = batch
+            return batch
+
+    def _run(self, interval):
+        while not self._stopping.wait(interval):
+            try:
+                for batch in list(self._batches.values()):
+                    batch.tick()
+                if self.group is not None:
+                    self.group.tick()
+            except OSError as e:
+                logging.error(f"[OUTPUT] Error cerrando lotes/fsync pendientes: {e}")
+
+    def close(self):
+        """Publica los lotes abiertos y sincroniza lo pendiente."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        for batch in list(self._batches.values()):
+            batch.close()
+        if self.group is not None:
+            self.group.flush()
+
+
+# Un escritor por configuración y proceso (los workers en modo proceso crean el suyo)
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(settings=None):
+    """Devuelve el OutputWriter compartido para unos OutputSettings (o los de por defecto)."""
+    key = settings.cache_key() if settings is not None else None
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            if not _writers:
+                # También al terminar un worker de ProcessPoolExecutor (no ejecuta atexit)
+                from multiprocessing import util
+                util.Finalize(None, close_writers, exitpriority=10)
+            writer = OutputWriter(settings)
+            _writers[key] = writer
+        return writer
+
+
+def close_writers():
+    """Publica los lotes abiertos y cierra los escritores de este proceso."""
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
@@ -49,12 +49,17 @@ class ConfigWindow(QtWidgets.QDialog):
         self.cond_field_idx = QtWidgets.QSpinBox()
         self.cond_field_idx.setMaximum(200)
         self.cond_operator = QtWidgets.QComboBox()
-        self.cond_operator.addItems(["equals"])
+        self.cond_operator.addItems(["equals", "not_equals", "in", "regex", "startswith",
+                                     "exists", "gt", "gte", "lt", "lte"])
         self.cond_value = QtWidgets.QLineEdit()
+        self.cond_value.setPlaceholderText("'in': valores separados por comas")
+        self.cond_match = QtWidgets.QComboBox()
+        self.cond_match.addItems(["first", "any", "all"])
         cond_form.addRow("Segmento cond:",    self.cond_segment)
         cond_form.addRow("Índice cond:",      self.cond_field_idx)
         cond_form.addRow("Operador:",         self.cond_operator)
         cond_form.addRow("Valor cond:",       self.cond_value)
+        cond_form.addRow("Segmentos:",        self.cond_match)
         self.cond_widget.setVisible(False)
         self.cond_chk.stateChanged.connect(
             lambda s: self.cond_widget.setVisible(s == QtCore.Qt.Checked)
@@ -98,6 +103,7 @@ class ConfigWindow(QtWidgets.QDialog):
         self.modify_segment_edit     = QtWidgets.QLineEdit()
         self.modify_field_idx_edit   = QtWidgets.QLineEdit()
         self.modify_new_value_edit   = QtWidgets.QLineEdit()
+        self.modify_field_idx_edit.setPlaceholderText("Índice (ej. 5) o ruta de componente (ej. 5.1, 3[2].1)")
         f3.addRow("Segmento:", self.modify_segment_edit)
         f3.addRow("Índice de campo:", self.modify_field_idx_edit)
         f3.addRow("Nuevo valor:", self.modify_new_value_edit)
@@ -118,6 +124,8 @@ class ConfigWindow(QtWidgets.QDialog):
         self.copy_src_idx_edit = QtWidgets.QLineEdit()
         self.copy_dst_seg_edit = QtWidgets.QLineEdit()
         self.copy_dst_idx_edit = QtWidgets.QLineEdit()
+        self.copy_src_idx_edit.setPlaceholderText("Índice o ruta de componente (ej. 3[2].1)")
+        self.copy_dst_idx_edit.setPlaceholderText("Índice o ruta de componente (ej. 2.1)")
         f5.addRow("Seg fuente:", self.copy_src_seg_edit)
         f5.addRow("Índice fuente:", self.copy_src_idx_edit)
         f5.addRow("Seg destino:", self.copy_dst_seg_edit)
@@ -166,12 +174,18 @@ class ConfigWindow(QtWidgets.QDialog):
         rule = {}
         # Condición
         if self.cond_chk.isChecked():
+            operator = self.cond_operator.currentText()
+            value = self.cond_value.text().strip()
             rule["condition"] = {
                 "segment":     self.cond_segment.text().strip(),
                 "field_index": self.cond_field_idx.value(),
-                "operator":    self.cond_operator.currentText(),
-                "value":       self.cond_value.text().strip()
+                "operator":    operator,
+                "value":       [v.strip() for v in value.split(",")] if operator == "in" else value
             }
+            if operator == "exists":
+                del rule["condition"]["value"]
+            if self.cond_match.currentText() != "first":
+                rule["condition"]["match"] = self.cond_match.currentText()
             rule["actions"] = []
         # Datos de la acción seleccionada
         action = self.action_combo.currentText()
@@ -186,12 +200,14 @@ class ConfigWindow(QtWidgets.QDialog):
                 "values":      self.add_values_edit.text().split("|") if self.add_values_edit.text() else []
             }
         elif action == "modify_field":
-            details = {
-                "action":     "modify_field",
-                "segment":    self.modify_segment_edit.text().strip(),
-                "field_index":int(self.modify_field_idx_edit.text()),
-                "new_value":  self.modify_new_value_edit.text().strip()
-            }
+            segment = self.modify_segment_edit.text().strip()
+            field = self.modify_field_idx_edit.text().strip()
+            if field.isdigit():
+                details = {"action": "modify_field", "segment": segment, "field_index": int(field)}
+            else:
+                # Ruta de componente/repetición, ej. 5.1 o 3[2].1 -> PID.5.1
+                details = {"action": "modify_field", "path": f"{segment}.{field}"}
+            details["new_value"] = self.modify_new_value_edit.text().strip()
         elif action == "reorder_fields":
             details = {
                 "action":   "reorder_fields",
@@ -199,13 +215,22 @@ class ConfigWindow(QtWidgets.QDialog):
                 "new_order":[int(x) for x in self.reorder_order_edit.text().split(",")]
             }
         elif action == "copy_value":
-            details = {
-                "action":          "copy_value",
-                "source_segment":  self.copy_src_seg_edit.text().strip(),
-                "source_field":    int(self.copy_src_idx_edit.text()),
-                "dest_segment":    self.copy_dst_seg_edit.text().strip(),
-                "dest_field":      int(self.copy_dst_idx_edit.text())
-            }
+            src_field = self.copy_src_idx_edit.text().strip()
+            dst_field = self.copy_dst_idx_edit.text().strip()
+            if src_field.isdigit() and dst_field.isdigit():
+                details = {
+                    "action":          "copy_value",
+                    "source_segment":  self.copy_src_seg_edit.text().strip(),
+                    "source_field":    int(src_field),
+                    "dest_segment":    self.copy_dst_seg_edit.text().strip(),
+                    "dest_field":      int(dst_field)
+                }
+            else:
+                details = {
+                    "action":      "copy_value",
+                    "source_path": f"{self.copy_src_seg_edit.text().strip()}.{src_field}",
+                    "dest_path":   f"{self.copy_dst_seg_edit.text().strip()}.{dst_field}"
+                }
         elif action == "agregar_campos":
             details = {
                 "action":     "agregar_campos",
@@ -1,14 +1,27 @@
 import os
-import shutil
+import time
 import logging
 import json
+from collections import deque
 from PyQt5 import QtWidgets, QtCore
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 from config import manager as config_manager
-from core import hl7_parser
+from core import hl7_stream
 from core import hl7_watcher
+from core import routing
+from core import worker_pool
+from core import ingestion
+from core import backup
 from gui import config_window
 
+# Líneas que conserva el área de logs (las más antiguas se descartan)
+LOG_MAX_LINES = 5000
+# Intervalo de volcado de eventos al área de logs y a los contadores (ms)
+LOG_FLUSH_INTERVAL_MS = 250
+# Ventana para calcular mensajes por segundo
+RATE_WINDOW_SECONDS = 5.0
+
+
 class MainWindow(QtWidgets.QMainWindow):
     """
     Ventana principal de la aplicación HL7 Editor.
@@ -17,7 +30,13 @@ class MainWindow(QtWidgets.QMainWindow):
       - Seleccionar directorios de entrada, salida y backups.
       - Iniciar y detener la monitorización de archivos HL7.
       - Visualizar logs y gestionar configuraciones.
+
+    Los workers no tocan los widgets: publican eventos con la señal `event`
+    (entregada en el hilo de la GUI) y un QTimer los vuelca por lotes.
     """
+    # (tipo, texto, mensajes): 'log', 'ok' (archivo procesado) o 'error'
+    event = QtCore.pyqtSignal(str, str, int)
+
     def __init__(self):
         super().__init__()
         # Inicializar atributos antes de crear la UI
@@ -27,10 +46,24 @@ class MainWindow(QtWidgets.QMainWindow):
         self.configurations = config_manager.load_configurations()
         self.active_config = None
         self.watcher = None
+        self.pool = None
+        self.ingestion = None
+        self.backup_settings = None
+
+        # Eventos pendientes de mostrar y contadores de la sesión de monitorización
+        self._pending_lines = deque(maxlen=LOG_MAX_LINES)
+        self.files_processed = 0
+        self.files_failed = 0
+        self.messages_processed = 0
+        self._rate_samples = deque()
 
         self.setWindowTitle("HL7 Editor")
         self.resize(1000, 700)
         self.init_ui()  # Ahora self.configurations ya está definido
+        self.event.connect(self._on_event)
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.timeout.connect(self._flush_events)
+        self._flush_timer.start(LOG_FLUSH_INTERVAL_MS)
         self.log("Aplicación iniciada.")
 
     def init_ui(self):
@@ -87,20 +120,64 @@ class MainWindow(QtWidgets.QMainWindow):
         self.stop_btn.setStyleSheet("background-color: red; color: white;")
         monitor_layout.addWidget(self.start_btn)
         monitor_layout.addWidget(self.stop_btn)
+        self.archive_chk = QtWidgets.QCheckBox("Archivar backups comprimidos")
+        self.archive_chk.setChecked(True)
+        self.archive_chk.setToolTip("Agrega los originales a archivos .tar.gz por hora en lugar de un archivo por mensaje")
+        monitor_layout.addWidget(self.archive_chk)
         main_layout.addLayout(monitor_layout)
 
         self.start_btn.clicked.connect(self.start_monitoring)
         self.stop_btn.clicked.connect(self.stop_monitoring)
 
-        # Área de logs
-        self.log_area = QtWidgets.QTextEdit()
+        # Contadores en vivo
+        self.stats_label = QtWidgets.QLabel()
+        main_layout.addWidget(self.stats_label)
+        self._update_stats(0.0)
+
+        # Área de logs (acotada: se descartan las líneas más antiguas)
+        self.log_area = QtWidgets.QPlainTextEdit()
         self.log_area.setReadOnly(True)
+        self.log_area.setMaximumBlockCount(LOG_MAX_LINES)
         main_layout.addWidget(self.log_area)
 
     def log(self, message):
-        """Muestra un mensaje en el área de logs y lo registra en el sistema."""
-        self.log_area.append(message)
+        """
+        Registra un mensaje en el sistema y lo encola para el área de logs.
+        Se puede llamar desde cualquier hilo.
+        """
         logging.info(message)
+        self.event.emit('log', message, 0)
+
+    def _on_event(self, kind, text, messages):
+        # Se ejecuta en el hilo de la GUI; sólo acumula, el timer vuelca
+        if kind == 'ok':
+            self.files_processed += 1
+            self.messages_processed += messages
+        elif kind == 'error':
+            self.files_failed += 1
+        if text:
+            self._pending_lines.append(text)
+
+    def _flush_events(self):
+        """Vuelca los eventos acumulados al área de logs y actualiza los contadores."""
+        if self._pending_lines:
+            self.log_area.appendPlainText('\n'.join(self._pending_lines))
+            self._pending_lines.clear()
+        now = time.monotonic()
+        samples = self._rate_samples
+        samples.append((now, self.messages_processed))
+        while now - samples[0][0] > RATE_WINDOW_SECONDS:
+            samples.popleft()
+        elapsed = now - samples[0][0]
+        self._update_stats((samples[-1][1] - samples[0][1]) / elapsed if elapsed > 0 else 0.0)
+
+    def _update_stats(self, rate):
+        queued = 0
+        if self.pool is not None:
+            queued = self.pool.pending + self.ingestion.pending
+        self.stats_label.setText(
+            f"Procesados: {self.files_processed} archivos ({self.messages_processed} mensajes)  |  "
+            f"Fallidos: {self.files_failed}  |  En cola: {queued}  |  {rate:.1f} msgs/s")
 
     def select_input_dir(self):
         """Permite seleccionar el directorio de entrada."""
@@ -126,7 +203,7 @@ class MainWindow(QtWidgets.QMainWindow):
     def refresh_config_combo(self):
         """Actualiza el combobox de configuraciones disponibles."""
         self.config_combo.clear()
-        self.config_combo.addItems(list(self.configurations.keys()))
+        self.config_combo.addItems(config_manager.config_names(self.configurations))
 
     def select_active_config(self):
         """Selecciona la configuración activa según el combobox."""
@@ -154,7 +231,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """Crea una nueva configuración vacía a partir del nombre ingresado por el usuario."""
         config_name, ok = QtWidgets.QInputDialog.getText(self, "Nueva Configuración", "Ingrese el nombre de la nueva configuración:")
         if ok and config_name:
-            if config_name in self.configurations:
+            if config_name in self.configurations or config_name in config_manager.RESERVED_KEYS:
                 QMessageBox.warning(self, "Configuración", "Esa configuración ya existe.")
             else:
                 self.configurations[config_name] = []  # Configuración vacía (lista de reglas)
@@ -187,15 +264,41 @@ class MainWindow(QtWidgets.QMainWindow):
             QMessageBox.warning(self, "Directorios", "Debe seleccionar los directorios de entrada, salida y backups.")
             return
 
+        if not (self.active_config and self.active_config in self.configurations):
+            if config_manager.ROUTES_KEY in self.configurations:
+                self.log("Sin configuración activa: se aplicará la tabla de enrutado a cada mensaje.")
+            else:
+                self.log("No se aplican transformaciones (ninguna configuración activa).")
+        self.files_processed = self.files_failed = self.messages_processed = 0
+        self._rate_samples.clear()
+
+        # El modo de backup se fija al iniciar (los workers no leen widgets)
+        self.backup_settings = backup.BackupSettings(self.backup_dir) if self.archive_chk.isChecked() else None
+        if self.backup_settings is not None:
+            backup.get_archiver(self.backup_settings).recover()
+
+        # Los archivos detectados se encolan y se procesan fuera del hilo del watcher;
+        # la ingesta evita duplicados y espera a que el archivo termine de escribirse
+        self.pool = worker_pool.ProcessingPool(self.process_file, workers=1)
+        self.ingestion = ingestion.IngestionQueue(self.pool.submit)
+        self.pool.on_done = self.pool.on_error = lambda path, _, ingest=self.ingestion: ingest.done(path)
+        self.pool.start()
+        self.ingestion.start()
         # Inicia el Watcher
-        self.watcher = hl7_watcher.HL7Watcher(self.input_dir, self.process_file)
+        self.watcher = hl7_watcher.HL7Watcher(self.input_dir, self.ingestion.offer)
         self.watcher.start()
         self.log("Monitorización iniciada.")
 
     def stop_monitoring(self):
         """Detiene la monitorización del directorio de entrada."""
         if self.watcher:
+            self.pool.shutdown(wait=False)
+            self.ingestion.stop()
             self.watcher.stop()
+            self.watcher = None
+            self.pool = None
+            self.ingestion = None
+            backup.close_archivers()
             self.log("Monitorización detenida.")
         else:
             self.log("No hay monitorización activa.")
@@ -203,26 +306,26 @@ class MainWindow(QtWidgets.QMainWindow):
     def process_file(self, file_path):
         """
         Procesa un archivo HL7:
-          - Lee y parsea el archivo.
+          - Lee el archivo en streaming, mensaje a mensaje (admite lotes FHS/BHS).
           - Aplica transformaciones según la configuración activa (si se seleccionó).
           - Escribe el archivo modificado en el directorio de salida.
-          - Mueve el archivo original a la carpeta de backups.
+          - Mueve el archivo original a la carpeta de backups (o lo encola para
+            archivarlo comprimido si está marcado "Archivar backups comprimidos").
         """
-        self.log(f"Procesando archivo: {file_path}")
         try:
-            segments = hl7_parser.parse_hl7_file(file_path)
-            if self.active_config and self.active_config in self.configurations:
-                transformations = self.configurations[self.active_config]
-                segments = hl7_parser.apply_transformations(segments, transformations)
-            else:
-                self.log("No se aplican transformaciones (ninguna configuración activa).")
+            # Configuración activa o, si no hay, la que elijan las rutas para cada mensaje
+            plan = routing.resolve_plan(self.active_config, self.configurations)
             # Generar el nombre del archivo de salida
             base_name = os.path.basename(file_path)
             output_file = os.path.join(self.output_dir, base_name)
-            hl7_parser.write_hl7_file(segments, output_file)
-            # Mover el archivo original a backups
-            backup_file = os.path.join(self.backup_dir, base_name)
-            shutil.move(file_path, backup_file)
-            self.log(f"Archivo procesado. Original movido a backups: {backup_file}")
+            # Transformar y escribir mensaje a mensaje (archivos de lote incluidos)
+            count = hl7_stream.transform_file(file_path, output_file, plan)
+            # Retirar el original a backups
+            backup_file = backup.backup_file(file_path, self.backup_dir, self.backup_settings)
+            # Una línea por archivo sólo en el log; en pantalla se actualizan los contadores
+            logging.info(f"Archivo procesado: {file_path}. Original movido a backups: {backup_file}")
+            self.event.emit('ok', '', count)
         except Exception as e:
-            self.log(f"Error procesando {file_path}: {str(e)}")
+            message = f"Error procesando {file_path}: {str(e)}"
+            logging.error(message)
+            self.event.emit('error', message, 0)
@@ -4,102 +4,427 @@ import argparse
 import logging
 import time
 import signal
+import functools
+import multiprocessing
 
-from PyQt5 import QtWidgets
-# importamos sólo en GUI mode
-try:
-    from gui.main_window import MainWindow
-except ImportError:
-    MainWindow = None
-
+# Sólo módulos de core y config: PyQt5/gui, watchdog y asyncio se importan en
+# el subcomando que los usa para que el arranque de la CLI sea rápido y no
+# requiera Qt en servidores sin entorno gráfico.
 from config.manager import (
+    CONFIG_FILE,
+    config_names,
     load_configurations,
     save_configurations,
     export_configurations,
     import_configurations
 )
-from core.hl7_parser import (
-    parse_hl7_file,
-    apply_transformations,
-    write_hl7_file
-)
-from core.hl7_watcher import HL7Watcher
-
-# Directorio de logs
-LOG_DIR = "logs"
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
-logging.basicConfig(
-    filename=os.path.join(LOG_DIR, "hl7_processor.log"),
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+from core.processor import process_file, process_message_text
+from core.worker_pool import ProcessingPool, POOL_MODES
+from core.ingestion import IngestionQueue
+from config.reloader import ConfigReloader
+from core.log_setup import setup_logging, worker_logging_args
+from core.dedup import DedupSettings, KEY_MODES, close_dedup, dedup_totals
+from core.writer import OutputSettings, TERMINATORS, FSYNC_POLICIES, close_writers
+from core.backup import BackupSettings, BACKUP_MODES, CODECS, get_archiver, close_archivers
+from core.metrics import METRICS, RULE_SAMPLE_EVERY
+from core.profiling import ProfileSettings, SORT_KEYS
+from core.journal import JournalSettings, replay_journal, close_journals
+
+
+def _close_senders(forward):
+    """Cierra las conexiones MLLP salientes (sólo existen con --forward)."""
+    if forward:
+        from core.mllp_sender import close_senders
+        close_senders()
 
-def process_file_cli(file_path, output_dir, backup_dir, config_name, configs):
+def process_file_cli(file_path, output_dir, backup_dir, config_name, configs, forward=None, spool_dir=None,
+                     dedup=None, output=None, backup=None, profile=None):
     """Procesa un solo archivo HL7 y sale."""
     print(f"[CLI] Procesando archivo: {file_path}")
     logging.info(f"[CLI] Procesando archivo: {file_path}")
 
-    segments = parse_hl7_file(file_path)
-    if config_name and config_name in configs:
-        segments = apply_transformations(segments, configs[config_name])
-
-    output_file = os.path.join(output_dir or os.path.dirname(file_path), os.path.basename(file_path))
-    write_hl7_file(segments, output_file)
-
-    if backup_dir:
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        os.replace(file_path, os.path.join(backup_dir, os.path.basename(file_path)))
+    try:
+        output_file = process_file(file_path, output_dir, backup_dir, config_name, configs,
+                                   forward=forward, spool_dir=spool_dir, dedup=dedup, output=output,
+                                   backup=backup, profile=profile)
+    finally:
+        _close_senders(forward)
+        close_dedup()
+        close_writers()
+        close_archivers()
 
     print(f"[CLI] Archivo procesado. Salida en: {output_file}")
     logging.info(f"[CLI] Archivo procesado. Salida en: {output_file}")
 
-def monitor_cli(input_dir, output_dir, backup_dir, config_name, configs):
-    """Arranca el watcher en modo headless y da feedback en consola."""
-    print(f"[CLI] Monitor iniciando en: {input_dir} (config: {config_name})")
-    logging.info(f"[CLI] Monitorizando {input_dir} (config: {config_name})")
+def monitor_cli(input_dir, output_dir, backup_dir, config_name, configs,
+                workers=1, queue_size=None, pool_mode="thread", settle_time=1.0,
+                forward=None, spool_dir=None, reload_interval=2.0, dedup=None, output=None, backup=None,
+                metrics_port=0, metrics_host="127.0.0.1", metrics_file=None, metrics_interval=15.0,
+                metrics_rule_sample=RULE_SAMPLE_EVERY, profile=None, journal=None):
+    """
+    Arranca el watcher en modo headless y da feedback en consola.
 
-    # Procesar archivos existentes al inicio
-    try:
-        for fname in os.listdir(input_dir):
-            full = os.path.join(input_dir, fname)
-            if os.path.isfile(full) and full.lower().endswith('.hl7'):
-                print(f"[CLI] Procesando existente al inicio: {full}")
-                process_file_cli(full, output_dir, backup_dir, config_name, configs)
-    except Exception as e:
-        print(f"[CLI][ERROR] Al procesar existentes: {e}")
-        logging.error(f"[CLI] Error procesando existentes en {input_dir}: {e}")
-
-    # Definir señal de terminación
+    configurations.json se vigila cada reload_interval segundos (0 desactiva la
+    recarga): los cambios válidos se aplican a los archivos siguientes sin
+    reiniciar; los inválidos se rechazan y sigue la última versión correcta.
+
+    Con metrics_port (o metrics_file) se activan las métricas (core.metrics):
+    se sirven en http://metrics_host:metrics_port/metrics y/o se vuelcan a
+    metrics_file cada metrics_interval segundos.
+
+    Con journal (core.journal.JournalSettings) cada archivo registra sus etapas
+    en el diario y, antes de arrancar, se termina o deshace lo que dejó a medias
+    la ejecución anterior.
+    """
+    print(f"[CLI] Monitor iniciando en: {input_dir} (config: {config_name}, workers: {workers} {pool_mode})")
+    logging.info(f"[CLI] Monitorizando {input_dir} (config: {config_name}, workers: {workers} {pool_mode})")
+
+    # Pool de workers alimentado por una cola acotada
+    def on_done(path, output_file):
+        ingestion.done(path)
+        print(f"[CLI] Archivo procesado. Salida en: {output_file}")
+
+    def on_error(path, error):
+        ingestion.done(path)
+        print(f"[CLI][ERROR] Procesando {path}: {error}")
+
+    # Recarga en caliente: cada archivo se procesa con la instantánea vigente al despacharlo
+    reloader = ConfigReloader(CONFIG_FILE, interval=reload_interval, initial=configs,
+                              required=[config_name] if config_name else ())
+    reloader.start()
+
+    # Originales que quedaron sin archivar en la ejecución anterior
+    if backup is not None:
+        get_archiver(backup).recover()
+
+    # Archivos que la ejecución anterior dejó a medias: terminar o deshacer antes de escanear la entrada
+    if journal is not None:
+        rolled_back, finished = replay_journal(journal, backup_dir, backup, dedup)
+        if rolled_back or finished:
+            print(f"[CLI] Diario: {finished} archivos terminados, {rolled_back} se reprocesarán")
+
+    handler = functools.partial(
+        process_file,
+        output_dir=output_dir, backup_dir=backup_dir, config_name=config_name,
+        forward=forward, spool_dir=spool_dir, dedup=dedup, output=output, backup=backup, profile=profile,
+        journal=journal
+    )
+    pool = ProcessingPool(handler, workers=workers, queue_size=queue_size, mode=pool_mode,
+                          on_done=on_done, on_error=on_error,
+                          dispatch_kwargs=lambda: {'configs': reloader.current().configs})
+    pool.start()
+
+    # Ingesta: deduplica rutas y espera a que cada archivo termine de escribirse
+    ingestion = IngestionQueue(pool.submit, settle_time=settle_time)
+    ingestion.start()
+
+    metrics_exporters = []
+    if metrics_port or metrics_file:
+        from core.metrics import MetricsServer, MetricsSnapshotWriter
+        METRICS.enable(metrics_rule_sample)
+        METRICS.gauge('hl7_pending_files', lambda: ingestion.pending + pool.pending,
+                      'Archivos detectados pendientes de procesar')
+        METRICS.gauge('hl7_in_flight_files', lambda: pool.in_flight, 'Archivos en proceso')
+        if backup is not None:
+            METRICS.gauge('hl7_backup_pending_files', lambda: get_archiver(backup).pending,
+                          'Originales pendientes de archivar')
+        if metrics_port:
+            metrics_exporters.append(MetricsServer(metrics_port, metrics_host))
+        if metrics_file:
+            metrics_exporters.append(MetricsSnapshotWriter(metrics_file, metrics_interval))
+        for exporter in metrics_exporters:
+            exporter.start()
+
+    # Definir señal de terminación: se terminan los archivos en curso antes de salir
     def _handle_signal(sig, frame):
+        print("[CLI] Deteniendo monitor, esperando archivos en curso...")
+        pool.shutdown(wait=True)
+        ingestion.stop()
         watcher.stop()
+        reloader.stop()
+        _close_senders(forward)
+        close_dedup()
+        close_writers()
+        close_archivers()
+        close_journals()
+        for exporter in metrics_exporters:
+            exporter.stop()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, _handle_signal)
     signal.signal(signal.SIGTERM, _handle_signal)
 
-    # Callback para nuevos archivos
+    # Callback para archivos detectados (existentes al inicio y nuevos): sólo los registra
     def callback(path):
-        print(f"[CLI] Detectado y procesando: {path}")
-        try:
-            process_file_cli(path, output_dir, backup_dir, config_name, configs)
-        except Exception as e:
-            print(f"[CLI][ERROR] Procesando {path}: {e}")
-            logging.error(f"[CLI] Error procesando {path}: {e}")
+        if ingestion.offer(path):
+            print(f"[CLI] Detectado: {path}")
 
+    # El watcher procesa también los archivos existentes al iniciar
+    from core.hl7_watcher import HL7Watcher
     watcher = HL7Watcher(input_dir, callback)
     watcher.start()
 
     # Mantener vivo y mostrar heartbeat
     while True:
         time.sleep(10)
-        print(f"[CLI] Monitor activo en: {input_dir} — esperando nuevos archivos...")
+        # Los duplicados sólo se cuentan aquí con workers en hilos (los procesos llevan su propia cuenta en el log)
+        suppressed = f", duplicados: {dedup_totals()[1]}" if dedup and pool_mode == "thread" else ""
+        print(f"[CLI] Monitor activo en: {input_dir} — esperando estabilidad: {ingestion.pending}, "
+              f"en cola: {pool.pending}, en proceso: {ingestion.in_flight}{suppressed}")
+
+def listen_cli(host, port, output_dir, config_name, configs, executor_mode="none", workers=None, encoding="utf-8",
+               forward=None, spool_dir=None, dedup=None, output=None):
+    """Arranca un servidor MLLP que transforma cada mensaje recibido y responde ACK/NAK."""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    from core.mllp import MLLPServer
+
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    handler = functools.partial(
+        process_message_text, output_dir=output_dir, config_name=config_name, configs=configs,
+        forward=forward, spool_dir=spool_dir, dedup=dedup, output=output
+    )
+    executor = None
+    if executor_mode == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers)
+    elif executor_mode == "process":
+        initializer, initargs = worker_logging_args()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+
+    server = MLLPServer(host, port, handler, executor=executor, encoding=encoding)
+
+    async def run():
+        await server.start()
+        print(f"[CLI] Escuchando MLLP en {server.host}:{server.port} (config: {config_name}, executor: {executor_mode})")
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, server.close)
+            except NotImplementedError:
+                # Windows: KeyboardInterrupt detiene el loop
+                pass
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        _close_senders(forward)
+        close_dedup()
+        close_writers()
+        print(f"[CLI] Servidor MLLP detenido. Mensajes: {server.messages}, errores: {server.errors}")
+        logging.info(f"[CLI] MLLP detenido. Mensajes: {server.messages}, errores: {server.errors}")
+
+def process_dir_cli(input_dir, output_dir, config_name, configs, include, exclude, workers, pool_mode, resume,
+                    output=None):
+    """Reprocesa en bloque un árbol de directorios e informa el throughput."""
+    if config_name and config_name not in configs:
+        print(f"[CLI][ERROR] Configuración no encontrada: {config_name}")
+        sys.exit(1)
+    print(f"[CLI] Procesando directorio: {input_dir} -> {output_dir} (config: {config_name}, "
+          f"workers: {workers or os.cpu_count()} {pool_mode}{', reanudando' if resume else ''})")
+
+    last = [time.perf_counter()]
+
+    def progress(report):
+        now = time.perf_counter()
+        if now - last[0] >= 5:
+            last[0] = now
+            print(f"[CLI] ... {report.files} archivos, {report.messages} mensajes")
+
+    from core.batch import process_directory
+    report = process_directory(input_dir, output_dir, config_name, configs,
+                               include=include or ['*.hl7'], exclude=exclude or [],
+                               workers=workers, pool_mode=pool_mode, resume=resume, progress=progress,
+                               output=output)
+    print(report.summary())
+    for src, error in report.errors[:20]:
+        print(f"[CLI][ERROR] {src}: {error}")
+    if report.errors:
+        sys.exit(1)
+
+def extract_cli(sources, fields, output, fmt, workers, multi, join_sep, with_source, include, exclude):
+    """Extrae campos de todos los mensajes a un archivo columnar e informa el throughput."""
+    from core.extract import extract_to_file
+    from core.field_path import FieldPathError
+
+    paths = [p.strip() for spec in fields for p in spec.split(',') if p.strip()]
+    print(f"[CLI] Extrayendo {', '.join(paths)} de {', '.join(sources)} -> {output}")
+    try:
+        rows, elapsed = extract_to_file(sources, paths, output, fmt=fmt, workers=workers, multi=multi,
+                                        join_sep=join_sep, with_source=with_source,
+                                        include=include or ['*.hl7'], exclude=exclude or [])
+    except (FieldPathError, ImportError) as e:
+        print(f"[CLI][ERROR] {e}")
+        sys.exit(1)
+    rate = rows / elapsed if elapsed else 0.0
+    print(f"[CLI] {rows} mensajes en {elapsed:.2f} s ({rate * 60:,.0f} mensajes/min)")
+
+def _config_version(configs, name, path):
+    """Reglas de la configuración name de configurations.json o de otro archivo exportado (path)."""
+    if path:
+        if not os.path.exists(path):
+            raise ValueError(f"No existe el archivo de configuraciones: {path}")
+        configs = import_configurations(path)
+    if name not in config_names(configs):
+        raise ValueError(f"La configuración '{name}' no existe en {path or CONFIG_FILE}")
+    return configs[name], f"{name} ({path or CONFIG_FILE})"
+
+def test_config_cli(sources, configs, config_name, old_name, old_file, new_file, workers, include, exclude,
+                    diff_output, examples):
+    """Compara dos versiones de una configuración sobre un corpus sin tocar los archivos."""
+    from core.config_diff import compare_configurations
+    from core.rule_compiler import RuleValidationError
+
+    try:
+        old_rules, old_label = _config_version(configs, old_name or config_name, old_file)
+        new_rules, new_label = _config_version(configs, config_name, new_file)
+    except ValueError as e:
+        print(f"[CLI][ERROR] {e}")
+        sys.exit(1)
+    if old_label == new_label:
+        print("[CLI][ERROR] Las dos versiones son la misma: indica --old o --old-file")
+        sys.exit(1)
+    print(f"[CLI] Comparando {old_label} -> {new_label} en {', '.join(sources)}")
+    try:
+        report = compare_configurations(sources, old_rules, new_rules, old_label, new_label, workers=workers,
+                                        include=include or ['*.hl7'], exclude=exclude or [],
+                                        diff_output=diff_output, examples=examples)
+    except RuleValidationError as e:
+        print(f"[CLI][ERROR] Configuración inválida: {e}")
+        sys.exit(1)
+    print(report.summary())
+    if diff_output:
+        print(f"[CLI] Diferencias campo a campo en: {diff_output}")
+
+def _add_forward_arguments(subparser):
+    subparser.add_argument("--forward",   metavar="HOST:PUERTO", help="Enviar la salida por MLLP en lugar de escribir archivos")
+    subparser.add_argument("--spool-dir", default="spool", help="Carpeta donde guardar mensajes si el destino MLLP no responde")
+
+def _add_dedup_arguments(subparser):
+    subparser.add_argument("--dedup",            choices=KEY_MODES,
+                           help="Omitir mensajes repetidos según MSH-4 + MSH-10 (control-id) o su contenido")
+    subparser.add_argument("--dedup-db",         default=os.path.join("state", "dedup.sqlite"),
+                           help="Base SQLite con las huellas vistas (sobrevive a reinicios)")
+    subparser.add_argument("--dedup-ttl",        type=float, default=24, help="Horas durante las que un mensaje cuenta como repetido")
+    subparser.add_argument("--dedup-size",       type=int, default=100000, help="Huellas recientes en memoria")
+    subparser.add_argument("--dedup-divert-dir", help="Guardar los duplicados en esta carpeta en lugar de descartarlos")
+
+def _add_output_arguments(subparser, batch=True):
+    subparser.add_argument("--segment-terminator", choices=tuple(TERMINATORS), default="cr",
+                           help="Terminador de segmento de las salidas (por defecto cr, el estándar HL7)")
+    subparser.add_argument("--fsync",              choices=FSYNC_POLICIES, default="none",
+                           help="Sincronizar cada salida con el disco: none, file (cada archivo) o group")
+    subparser.add_argument("--group-commit-files", type=int, default=32, help="Con --fsync group: archivos por sincronización")
+    subparser.add_argument("--group-commit-ms",    type=float, default=200, help="Con --fsync group: milisegundos máximos entre sincronizaciones")
+    if batch:
+        subparser.add_argument("--batch-output",      type=int, default=0, metavar="N",
+                               help="Agrupar las salidas en archivos de lote FHS/BHS de hasta N mensajes")
+        subparser.add_argument("--batch-max-mb",      type=float, default=16, help="Tamaño máximo de cada lote (MB)")
+        subparser.add_argument("--batch-max-seconds", type=float, default=60, help="Segundos máximos antes de cerrar un lote")
+
+def _output_settings(args):
+    """OutputSettings a partir de los argumentos."""
+    return OutputSettings(args.segment_terminator, args.fsync, args.group_commit_files, args.group_commit_ms,
+                          getattr(args, "batch_output", 0), int(getattr(args, "batch_max_mb", 16) * 1024 * 1024),
+                          getattr(args, "batch_max_seconds", 60))
+
+def _add_backup_arguments(subparser):
+    subparser.add_argument("--backup-mode",           choices=BACKUP_MODES, default="archive",
+                           help="archive: agregar los originales a tar comprimidos; files: un archivo por original")
+    subparser.add_argument("--backup-compression",    choices=CODECS, default="gz", help="Compresión de los tar (zst requiere zstandard)")
+    subparser.add_argument("--backup-rotate-minutes", type=float, default=60, help="Minutos que cubre cada tar (por defecto 60)")
+    subparser.add_argument("--backup-max-mb",         type=float, default=256, help="Tamaño máximo de cada tar (MB)")
+    subparser.add_argument("--backup-retention-days", type=float, default=0, help="Eliminar los tar más antiguos (0 = conservar siempre)")
+
+def _add_metrics_arguments(subparser):
+    subparser.add_argument("--metrics-port",        type=int, default=0,
+                           help="Servir métricas Prometheus en este puerto (/metrics; 0 = desactivado)")
+    subparser.add_argument("--metrics-host",        default="127.0.0.1", help="Interfaz del endpoint de métricas (por defecto 127.0.0.1)")
+    subparser.add_argument("--metrics-file",        help="Volcar las métricas periódicamente a este archivo (.prom)")
+    subparser.add_argument("--metrics-interval",    type=float, default=15, help="Segundos entre volcados de --metrics-file")
+    subparser.add_argument("--metrics-rule-sample", type=int, default=RULE_SAMPLE_EVERY, metavar="N",
+                           help=f"Medir la duración de cada regla en 1 de cada N mensajes (por defecto {RULE_SAMPLE_EVERY})")
+
+def _add_journal_arguments(subparser):
+    subparser.add_argument("--journal-dir",   default=os.path.join("state", "journal"),
+                           help="Carpeta del diario de procesamiento (reanudación tras una caída)")
+    subparser.add_argument("--no-journal",    action="store_true", help="No llevar diario de procesamiento")
+    subparser.add_argument("--journal-fsync", action="store_true", help="Sincronizar con el disco cada registro del diario")
+
+def _journal_settings(args):
+    """JournalSettings a partir de los argumentos (None sin diario)."""
+    if args.no_journal:
+        return None
+    if args.batch_output:
+        # Los lotes se publican después de retirar los originales: el diario no puede garantizarlos
+        print("[CLI] Diario desactivado: no es compatible con --batch-output")
+        return None
+    return JournalSettings(args.journal_dir, fsync=args.journal_fsync)
+
+def _add_profile_arguments(subparser):
+    subparser.add_argument("--profile",        type=int, default=0, metavar="N",
+                           help="Perfilar (cProfile) uno de cada N mensajes (0 = desactivado)")
+    subparser.add_argument("--profile-dir",    default="profiles", help="Carpeta donde guardar los perfiles (por defecto profiles)")
+    subparser.add_argument("--profile-memory", action="store_true", help="Guardar también una instantánea de tracemalloc por perfil")
+
+def _profile_settings(args):
+    """ProfileSettings a partir de los argumentos (None sin --profile)."""
+    if not args.profile:
+        return None
+    return ProfileSettings(args.profile_dir, args.profile, args.profile_memory)
+
+def profile_summary_cli(profile_dir, config, top, sort):
+    """Suma los perfiles guardados con --profile y muestra lo que más pesa."""
+    from core.profiling import summarize_profiles
+    if not os.path.isdir(profile_dir) or not summarize_profiles(profile_dir, config, top, sort):
+        print(f"[CLI] No hay perfiles en {profile_dir}{f' para {config}' if config else ''}.")
+        sys.exit(1)
+
+def _backup_settings(args):
+    """BackupSettings a partir de los argumentos (None si no hay backups o se guardan sueltos)."""
+    if not args.backup_dir or args.backup_mode == "files":
+        return None
+    return BackupSettings(args.backup_dir, args.backup_compression, args.backup_rotate_minutes * 60,
+                          args.backup_max_mb, args.backup_retention_days)
+
+def backup_get_cli(backup_dir, name, control_id, output_dir):
+    """Recupera de los tar de backup los originales con ese nombre o control ID."""
+    from core.backup import find_backups, read_backup
+    rows = find_backups(backup_dir, name=name, control_id=control_id)
+    if not rows:
+        print("[CLI] No hay originales archivados con ese nombre o control ID.")
+        sys.exit(1)
+    os.makedirs(output_dir, exist_ok=True)
+    for fname, archive, offset, size, archived in rows:
+        target = os.path.join(output_dir, fname)
+        with open(target, 'wb') as f:
+            f.write(read_backup(backup_dir, archive, offset))
+        print(f"[CLI] {fname} ({size} bytes, archivado {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(archived))} "
+              f"en {archive}) -> {target}")
+
+def _dedup_settings(args):
+    """DedupSettings a partir de los argumentos (None sin --dedup)."""
+    if not args.dedup:
+        return None
+    return DedupSettings(args.dedup_db, key=args.dedup, ttl=args.dedup_ttl * 3600, capacity=args.dedup_size,
+                         action="divert" if args.dedup_divert_dir else "skip", divert_dir=args.dedup_divert_dir)
 
 def main():
     parser = argparse.ArgumentParser(
         description="HL7 Interface Manager (GUI & CLI)"
     )
+    parser.add_argument("--trace", action="store_true", help="Registrar en el log cada regla aplicada ([RULE]/[COND])")
+    parser.add_argument("--log-dir", default="logs", help="Carpeta del log (por defecto logs)")
+    parser.add_argument("--log-max-mb", type=float, default=10, help="Tamaño máximo del log antes de rotar (MB)")
     sub = parser.add_subparsers(dest="cmd")
 
     # GUI (default)
@@ -108,16 +433,87 @@ def main():
     # Monitor CLI
     sub_mon = sub.add_parser("monitor", help="Monitoriza un directorio en modo CLI")
     sub_mon.add_argument("--input-dir",   required=True, help="Carpeta de entrada")
-    sub_mon.add_argument("--output-dir",  required=True, help="Carpeta de salida")
+    sub_mon.add_argument("--output-dir",  help="Carpeta de salida (obligatoria si no se usa --forward)")
     sub_mon.add_argument("--backup-dir",  required=True, help="Carpeta de backups")
-    sub_mon.add_argument("--config",      required=False, help="Nombre de la configuración a usar")
+    sub_mon.add_argument("--config",      required=False, help="Nombre de la configuración a usar (sin ella se aplican las rutas de __routes__)")
+    sub_mon.add_argument("--workers",     type=int, default=1, help="Número de workers en paralelo (por defecto 1)")
+    sub_mon.add_argument("--queue-size",  type=int, default=None, help="Tamaño máximo de la cola (por defecto 4 x workers)")
+    sub_mon.add_argument("--pool",        choices=POOL_MODES, default="thread", help="Tipo de pool: hilos o procesos")
+    sub_mon.add_argument("--settle-time", type=float, default=1.0, help="Segundos sin cambios de tamaño/mtime antes de procesar un archivo")
+    sub_mon.add_argument("--reload-interval", type=float, default=2.0, help="Segundos entre comprobaciones de cambios en configurations.json (0 = sin recarga)")
+    _add_forward_arguments(sub_mon)
+    _add_dedup_arguments(sub_mon)
+    _add_output_arguments(sub_mon)
+    _add_backup_arguments(sub_mon)
+    _add_metrics_arguments(sub_mon)
+    _add_profile_arguments(sub_mon)
+    _add_journal_arguments(sub_mon)
 
     # Procesar un solo archivo
     sub_one = sub.add_parser("process-file", help="Procesa un archivo y sale")
     sub_one.add_argument("file",           help="Archivo .hl7 a procesar")
     sub_one.add_argument("--output-dir",   help="Carpeta de salida (si no se especifica, misma carpeta que el archivo)")
     sub_one.add_argument("--backup-dir",   help="Carpeta de backups opcional")
-    sub_one.add_argument("--config",       required=False, help="Nombre de la configuración a usar")
+    sub_one.add_argument("--config",       required=False, help="Nombre de la configuración a usar (sin ella se aplican las rutas de __routes__)")
+    _add_forward_arguments(sub_one)
+    _add_dedup_arguments(sub_one)
+    _add_output_arguments(sub_one)
+    _add_backup_arguments(sub_one)
+    _add_profile_arguments(sub_one)
+
+    # Procesamiento masivo de un directorio
+    sub_dir = sub.add_parser("process-dir", help="Procesa en paralelo todos los archivos de un árbol de directorios")
+    sub_dir.add_argument("input_dir",      help="Carpeta de entrada (se recorre recursivamente)")
+    sub_dir.add_argument("--output-dir",   required=True, help="Carpeta de salida (se replica la estructura)")
+    sub_dir.add_argument("--config",       required=False, help="Nombre de la configuración a usar (sin ella se aplican las rutas de __routes__)")
+    sub_dir.add_argument("--include",      action="append", help="Patrón de nombres a incluir (repetible, por defecto *.hl7)")
+    sub_dir.add_argument("--exclude",      action="append", help="Patrón de nombres a excluir (repetible)")
+    sub_dir.add_argument("--workers",      type=int, default=None, help="Workers en paralelo (por defecto, núcleos disponibles)")
+    sub_dir.add_argument("--pool",         choices=POOL_MODES, default="process", help="Tipo de pool: hilos o procesos")
+    sub_dir.add_argument("--resume",       action="store_true", help="Omitir archivos cuya salida ya existe")
+    _add_output_arguments(sub_dir, batch=False)
+
+    # Extracción columnar de campos
+    sub_ext = sub.add_parser("extract", help="Extrae campos de todos los mensajes a CSV/Parquet")
+    sub_ext.add_argument("sources",        nargs="+", help="Archivos, lotes o carpetas de entrada")
+    sub_ext.add_argument("--fields",       action="append", required=True,
+                         help="Rutas a extraer separadas por comas (ej. MSH.10,PID.3.1,OBX.5); repetible")
+    sub_ext.add_argument("--output",       required=True, help="Archivo de salida")
+    sub_ext.add_argument("--format",       choices=("csv", "parquet"), default="csv", help="Formato de salida (parquet requiere pyarrow)")
+    sub_ext.add_argument("--workers",      type=int, default=None, help="Procesos en paralelo (por defecto, núcleos disponibles)")
+    sub_ext.add_argument("--multi",        choices=("first", "join"), default="first",
+                         help="Segmentos repetidos (OBX...): sólo el primero o todos unidos con --join-sep")
+    sub_ext.add_argument("--join-sep",     default="~", help="Separador para --multi join (por defecto ~)")
+    sub_ext.add_argument("--with-source",  action="store_true", help="Agregar una columna con el archivo de origen")
+    sub_ext.add_argument("--include",      action="append", help="Patrón de nombres a incluir en carpetas (por defecto *.hl7)")
+    sub_ext.add_argument("--exclude",      action="append", help="Patrón de nombres a excluir en carpetas")
+
+    # Servidor MLLP
+    sub_listen = sub.add_parser("listen", help="Recibe mensajes por MLLP (TCP), los transforma y responde ACK")
+    sub_listen.add_argument("--host",       default="127.0.0.1", help="Interfaz de escucha (por defecto 127.0.0.1)")
+    sub_listen.add_argument("--port",       type=int, default=2575, help="Puerto de escucha (por defecto 2575)")
+    sub_listen.add_argument("--output-dir", help="Carpeta de salida (obligatoria si no se usa --forward)")
+    sub_listen.add_argument("--config",     required=False, help="Nombre de la configuración a usar (sin ella se aplican las rutas de __routes__)")
+    sub_listen.add_argument("--executor",   choices=("none", "thread", "process"), default="none",
+                            help="Dónde ejecutar las transformaciones (por defecto en el event loop)")
+    sub_listen.add_argument("--workers",    type=int, default=None, help="Workers del executor")
+    sub_listen.add_argument("--encoding",   default="utf-8", help="Codificación de los mensajes (por defecto utf-8)")
+    _add_forward_arguments(sub_listen)
+    _add_dedup_arguments(sub_listen)
+    _add_output_arguments(sub_listen)
+
+    # Comparar dos versiones de una configuración sobre un corpus
+    sub_test = sub.add_parser("test-config", help="Compara dos versiones de una configuración sobre un corpus de mensajes")
+    sub_test.add_argument("sources",       nargs="+", help="Archivos, lotes o carpetas del corpus (sólo se leen)")
+    sub_test.add_argument("--config",      required=True, help="Configuración a probar (versión nueva)")
+    sub_test.add_argument("--old",         help="Configuración de referencia (por defecto la misma que --config)")
+    sub_test.add_argument("--old-file",    help="configurations.json (o exportación) del que leer la versión antigua")
+    sub_test.add_argument("--new-file",    help="configurations.json (o exportación) del que leer la versión nueva")
+    sub_test.add_argument("--workers",     type=int, default=None, help="Procesos en paralelo (por defecto, núcleos disponibles)")
+    sub_test.add_argument("--include",     action="append", help="Patrón de nombres a incluir en carpetas (por defecto *.hl7)")
+    sub_test.add_argument("--exclude",     action="append", help="Patrón de nombres a excluir en carpetas")
+    sub_test.add_argument("--diff-output", help="CSV con una fila por campo distinto")
+    sub_test.add_argument("--examples",    type=int, default=10, help="Diferencias a mostrar en consola (por defecto 10)")
 
     # Exportar configuraciones
     sub_exp = sub.add_parser("export-config", help="Exporta configs a JSON")
@@ -127,16 +523,70 @@ def main():
     sub_imp = sub.add_parser("import-config", help="Importa configs desde JSON")
     sub_imp.add_argument("path", help="Ruta del JSON a importar")
 
+    # Recuperar originales de los backups archivados
+    sub_bget = sub.add_parser("backup-get", help="Recupera originales archivados por nombre o control ID")
+    sub_bget.add_argument("--backup-dir", required=True, help="Carpeta de backups")
+    bget_key = sub_bget.add_mutually_exclusive_group(required=True)
+    bget_key.add_argument("--name",       help="Nombre del archivo original")
+    bget_key.add_argument("--control-id", help="MSH-10 de alguno de sus mensajes")
+    sub_bget.add_argument("--output-dir", default=".", help="Carpeta donde dejar los originales recuperados")
+
+    # Resumen de los perfiles de --profile
+    sub_prof = sub.add_parser("profile-summary", help="Suma los perfiles de --profile y muestra reglas y funciones más costosas")
+    sub_prof.add_argument("profile_dir", nargs="?", default="profiles", help="Carpeta de perfiles (por defecto profiles)")
+    sub_prof.add_argument("--config",    help="Sólo los mensajes de esta configuración")
+    sub_prof.add_argument("--top",       type=int, default=15, help="Filas de cada tabla (por defecto 15)")
+    sub_prof.add_argument("--sort",      choices=SORT_KEYS, default="tottime", help="Orden de las funciones (por defecto tottime)")
+
     # (Opcional) Si deseas más comandos CLI, agrégalos aquí.
 
     args = parser.parse_args()
+    setup_logging(args.log_dir, trace=args.trace, max_bytes=int(args.log_max_mb * 1024 * 1024))
     configs = load_configurations()
 
     if args.cmd == "monitor":
-        monitor_cli(args.input_dir, args.output_dir, args.backup_dir, args.config, configs)
+        if not (args.output_dir or args.forward):
+            parser.error("monitor requiere --output-dir o --forward")
+        monitor_cli(args.input_dir, args.output_dir, args.backup_dir, args.config, configs,
+                    workers=args.workers, queue_size=args.queue_size, pool_mode=args.pool,
+                    settle_time=args.settle_time, forward=args.forward, spool_dir=args.spool_dir,
+                    reload_interval=args.reload_interval, dedup=_dedup_settings(args), output=_output_settings(args),
+                    backup=_backup_settings(args), metrics_port=args.metrics_port, metrics_host=args.metrics_host,
+                    metrics_file=args.metrics_file, metrics_interval=args.metrics_interval,
+                    metrics_rule_sample=args.metrics_rule_sample, profile=_profile_settings(args),
+                    journal=_journal_settings(args))
 
     elif args.cmd == "process-file":
-        process_file_cli(args.file, args.output_dir, args.backup_dir, args.config, configs)
+        process_file_cli(args.file, args.output_dir, args.backup_dir, args.config, configs,
+                         forward=args.forward, spool_dir=args.spool_dir, dedup=_dedup_settings(args),
+                         output=_output_settings(args), backup=_backup_settings(args),
+                         profile=_profile_settings(args))
+
+    elif args.cmd == "process-dir":
+        process_dir_cli(args.input_dir, args.output_dir, args.config, configs, args.include, args.exclude,
+                        args.workers, args.pool, args.resume, output=_output_settings(args))
+
+    elif args.cmd == "extract":
+        extract_cli(args.sources, args.fields, args.output, args.format, args.workers, args.multi,
+                    args.join_sep, args.with_source, args.include, args.exclude)
+
+    elif args.cmd == "listen":
+        if not (args.output_dir or args.forward):
+            parser.error("listen requiere --output-dir o --forward")
+        listen_cli(args.host, args.port, args.output_dir, args.config, configs,
+                   executor_mode=args.executor, workers=args.workers, encoding=args.encoding,
+                   forward=args.forward, spool_dir=args.spool_dir, dedup=_dedup_settings(args),
+                   output=_output_settings(args))
+
+    elif args.cmd == "profile-summary":
+        profile_summary_cli(args.profile_dir, args.config, args.top, args.sort)
+
+    elif args.cmd == "test-config":
+        test_config_cli(args.sources, configs, args.config, args.old, args.old_file, args.new_file, args.workers,
+                        args.include, args.exclude, args.diff_output, args.examples)
+
+    elif args.cmd == "backup-get":
+        backup_get_cli(args.backup_dir, args.name, args.control_id, args.output_dir)
 
     elif args.cmd == "export-config":
         export_configurations(args.path, configs)
@@ -149,11 +599,14 @@ def main():
         print(f"Configuraciones importadas desde {args.path}")
 
     else:
-        # GUI por defecto
+        # GUI por defecto: sólo aquí se carga Qt
+        from PyQt5 import QtWidgets
+        from gui.main_window import MainWindow
         app = QtWidgets.QApplication(sys.argv)
         window = MainWindow()
         window.show()
         sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()